@@ -0,0 +1,26 @@
+# core/backends/sqlite3/base.py
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Backend SQLite de Django con ajustes para varios procesos escribiendo a la
+    vez (Daphne + workers de Celery):
+
+    - ``SQLITE_PRAGMAS`` en cada conexión nueva (WAL, ``busy_timeout``, ...).
+    - ``transaction.atomic`` abre ``BEGIN IMMEDIATE`` (``SQLITE_TRANSACTION_MODE``):
+      el cerrojo de escritura se pide al empezar y espera ``busy_timeout``. Con
+      ``BEGIN`` diferido, una transacción que lee y luego escribe (el patrón de
+      ``select_for_update``, que SQLite ignora) falla al instante con
+      "database is locked" si otro proceso escribió entretanto.
+    """
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {settings.SQLITE_TRANSACTION_MODE}")
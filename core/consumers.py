@@ -3,12 +3,15 @@
 import json
 import asyncio
 import logging
-import os
+import time
 from pathlib import Path
+from django.conf import settings
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 
-from .controllers.browser_controller import BrowserController
+from .controllers.browser_controller import BrowserController, WebDriverCommandError
+from .controllers.controller_registry import get_controller_registry
+from .utils.session_events import get_session_status_payload
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +22,12 @@ class SessionConsumer(AsyncWebsocketConsumer):
         self.session_group_name = f'session_{self.session_id}'
         self.session_obj = None
         self.browser_controller = None
+        # Streaming en vivo: buffer agrupado que se vacía cada LIVE_STREAM_FLUSH_MS
+        self._live_buffer = []
+        self._live_counts = {}
+        self._live_skipped = 0
+        self._live_summary_mode = False
+        self._live_flush_task = None
 
         logger.info(f"WS: Intentando conectar sesión: {self.session_id}")
         self.session_obj = await self.get_session_db(self.session_id)
@@ -27,6 +36,10 @@ class SessionConsumer(AsyncWebsocketConsumer):
             await self.channel_layer.group_add(self.session_group_name, self.channel_name)
             await self.accept()
             logger.info(f"WS: Conexión aceptada para sesión: {self.session_id}.")
+            # Estado actual al conectar; los cambios posteriores llegan por el grupo
+            status_payload = await database_sync_to_async(get_session_status_payload)(self.session_id)
+            if status_payload:
+                await self.send_message("session_status", status_payload)
         else:
             logger.error(f"WS: Sesión {self.session_id} no encontrada. Rechazando conexión.")
             await self.close()
@@ -34,9 +47,11 @@ class SessionConsumer(AsyncWebsocketConsumer):
     async def disconnect(self, close_code):
         logger.info(f"WS: Desconectando sesión {self.session_id}, código: {close_code}")
         if self.browser_controller:
-            await self.browser_controller.stop()
+            await self.release_browser_controller()
             self.browser_controller = None
-            logger.info(f"WS: Controlador de navegador detenido para sesión {self.session_id}")
+        if self._live_flush_task:
+            self._live_flush_task.cancel()
+            self._live_flush_task = None
         await self.channel_layer.group_discard(self.session_group_name, self.channel_name)
 
     async def receive(self, text_data):
@@ -57,8 +72,8 @@ class SessionConsumer(AsyncWebsocketConsumer):
             await self.send_error(f"Error interno: {e}")
 
     async def handle_init_browser(self, data):
-        if not os.environ.get('SELENOID_URL'):
-            logger.critical("Configuración Incompleta: SELENOID_URL no definida.")
+        if not settings.WEBDRIVER_HUB_URLS:
+            logger.critical("Configuración Incompleta: WEBDRIVER_HUB_URLS/SELENOID_URL no definida.")
             await self.send_error("Error de configuración del servidor (Moon Base URL).")
             return
         if not self.session_obj:
@@ -68,6 +83,8 @@ class SessionConsumer(AsyncWebsocketConsumer):
         if self.browser_controller and self.browser_controller._state != "stopped":
             logger.warning(f"WS: El navegador ya está activo o iniciándose (estado: {self.browser_controller._state}).")
             return
+        if await self.reattach_browser_controller():
+            return
         logger.info(f"WS: Inicializando BrowserController para sesión {self.session_id}...")
         self.browser_controller = BrowserController(session_id=self.session_id,session_url=self.session_obj.url,notify_callback=self.notify_client)
         url_to_navigate = getattr(self.session_obj, 'url', None)
@@ -79,10 +96,53 @@ class SessionConsumer(AsyncWebsocketConsumer):
             await self.send_error("Error interno: falta URL de sesión.")
             self.browser_controller = None
 
+    async def reattach_browser_controller(self) -> bool:
+        """Re-adjunta un navegador registrado por esta u otra conexión (cualquier proceso)."""
+        registry = get_controller_registry()
+        try:
+            controller = await registry.claim(self.session_id, notify_callback=self.notify_client)
+        except Exception as e:
+            logger.warning(f"WS: Registro de controladores no disponible para sesión {self.session_id}: {e}")
+            return False
+        if controller is None:
+            return False
+        try:
+            current_url = await controller.get_current_url(timeout=10)
+        except WebDriverCommandError as e:
+            logger.info(f"WS: Navegador registrado de la sesión {self.session_id} ya no responde ({e}). Se crea otro.")
+            controller.detach()
+            await registry.remove(self.session_id)
+            return False
+        self.browser_controller = controller
+        await registry.save(controller) # Refrescar TTL de la entrada
+        logger.info(f"WS: Re-adjuntado navegador existente de la sesión {self.session_id} en {current_url}.")
+        await self.send_message("browser_ready", {
+            "session_id": self.session_id,
+            "vnc_info": controller.snapshot().get("vnc_info"),
+            "cdp_url": controller.snapshot().get("cdp_url"),
+            "reattached": True,
+        })
+        return True
+
+    async def release_browser_controller(self):
+        """
+        Al desconectar, un navegador en marcha sobrevive el periodo de gracia por
+        si el cliente reconecta (refresco, corte de red). Si no, se detiene ya.
+        """
+        controller = self.browser_controller
+        if controller.state == "running":
+            try:
+                await get_controller_registry().release_after_grace(controller)
+                return
+            except Exception as e:
+                logger.warning(f"WS: Registro no disponible al desconectar sesión {self.session_id}: {e}. Deteniendo navegador.")
+        await controller.stop()
+        logger.info(f"WS: Controlador de navegador detenido para sesión {self.session_id}")
+
     async def notify_client(self, action, data):
         logger.debug(f"WS: Recibido del Controller: action={action}, data={str(data)[:200]}...")
         if action == "datalayer_push":
-            await self.send_message("new_datalayer", {"payload": data})
+            self._enqueue_live_events([{"data": data, "timestamp": None, "match": {"status": "pending"}}])
         elif action == "browser_ready":
             logger.info(
                 f"Notificando browser_ready con VNC URL: {data.get('vnc_info')}"
@@ -93,11 +153,74 @@ class SessionConsumer(AsyncWebsocketConsumer):
                 "cdp_url": data.get("cdp_url"),
             }
             await self.send_message("browser_ready", payload)
+            # Guardar el hub elegido en la sesión y registrar el navegador para
+            # poder re-adjuntarlo tras una reconexión
+            await self._save_webdriver_url(self.browser_controller.webdriver_base_url)
+            try:
+                await get_controller_registry().save(self.browser_controller)
+            except Exception as e:
+                logger.warning(f"WS: No se pudo registrar el controlador de la sesión {self.session_id}: {e}")
         elif action in ["browser_state", "navigation_complete", "navigation_error", "error"]:
             await self.send_message(action, data)
         else:
             logger.warning(f"WS: Acción desconocida o no manejada recibida del controller: {action}")
 
+    # --- Transiciones de estado publicadas por las tareas y las vistas ---
+    async def session_status(self, event):
+        await self.send_message("session_status", event.get("payload") or {})
+
+    # --- Streaming en vivo de DataLayers (eventos del grupo enviados por las tareas) ---
+    async def datalayer_batch(self, event):
+        self._enqueue_live_events(event.get("events") or [])
+
+    def _enqueue_live_events(self, events):
+        for live_event in events:
+            status = (live_event.get("match") or {}).get("status", "pending")
+            self._live_counts[status] = self._live_counts.get(status, 0) + 1
+        if self._live_summary_mode:
+            self._live_skipped += len(events)
+        else:
+            self._live_buffer.extend(events)
+            overflow = len(self._live_buffer) - settings.LIVE_STREAM_MAX_BUFFER
+            if overflow > 0:
+                # El cliente no da abasto: descartar lo más antiguo y pasar a resúmenes
+                del self._live_buffer[:overflow]
+                self._live_skipped += overflow
+                self._live_summary_mode = True
+        if self._live_flush_task is None:
+            self._live_flush_task = asyncio.create_task(self._live_flush_loop())
+
+    async def _live_flush_loop(self):
+        interval = settings.LIVE_STREAM_FLUSH_MS / 1000
+        try:
+            while self._live_buffer or self._live_skipped:
+                await asyncio.sleep(interval)
+                await self._flush_live_buffer()
+        finally:
+            self._live_flush_task = None
+
+    async def _flush_live_buffer(self):
+        started = time.monotonic()
+        if self._live_summary_mode:
+            self._live_skipped += len(self._live_buffer)
+            self._live_buffer = []
+            await self.send_message(
+                "datalayer_summary", {"counts": dict(self._live_counts), "skipped": self._live_skipped}
+            )
+            self._live_skipped = 0
+        elif self._live_buffer:
+            limit = settings.LIVE_STREAM_MAX_EVENTS_PER_FRAME
+            frame, self._live_buffer = self._live_buffer[:limit], self._live_buffer[limit:]
+            await self.send_message("datalayer_batch", {"events": frame, "counts": dict(self._live_counts)})
+        elapsed_ms = (time.monotonic() - started) * 1000
+        # Envíos lentos => resúmenes; un resumen rápido sin cola pendiente => volver al detalle
+        if elapsed_ms > settings.LIVE_STREAM_SLOW_SEND_MS:
+            if not self._live_summary_mode:
+                logger.info(f"WS: Cliente lento en sesión {self.session_id} ({elapsed_ms:.0f} ms). Enviando solo resúmenes.")
+            self._live_summary_mode = True
+        elif self._live_summary_mode and not self._live_skipped:
+            self._live_summary_mode = False
+
     async def send_message(self, action, data=None):
         if data is None: data = {}
         payload = {'action': action, **data}
@@ -117,7 +240,7 @@ class SessionConsumer(AsyncWebsocketConsumer):
     def _get_session_db_sync(self, session_id):
         from .models import Session
         try:
-            return Session.objects.get(id=session_id)
+            return Session.objects.metadata().get(id=session_id)
         except Session.DoesNotExist:
             logger.warning(f"DB: Sesión {session_id} no encontrada en _get_session_db_sync.")
             return None
@@ -125,5 +248,10 @@ class SessionConsumer(AsyncWebsocketConsumer):
             logger.exception(f"DB: Error al obtener sesión {session_id}: {e}")
             return None
 
+    @database_sync_to_async
+    def _save_webdriver_url(self, webdriver_url):
+        from .models import Session
+        Session.objects.filter(pk=self.session_id).update(webdriver_url=webdriver_url)
+
     async def get_session_db(self, session_id):
         return await self._get_session_db_sync(session_id)
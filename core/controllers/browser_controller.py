@@ -1,13 +1,28 @@
 # WebAppDL/core/controllers/browser_controller.py
-import os
 import json
 import httpx
 import asyncio
 import logging
-from typing import Optional, Tuple
+from typing import Any, List, Optional, Set, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .http_client import webdriver_request
+from ..utils.capture_scripts import JS_CAPTURE_DATALAYER
+from ..utils.webdriver_hubs import select_hub
 
 logger = logging.getLogger(__name__)
 
+
+class WebDriverCommandError(RuntimeError):
+    """A W3C WebDriver command failed (error payload, HTTP error or timeout)."""
+
+    def __init__(self, message: str, error: Optional[str] = None, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.error = error # Código de error W3C, p.ej. "no such window"
+        self.status_code = status_code
+
 class BrowserController:
     """
     Manages the lifecycle of a remote browser session using a standard
@@ -23,18 +38,59 @@ class BrowserController:
         self._vnc_info: Optional[str] = None # Info VNC (puerto/pass), no URL directa
         self.notify_client = notify_callback
         self._webdriver_base_url: Optional[str] = None # Guardar la URL base del WebDriver
+        self._pending_commands: Set[asyncio.Task] = set() # Comandos en vuelo (cancelables)
+        self.registry_token: Optional[str] = None # Propiedad en el registro entre procesos (lo asigna ControllerRegistry)
 
     @property
     def state(self):
         return self._state
 
+    # --- Registro entre procesos (reconexión de sockets) ---
+    def snapshot(self) -> dict:
+        """Serializable state needed to reattach to the remote session from another process."""
+        return {
+            "session_id": str(self.session_id),
+            "session_url": self.session_url,
+            "state": self._state,
+            "selenium_session_id": self._selenium_session_id,
+            "webdriver_base_url": self._webdriver_base_url,
+            "cdp_url": self._cdp_url,
+            "vnc_info": self._vnc_info,
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict, notify_callback=None) -> "BrowserController":
+        """Rebuilds a running controller bound to an existing remote session (no new browser)."""
+        controller = cls(
+            session_id=snapshot["session_id"], session_url=snapshot.get("session_url"), notify_callback=notify_callback
+        )
+        controller._selenium_session_id = snapshot.get("selenium_session_id")
+        controller._webdriver_base_url = snapshot.get("webdriver_base_url")
+        controller._cdp_url = snapshot.get("cdp_url")
+        controller._vnc_info = snapshot.get("vnc_info")
+        controller._state = "running" if controller._selenium_session_id else "stopped"
+        return controller
+
+    def detach(self) -> None:
+        """Forgets the remote session without deleting it (another controller owns it now)."""
+        self.cancel_pending()
+        self._selenium_session_id = None
+        self._cdp_url = None
+        self._vnc_info = None
+        self._state = "stopped"
+
+    @property
+    def webdriver_base_url(self) -> Optional[str]:
+        """Hub chosen for this controller's session (None until a session is created)."""
+        return self._webdriver_base_url
+
     def _get_webdriver_base_url(self) -> str:
-        """Gets and validates the WebDriver base URL from environment variables."""
+        """Gets the hub of the current session, falling back to the first configured hub."""
         if self._webdriver_base_url is None:
-            # Lee la variable de entorno (que ahora apunta a selenium-chrome)
-            url = os.environ.get("SELENOID_URL", "http://selenium-chrome:4444/wd/hub")
+            # Mismo valor por defecto que get_browser_pool: el primer hub de WEBDRIVER_HUB_URLS
+            url = settings.WEBDRIVER_HUB_URLS[0] if settings.WEBDRIVER_HUB_URLS else None
             if not url:
-                logger.critical("SELENOID_URL (WebDriver URL) no está definida en el entorno.")
+                logger.critical("WEBDRIVER_HUB_URLS (URL del WebDriver) no está configurada.")
                 raise ValueError("La URL base del WebDriver no está configurada.")
             self._webdriver_base_url = url.rstrip('/')
             logger.info(f"URL base de WebDriver configurada: {self._webdriver_base_url}")
@@ -47,6 +103,9 @@ class BrowserController:
         Returns:
             Tuple containing (cdp_url, vnc_info, selenium_session_id) or raises error.
         """
+        if self._webdriver_base_url is None:
+            # Hub sano menos cargado (health check cacheado, en un hilo: usa la caché síncrona)
+            self._webdriver_base_url = (await sync_to_async(select_hub)()).rstrip('/')
         base_url = self._get_webdriver_base_url()
         session_creation_url = f"{base_url}/session"
 
@@ -65,10 +124,10 @@ class BrowserController:
 
         response = None
         try:
-           async with httpx.AsyncClient(timeout=90.0, follow_redirects=True) as client:
-               logger.info(f"Creando sesión en WebDriver: {session_creation_url}")
-               logger.debug(f"Payload de capacidades: {json.dumps(payload)}")
-               response = await client.post(session_creation_url, json=payload)
+           logger.info(f"Creando sesión en WebDriver: {session_creation_url}")
+           logger.debug(f"Payload de capacidades: {json.dumps(payload)}")
+           # Crear Chrome puede tardar: timeout propio más largo que el del cliente compartido
+           response = await webdriver_request("POST", session_creation_url, json=payload, timeout=90.0)
 
            response.raise_for_status()
 
@@ -129,6 +188,76 @@ class BrowserController:
             logger.error(f"Error inesperado al crear sesión WebDriver. Respuesta cruda: {raw_response_text[:500]}...", exc_info=True)
             raise RuntimeError(f"No se pudo crear la sesión remota (Error: {type(e).__name__})") from e
 
+    # --- Cliente W3C WebDriver asíncrono ---
+    async def _command(self, method: str, path: str, payload: Optional[dict] = None,
+                       timeout: Optional[float] = None) -> Any:
+        """
+        Sends a W3C command for the current session and returns its ``value``.
+        Each command runs as a task tracked per controller so ``cancel_pending``
+        (and ``stop``) can abort it, and is bounded by ``timeout``.
+        """
+        if not self._selenium_session_id:
+            raise WebDriverCommandError("No hay sesión WebDriver activa.")
+        url = f"{self._get_webdriver_base_url()}/session/{self._selenium_session_id}{path}"
+        timeout = timeout or settings.WEBDRIVER_COMMAND_TIMEOUT
+
+        request_kwargs = {"timeout": timeout}
+        if payload is not None:
+            request_kwargs["json"] = payload
+        task = asyncio.ensure_future(webdriver_request(method, url, **request_kwargs))
+        self._pending_commands.add(task)
+        try:
+            response = await asyncio.wait_for(task, timeout=timeout)
+        except asyncio.TimeoutError as e:
+            raise WebDriverCommandError(f"Timeout ({timeout}s) en {method} {path}", error="timeout") from e
+        except httpx.RequestError as e:
+            raise WebDriverCommandError(f"Error de red en {method} {path}: {e}") from e
+        finally:
+            self._pending_commands.discard(task)
+
+        try:
+            data = response.json()
+        except json.JSONDecodeError as e:
+            raise WebDriverCommandError(
+                f"Respuesta no JSON en {method} {path} (HTTP {response.status_code})", status_code=response.status_code
+            ) from e
+        value = data.get("value") if isinstance(data, dict) else None
+        if response.is_error or (isinstance(value, dict) and "error" in value):
+            error = value.get("error") if isinstance(value, dict) else None
+            message = value.get("message", "") if isinstance(value, dict) else response.text[:200]
+            raise WebDriverCommandError(
+                f"{method} {path} falló ({error or response.status_code}): {message[:300]}",
+                error=error, status_code=response.status_code,
+            )
+        return value
+
+    async def navigate(self, url: str, timeout: Optional[float] = None) -> None:
+        """Navigates the remote browser (W3C ``POST /url``), waiting for page load."""
+        await self._command("POST", "/url", {"url": url}, timeout=timeout or settings.WEBDRIVER_PAGE_LOAD_TIMEOUT)
+
+    async def execute_script(self, script: str, args: Optional[List[Any]] = None,
+                             timeout: Optional[float] = None) -> Any:
+        """Runs synchronous JavaScript in the page (W3C ``POST /execute/sync``)."""
+        return await self._command("POST", "/execute/sync", {"script": script, "args": args or []}, timeout=timeout)
+
+    async def get_current_url(self, timeout: Optional[float] = None) -> str:
+        """Returns the page URL (W3C ``GET /url``). Also a cheap liveness check."""
+        return await self._command("GET", "/url", timeout=timeout)
+
+    async def delete_session(self) -> None:
+        """Deletes the remote session (W3C ``DELETE /session/{id}``); alias of ``stop``."""
+        await self.stop()
+
+    def cancel_pending(self) -> int:
+        """Cancels every in-flight command of this controller. Returns how many."""
+        pending = [task for task in self._pending_commands if not task.done()]
+        for task in pending:
+            task.cancel()
+        self._pending_commands.clear()
+        if pending:
+            logger.info(f"Cancelados {len(pending)} comandos WebDriver en vuelo para sesión {self.session_id}.")
+        return len(pending)
+
     async def start_and_navigate(self, url_to_navigate: str):
         """Starts the browser session and potentially navigates."""
         if self._state != "stopped":
@@ -152,11 +281,19 @@ class BrowserController:
                     "target_url": url_to_navigate
                 })
 
-            # --- LÓGICA DE NAVEGACIÓN Y CAPTURA IRÍA AQUÍ ---
-            # Esta lógica DEBERÍA funcionar ahora usando librerías Selenium estándar
-            # conectándose a la URL base del WebDriver y usando el session_id obtenido.
-            # logger.info(f"Iniciando navegación a {url_to_navigate}...")
-            # await self.perform_navigation_and_capture(url_to_navigate) # Función hipotética
+            # --- Navegación e inyección del script de captura (cliente W3C asíncrono) ---
+            logger.info(f"Iniciando navegación a {url_to_navigate}...")
+            try:
+                await self.navigate(url_to_navigate)
+                await self.execute_script(JS_CAPTURE_DATALAYER)
+                current_url = await self.get_current_url()
+                logger.info(f"Navegación completada y script de captura inyectado en {current_url}.")
+                if self.notify_client:
+                    await self.notify_client("navigation_complete", {"url": current_url})
+            except WebDriverCommandError as nav_err:
+                logger.error(f"Error navegando a {url_to_navigate} en sesión {self.session_id}: {nav_err}")
+                if self.notify_client:
+                    await self.notify_client("navigation_error", {"message": str(nav_err), "url": url_to_navigate})
 
         except Exception as e:
             self._state = "error"
@@ -174,6 +311,7 @@ class BrowserController:
 
         logger.info(f"Deteniendo sesión remota Selenium (ID: {self._selenium_session_id})...")
         self._state = "stopping"
+        self.cancel_pending() # No esperar a comandos lentos de una sesión que se va a borrar
 
         if not self._selenium_session_id:
             logger.warning("No hay ID de sesión de Selenium para detener.")
@@ -185,8 +323,7 @@ class BrowserController:
         logger.info(f"Enviando DELETE a WebDriver: {session_delete_url}")
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.delete(session_delete_url)
+            response = await webdriver_request("DELETE", session_delete_url)
             response.raise_for_status()
             logger.info(f"Sesión Selenium {self._selenium_session_id} eliminada correctamente.")
         except httpx.RequestError as e:
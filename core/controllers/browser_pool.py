@@ -0,0 +1,407 @@
+# WebAppDL/core/controllers/browser_pool.py
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options as ChromeOptions
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.remote.command import Command
+
+from ..utils.redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# ZSET compartido (session_id -> último latido) con las sesiones que tienen los pools
+# (ociosas o recién entregadas); el reaper no las trata como huérfanas mientras el
+# latido sea reciente. Al pasar a una sesión de la app (``detach``) se quitan.
+POOL_SESSIONS_KEY = "browser-pool:sessions"
+# Subconjunto de POOL_SESSIONS_KEY con las ociosas: las que ``acquire`` puede entregar ya
+POOL_IDLE_KEY = "browser-pool:idle"
+# Usos y creación de una sesión entregada a la app (``detach``): la devuelve ``release``
+# desde otro proceso y así siguen aplicando ``max_uses`` y la edad máxima.
+POOL_SESSION_META_KEY = "browser-pool:session:{}"
+POOL_SESSION_META_TTL_SECONDS = 24 * 3600
+
+# Comando de Chromium para ejecutar CDP a través del grid (POST .../goog/cdp/execute)
+CDP_EXECUTE_COMMAND = "executeCdpCommand"
+
+
+def build_chrome_options() -> ChromeOptions:
+    """Opciones de Chrome compartidas por todas las sesiones remotas de la app."""
+    options = ChromeOptions()
+    options.add_argument("--window-size=1280,1024")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    # options.add_argument("--disable-gpu") # Descomentar si hay problemas VNC
+    # Establecer timeouts es buena práctica
+    options.timeouts = {"implicit": 0, "pageLoad": 300000, "script": 30000} # en milisegundos
+    # Log de rendimiento con eventos CDP Network: captura de hits de Google Analytics
+    options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    options.add_experimental_option("perfLoggingPrefs", {"enableNetwork": True, "enablePage": False})
+    return options
+
+
+def read_performance_log(driver: webdriver.Remote) -> list:
+    """
+    Lee (y vacía) el log 'performance' de Chrome. Devuelve lista vacía si el
+    grid no expone el endpoint de logs.
+    """
+    try:
+        return driver.execute(Command.GET_LOG, {"type": "performance"}).get("value") or []
+    except WebDriverException as e:
+        logger.debug(f"Log de rendimiento no disponible para sesión {driver.session_id}: {e}")
+        return []
+
+
+def execute_cdp(driver: webdriver.Remote, cmd: str, params: Optional[dict] = None):
+    """Ejecuta un comando Chrome DevTools Protocol en una sesión remota."""
+    driver.command_executor.add_command(CDP_EXECUTE_COMMAND, "POST", "/session/$sessionId/goog/cdp/execute")
+    return driver.execute(CDP_EXECUTE_COMMAND, {"cmd": cmd, "params": params or {}}).get("value")
+
+
+class AttachedRemote(webdriver.Remote):
+    """
+    ``webdriver.Remote`` bound to an already running session instead of
+    creating a new one, so short tasks can share a browser across processes.
+    """
+
+    def __init__(self, command_executor: str, session_id: str):
+        self._attach_session_id = session_id
+        super().__init__(command_executor=command_executor, options=build_chrome_options(), keep_alive=True)
+
+    def start_session(self, capabilities: dict) -> None:
+        self.session_id = self._attach_session_id
+        self.caps = {}
+
+
+def attach_driver(command_executor: str, session_id: str) -> webdriver.Remote:
+    """Re-adjunta un driver a una sesión WebDriver existente (sin crear otra)."""
+    if not session_id:
+        raise ValueError("No hay ID de sesión Selenium al que adjuntarse.")
+    return AttachedRemote(command_executor=command_executor, session_id=session_id)
+
+
+def detach_driver(driver: webdriver.Remote) -> None:
+    """Suelta el objeto driver local dejando viva la sesión remota."""
+    try:
+        driver.command_executor.close()
+    except Exception as e:
+        logger.debug(f"Error cerrando conexiones locales del driver {driver.session_id}: {e}")
+
+
+class _PoolEntry:
+    """Metadatos de un driver gestionado por el pool."""
+
+    __slots__ = ("driver", "uses", "created_at", "last_checked_at")
+
+    def __init__(self, driver: webdriver.Remote, uses: int = 0, created_at: Optional[float] = None):
+        self.driver = driver
+        self.uses = uses
+        self.created_at = created_at or time.time() # Reloj de pared: se comparte entre procesos
+        self.last_checked_at = self.created_at
+
+
+class BrowserPool:
+    """
+    Keeps a small number of warm WebDriver sessions against a single hub so
+    tasks can skip Chrome startup. Sessions are reset when they are returned,
+    health-checked while idle and recycled after ``max_uses`` hand-outs.
+    """
+
+    def __init__(self, command_executor: str, size: int = 1, max_uses: int = 20,
+                 max_idle_seconds: int = 600):
+        if not command_executor:
+            raise ValueError("La URL del WebDriver (command_executor) no está configurada.")
+        self.command_executor = command_executor
+        self.size = max(size, 0)
+        self.max_uses = max(max_uses, 1)
+        self.max_idle_seconds = max_idle_seconds
+        self._idle: List[_PoolEntry] = []
+        self._in_use: Dict[str, _PoolEntry] = {} # selenium session_id -> entry
+        self._creating = 0
+        self._lock = threading.Lock()
+        self._maintenance_thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    # --- Creación / destrucción ---
+    def _create_driver(self) -> webdriver.Remote:
+        logger.info(f"Pool: Creando sesión WebDriver en {self.command_executor}...")
+        driver = webdriver.Remote(
+            command_executor=self.command_executor, options=build_chrome_options(), keep_alive=True
+        )
+        logger.info(f"Pool: Sesión {driver.session_id} creada.")
+        return driver
+
+    def _quit_driver(self, driver: webdriver.Remote) -> None:
+        self._unregister_session(getattr(driver, "session_id", None))
+        try:
+            driver.quit()
+        except Exception as quit_exc:
+            logger.warning(f"Pool: Error cerrando sesión {getattr(driver, 'session_id', None)}: {quit_exc}")
+
+    # --- API pública ---
+    def warm(self) -> None:
+        """Crea sesiones hasta tener ``size`` sesiones ociosas."""
+        while True:
+            with self._lock:
+                if len(self._idle) + self._creating >= self.size:
+                    return
+                self._creating += 1
+            try:
+                entry = _PoolEntry(self._create_driver())
+            except Exception as e:
+                logger.error(f"Pool: No se pudo precalentar una sesión: {e}")
+                with self._lock:
+                    self._creating -= 1
+                return
+            with self._lock:
+                self._creating -= 1
+                self._idle.append(entry)
+            self._register_sessions([entry], idle=True)
+
+    def warm_async(self) -> None:
+        """Lanza el precalentado en segundo plano (fuera del camino crítico)."""
+        threading.Thread(target=self.warm, name="browser-pool-warm", daemon=True).start()
+
+    def acquire(self) -> webdriver.Remote:
+        """
+        Entrega una sesión ya reseteada. Si no hay sesiones ociosas sanas se crea
+        una nueva en línea. Tras entregar, el pool se rellena en segundo plano.
+        """
+        driver = None
+        while driver is None:
+            with self._lock:
+                entry = self._idle.pop() if self._idle else None
+            if entry is None:
+                entry = _PoolEntry(self._create_driver())
+            elif not self._is_healthy(entry.driver):
+                logger.warning(f"Pool: Sesión ociosa {entry.driver.session_id} no responde. Descartando.")
+                self._quit_driver(entry.driver)
+                continue
+            entry.uses += 1
+            driver = entry.driver
+            with self._lock:
+                self._in_use[driver.session_id] = entry
+        self._register_sessions([entry])
+        logger.info(f"Pool: Entregada sesión {driver.session_id} (usos: {entry.uses}/{self.max_uses}).")
+        if self.size:
+            self.warm_async()
+        return driver
+
+    def release(self, driver: webdriver.Remote) -> None:
+        """
+        Devuelve una sesión al pool. Se resetea (ventanas, cookies y
+        almacenamiento de todos los orígenes, about:blank) y se cierra si el
+        reseteo falla, alcanzó ``max_uses`` o el pool está lleno.
+        """
+        with self._lock:
+            entry = self._in_use.pop(driver.session_id, None)
+        if entry is None:
+            # Sesión entregada con ``detach`` (p.ej. re-adjuntada en otro proceso): se adopta con sus metadatos.
+            entry = self._load_detached_entry(driver)
+        if entry.uses >= self.max_uses or self._too_old(entry, time.time()):
+            logger.info(f"Pool: Sesión {driver.session_id} alcanzó {entry.uses} usos o la edad máxima. Reciclando.")
+            self._quit_driver(driver)
+            self.warm_async()
+            return
+        if not self._reset(driver):
+            self._quit_driver(driver)
+            self.warm_async()
+            return
+        with self._lock:
+            returned = len(self._idle) < self.size
+            if returned:
+                entry.last_checked_at = time.time()
+                self._idle.append(entry)
+        if returned:
+            self._register_sessions([entry], idle=True)
+            logger.info(f"Pool: Sesión {driver.session_id} devuelta al pool.")
+            return
+        self._quit_driver(driver)
+
+    def detach(self, driver: webdriver.Remote) -> None:
+        """
+        Deja de seguir una sesión entregada sin cerrarla: su ciclo de vida pasa
+        a la sesión de la app (se devolverá con ``release`` desde otro proceso).
+        """
+        with self._lock:
+            entry = self._in_use.pop(driver.session_id, None)
+        if entry is not None:
+            self._store_detached_entry(entry)
+        self._unregister_session(driver.session_id)
+        detach_driver(driver)
+
+    def discard(self, driver: webdriver.Remote) -> None:
+        """Cierra una sesión entregada que quedó en estado dudoso (errores)."""
+        with self._lock:
+            self._in_use.pop(getattr(driver, "session_id", None), None)
+        self._quit_driver(driver)
+        if self.size:
+            self.warm_async()
+
+    def health_check(self) -> None:
+        """Verifica las sesiones ociosas y descarta las caídas o demasiado viejas."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        healthy = []
+        now = time.time()
+        for entry in idle:
+            if self._too_old(entry, now) or not self._is_healthy(entry.driver):
+                logger.info(f"Pool: Reciclando sesión ociosa {entry.driver.session_id}.")
+                self._quit_driver(entry.driver)
+                continue
+            entry.last_checked_at = now
+            healthy.append(entry)
+        with self._lock:
+            self._idle.extend(healthy)
+        self._register_sessions(healthy, idle=True)
+        self.warm()
+
+    def start_maintenance(self, interval_seconds: int) -> None:
+        """Arranca un hilo que ejecuta ``health_check`` periódicamente."""
+        if self._maintenance_thread or interval_seconds <= 0:
+            return
+
+        def _loop():
+            while not self._stop_event.wait(interval_seconds):
+                try:
+                    self.health_check()
+                except Exception as e:
+                    logger.error(f"Pool: Error en health check: {e}", exc_info=True)
+
+        self._maintenance_thread = threading.Thread(target=_loop, name="browser-pool-maintenance", daemon=True)
+        self._maintenance_thread.start()
+
+    def shutdown(self) -> None:
+        """Cierra todas las sesiones ociosas (las entregadas las cierra su dueño)."""
+        self._stop_event.set()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for entry in idle:
+            self._quit_driver(entry.driver)
+        logger.info(f"Pool: {len(idle)} sesiones ociosas cerradas.")
+
+    # --- Auxiliares ---
+    def _register_sessions(self, entries: List[_PoolEntry], idle: bool = False) -> None:
+        if not entries:
+            return
+        heartbeats = {e.driver.session_id: time.time() for e in entries}
+        try:
+            pipe = get_redis_client().pipeline()
+            pipe.zadd(POOL_SESSIONS_KEY, heartbeats)
+            if idle:
+                pipe.zadd(POOL_IDLE_KEY, heartbeats)
+            else:
+                pipe.zrem(POOL_IDLE_KEY, *heartbeats)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"Pool: No se pudo registrar sesiones del pool en Redis: {e}")
+
+    def _unregister_session(self, session_id: Optional[str]) -> None:
+        if not session_id:
+            return
+        try:
+            pipe = get_redis_client().pipeline()
+            pipe.zrem(POOL_SESSIONS_KEY, session_id)
+            pipe.zrem(POOL_IDLE_KEY, session_id)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"Pool: No se pudo quitar la sesión {session_id} del registro del pool: {e}")
+
+    def _too_old(self, entry: _PoolEntry, now: float) -> bool:
+        return bool(self.max_idle_seconds) and (now - entry.created_at) > self.max_idle_seconds
+
+    def _store_detached_entry(self, entry: _PoolEntry) -> None:
+        try:
+            get_redis_client().set(
+                POOL_SESSION_META_KEY.format(entry.driver.session_id),
+                json.dumps({"uses": entry.uses, "created_at": entry.created_at}),
+                ex=POOL_SESSION_META_TTL_SECONDS,
+            )
+        except Exception as e:
+            logger.debug(f"Pool: No se pudieron guardar los metadatos de la sesión {entry.driver.session_id}: {e}")
+
+    def _load_detached_entry(self, driver: webdriver.Remote) -> _PoolEntry:
+        """Entrada de una sesión entregada con ``detach``; sin metadatos cuenta como un uso."""
+        key = POOL_SESSION_META_KEY.format(driver.session_id)
+        try:
+            pipe = get_redis_client().pipeline()
+            pipe.get(key)
+            pipe.delete(key)
+            raw, _ = pipe.execute()
+            meta = json.loads(raw) if raw else {}
+        except Exception as e:
+            logger.debug(f"Pool: No se pudieron leer los metadatos de la sesión {driver.session_id}: {e}")
+            meta = {}
+        return _PoolEntry(driver, uses=meta.get("uses", 1), created_at=meta.get("created_at"))
+
+    def _is_healthy(self, driver: webdriver.Remote) -> bool:
+        try:
+            _ = driver.current_url
+            return True
+        except WebDriverException:
+            return False
+
+    def _reset(self, driver: webdriver.Remote) -> bool:
+        """
+        Borra todo el estado del navegador, no solo el del origen cargado:
+        ventanas extra, cookies y almacenamiento (localStorage, IndexedDB,
+        caché...) de todos los orígenes vía CDP. Si no se puede garantizar, la
+        sesión no vuelve al pool (el capturador recarga sus DataLayers de
+        localStorage y no deben pasar a la sesión de otro usuario).
+        """
+        try:
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.get("about:blank")
+            execute_cdp(driver, "Network.clearBrowserCookies")
+            execute_cdp(driver, "Network.clearBrowserCache")
+            execute_cdp(driver, "Storage.clearDataForOrigin", {"origin": "*", "storageTypes": "all"})
+            # Descartar el tráfico de red del usuario anterior
+            read_performance_log(driver)
+            if len(driver.window_handles) != 1:
+                raise WebDriverException("quedan ventanas abiertas tras el reseteo")
+            return True
+        except Exception as e:
+            logger.warning(f"Pool: Fallo reseteando sesión {driver.session_id}: {e}. Se cerrará.")
+            return False
+
+
+_pools: Dict[str, BrowserPool] = {}
+_pool_lock = threading.Lock()
+
+
+def idle_pool_session_count(max_age_seconds: int) -> int:
+    """
+    Navegadores ociosos de los pools de todos los procesos (listos para
+    entregarse) registrados en Redis con latido de hace menos de
+    ``max_age_seconds``.
+    """
+    return get_redis_client().zcount(POOL_IDLE_KEY, time.time() - max_age_seconds, "+inf")
+
+
+def get_browser_pool(hub_url: Optional[str] = None) -> BrowserPool:
+    """Devuelve el pool del proceso actual para un hub (uno por hub y proceso worker)."""
+    hub_url = (hub_url or settings.WEBDRIVER_HUB_URLS[0]).rstrip("/")
+    with _pool_lock:
+        pool = _pools.get(hub_url)
+        if pool is None:
+            pool = _pools[hub_url] = BrowserPool(
+                command_executor=hub_url,
+                size=settings.BROWSER_POOL_SIZE,
+                max_uses=settings.BROWSER_POOL_MAX_USES,
+                max_idle_seconds=settings.BROWSER_POOL_MAX_IDLE_SECONDS,
+            )
+        return pool
+
+
+def get_browser_pools() -> List[BrowserPool]:
+    """Pools de todos los hubs configurados (los crea si hace falta)."""
+    return [get_browser_pool(hub_url) for hub_url in settings.WEBDRIVER_HUB_URLS]
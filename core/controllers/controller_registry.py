@@ -0,0 +1,191 @@
+# WebAppDL/core/controllers/controller_registry.py
+import asyncio
+import json
+import logging
+import uuid
+from typing import Optional, Set
+
+from django.conf import settings
+
+from ..utils.redis_client import get_async_redis_client, get_redis_client
+from .browser_controller import BrowserController
+
+logger = logging.getLogger(__name__)
+
+# Cada entrada guarda en "owner" el token del consumer que controla el navegador.
+# Un consumer antiguo (reclamado después por otra conexión) no puede abrir ni
+# cerrar periodos de gracia: los scripts comprueban el dueño de forma atómica.
+_CLAIM_LUA = """
+local raw = redis.call('get', KEYS[1])
+redis.call('del', KEYS[2])
+if not raw then return false end
+local ok, entry = pcall(cjson.decode, raw)
+if not ok then return raw end
+entry['owner'] = ARGV[1]
+local encoded = cjson.encode(entry)
+redis.call('set', KEYS[1], encoded, 'EX', ARGV[2])
+return encoded
+"""
+
+_OWNER_MATCHES_LUA = """
+local function owner_matches(key, token)
+    local raw = redis.call('get', key)
+    if not raw then return true end
+    local ok, entry = pcall(cjson.decode, raw)
+    return not ok or entry['owner'] == nil or entry['owner'] == token
+end
+"""
+
+# Abre el periodo de gracia solo si el token sigue siendo el dueño de la entrada
+_START_GRACE_LUA = _OWNER_MATCHES_LUA + """
+if redis.call('exists', KEYS[1]) == 0 or not owner_matches(KEYS[1], ARGV[1]) then return 0 end
+redis.call('set', KEYS[2], ARGV[1], 'EX', ARGV[2])
+redis.call('expire', KEYS[1], ARGV[3])
+return 1
+"""
+
+# Compara-y-borra atómico: solo el dueño del periodo de gracia (y aún de la entrada) puede cerrarlo
+_RELEASE_GRACE_LUA = _OWNER_MATCHES_LUA + """
+if redis.call('get', KEYS[2]) ~= ARGV[1] or not owner_matches(KEYS[1], ARGV[1]) then return 0 end
+return redis.call('del', KEYS[2])
+"""
+
+GRACE_EXPIRY_MARGIN_SECONDS = 60
+
+# Tareas de parada diferida vivas (evita que el GC las recoja al irse el consumer)
+_grace_tasks: Set[asyncio.Task] = set()
+
+
+def _entry_key(session_id) -> str:
+    return f"browser-controller:{session_id}"
+
+
+def _grace_key(session_id) -> str:
+    return f"browser-controller:{session_id}:grace"
+
+
+class ControllerRegistry:
+    """
+    Redis-backed registry of running ``BrowserController`` sessions keyed by
+    app session ID. Any ASGI process can reattach to a browser registered by
+    another one; after a disconnect the browser survives for a grace period.
+    """
+
+    def __init__(self, grace_seconds: Optional[int] = None, ttl_seconds: Optional[int] = None):
+        self.grace_seconds = settings.BROWSER_CONTROLLER_GRACE_SECONDS if grace_seconds is None else grace_seconds
+        self.ttl_seconds = settings.BROWSER_CONTROLLER_REGISTRY_TTL if ttl_seconds is None else ttl_seconds
+
+    async def save(self, controller: BrowserController) -> None:
+        """Registra (o refresca) el controlador en ejecución como dueño de la entrada."""
+        if controller.registry_token is None:
+            controller.registry_token = uuid.uuid4().hex
+        entry = {**controller.snapshot(), "owner": controller.registry_token}
+        await get_async_redis_client().set(_entry_key(controller.session_id), json.dumps(entry), ex=self.ttl_seconds)
+
+    async def remove(self, session_id) -> None:
+        await get_async_redis_client().delete(_entry_key(session_id), _grace_key(session_id))
+
+    async def claim(self, session_id, notify_callback=None) -> Optional[BrowserController]:
+        """
+        Reclama un navegador registrado (cancelando cualquier periodo de gracia
+        pendiente y pasando a ser el dueño de la entrada) y devuelve un
+        controlador adjunto a él, o None si no hay.
+        """
+        token = uuid.uuid4().hex
+        raw = await get_async_redis_client().eval(
+            _CLAIM_LUA, 2, _entry_key(session_id), _grace_key(session_id), token, self.ttl_seconds
+        )
+        if not raw:
+            return None
+        try:
+            snapshot = json.loads(raw)
+        except ValueError:
+            logger.warning(f"Registro: Entrada corrupta para sesión {session_id}. Se descarta.")
+            await self.remove(session_id)
+            return None
+        controller = BrowserController.from_snapshot(snapshot, notify_callback=notify_callback)
+        controller.registry_token = token
+        return controller if controller.state == "running" else None
+
+    async def release_after_grace(self, controller: BrowserController) -> None:
+        """
+        Tras una desconexión, mantiene vivo el navegador ``grace_seconds``.
+        Si ningún socket lo reclama en ese tiempo (en cualquier proceso), se
+        cierra la sesión remota; si lo reclaman, este controlador solo se suelta.
+        Un controlador que ya no es el dueño de la entrada (otra conexión lo
+        reclamó antes de que llegara esta desconexión) se suelta sin más.
+        """
+        client = get_async_redis_client()
+        token = controller.registry_token or ""
+        grace_seconds = max(self.grace_seconds, 0)
+        # Si este proceso muere durante la gracia, la entrada caduca poco después y
+        # el reaper puede recuperar el navegador; ``claim`` + ``save`` restauran el TTL.
+        started = await client.eval(
+            _START_GRACE_LUA, 2, _entry_key(controller.session_id), _grace_key(controller.session_id),
+            token, grace_seconds + self.ttl_seconds, grace_seconds + GRACE_EXPIRY_MARGIN_SECONDS,
+        )
+        if not started:
+            logger.info(f"Registro: Sesión {controller.session_id} ya pertenece a otra conexión. Soltando controlador local.")
+            controller.detach()
+            return
+        if self.grace_seconds <= 0:
+            await self._stop(controller)
+            return
+        logger.info(
+            f"Registro: Sesión {controller.session_id} desconectada. Navegador vivo {self.grace_seconds}s a la espera de reconexión."
+        )
+        task = asyncio.create_task(self._stop_after_grace(controller, token))
+        _grace_tasks.add(task)
+        task.add_done_callback(_grace_tasks.discard)
+
+    async def _stop_after_grace(self, controller: BrowserController, token: str) -> None:
+        await asyncio.sleep(self.grace_seconds)
+        try:
+            released = await get_async_redis_client().eval(
+                _RELEASE_GRACE_LUA, 2, _entry_key(controller.session_id), _grace_key(controller.session_id), token
+            )
+        except Exception as e:
+            logger.error(f"Registro: Error comprobando el periodo de gracia de la sesión {controller.session_id}: {e}")
+            released = 1 # Ante la duda, no dejar el navegador huérfano
+        if released:
+            logger.info(f"Registro: Sin reconexión para sesión {controller.session_id}. Cerrando navegador.")
+            await self._stop(controller)
+        else:
+            logger.info(f"Registro: Sesión {controller.session_id} reclamada por otra conexión. Soltando controlador local.")
+            controller.detach()
+
+    async def _stop(self, controller: BrowserController) -> None:
+        await controller.stop()
+        try:
+            await self.remove(controller.session_id)
+        except Exception as e:
+            logger.warning(f"Registro: No se pudo borrar la entrada de la sesión {controller.session_id}: {e}")
+
+
+def registered_selenium_session_ids() -> Set[str]:
+    """
+    IDs de sesión WebDriver de todos los controladores registrados (cliente
+    síncrono: lo usa el reaper de Celery).
+    """
+    client = get_redis_client()
+    keys = [key for key in client.scan_iter(match=_entry_key("*"), count=500) if not key.endswith(b":grace")]
+    session_ids = set()
+    for raw in client.mget(keys) if keys else []:
+        try:
+            selenium_session_id = json.loads(raw).get("selenium_session_id") if raw else None
+        except ValueError:
+            continue
+        if selenium_session_id:
+            session_ids.add(selenium_session_id)
+    return session_ids
+
+
+_registry: Optional[ControllerRegistry] = None
+
+
+def get_controller_registry() -> ControllerRegistry:
+    """Devuelve el registro del proceso (la configuración se lee una vez)."""
+    global _registry
+    if _registry is None:
+        _registry = ControllerRegistry()
+    return _registry
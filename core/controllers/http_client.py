@@ -0,0 +1,145 @@
+# WebAppDL/core/controllers/http_client.py
+import asyncio
+import bisect
+import importlib.util
+import logging
+import re
+import threading
+import time
+from typing import Dict, Optional, Set
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores (ms) de los buckets del histograma de latencia
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+_SESSION_PATH_RE = re.compile(r"/session/[^/]+")
+
+
+class LatencyHistogram:
+    """
+    Process-local latency histogram of WebDriver calls, keyed by HTTP method
+    and endpoint template (``POST /session/{sessionId}/url``).
+    """
+
+    def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict] = {}
+
+    @staticmethod
+    def endpoint_key(method: str, url: str) -> str:
+        path = httpx.URL(url).path
+        # Quitar el prefijo del hub (p.ej. /wd/hub) y el ID de sesión
+        path = path[path.find("/session"):] if "/session" in path else path
+        return f"{method.upper()} {_SESSION_PATH_RE.sub('/session/{sessionId}', path)}"
+
+    def observe(self, key: str, elapsed_ms: float) -> None:
+        with self._lock:
+            stats = self._endpoints.setdefault(
+                key, {"count": 0, "sum_ms": 0.0, "max_ms": 0.0, "buckets": [0] * (len(self.buckets_ms) + 1)}
+            )
+            stats["count"] += 1
+            stats["sum_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["buckets"][bisect.bisect_left(self.buckets_ms, elapsed_ms)] += 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Copia serializable a JSON con buckets etiquetados y media."""
+        labels = [f"<={b}ms" for b in self.buckets_ms] + [f">{self.buckets_ms[-1]}ms"]
+        with self._lock:
+            return {
+                key: {
+                    "count": stats["count"],
+                    "avg_ms": round(stats["sum_ms"] / stats["count"], 2) if stats["count"] else 0.0,
+                    "max_ms": round(stats["max_ms"], 2),
+                    "buckets": dict(zip(labels, stats["buckets"])),
+                }
+                for key, stats in self._endpoints.items()
+            }
+
+
+webdriver_latency = LatencyHistogram()
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_closing_tasks: Set[asyncio.Task] = set() # Cierres de clientes reemplazados en curso
+
+
+def _http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+async def _aclose_quietly(client: httpx.AsyncClient) -> None:
+    try:
+        await client.aclose()
+    except Exception as e:
+        logger.debug(f"Error cerrando un cliente HTTP de WebDriver reemplazado: {e}")
+
+
+def _retire_client(client: Optional[httpx.AsyncClient], client_loop: Optional[asyncio.AbstractEventLoop],
+                   loop: asyncio.AbstractEventLoop) -> None:
+    """
+    Cierra el cliente de otro event loop para no dejar su pool de conexiones
+    abierto: en su propio loop si sigue corriendo, si no en el actual.
+    """
+    if client is None or client.is_closed:
+        return
+    if client_loop is not None and client_loop.is_running() and not client_loop.is_closed():
+        asyncio.run_coroutine_threadsafe(_aclose_quietly(client), client_loop)
+        return
+    task = loop.create_task(_aclose_quietly(client))
+    _closing_tasks.add(task)
+    task.add_done_callback(_closing_tasks.discard)
+
+
+def get_webdriver_client() -> httpx.AsyncClient:
+    """
+    Returns the process-wide pooled ``httpx.AsyncClient`` used for every
+    WebDriver hub call (keep-alive, HTTP/2 when ``h2`` is installed).
+    A new client is created if the running event loop changed; the previous
+    one is closed.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        if _client_loop is not loop:
+            _retire_client(_client, _client_loop, loop)
+        http2 = settings.WEBDRIVER_HTTP2 and _http2_available()
+        _client = httpx.AsyncClient(
+            http2=http2,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=settings.WEBDRIVER_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.WEBDRIVER_HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=settings.WEBDRIVER_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                settings.WEBDRIVER_HTTP_TIMEOUT, connect=settings.WEBDRIVER_HTTP_CONNECT_TIMEOUT
+            ),
+        )
+        _client_loop = loop
+        logger.info(f"Cliente HTTP compartido de WebDriver creado (http2={http2}).")
+    return _client
+
+
+async def webdriver_request(method: str, url: str, **kwargs) -> httpx.Response:
+    """Sends a request through the shared client and records its latency."""
+    key = LatencyHistogram.endpoint_key(method, url)
+    started = time.perf_counter()
+    try:
+        return await get_webdriver_client().request(method, url, **kwargs)
+    finally:
+        webdriver_latency.observe(key, (time.perf_counter() - started) * 1000)
+
+
+async def close_webdriver_client() -> None:
+    """Closes the shared client (called at ASGI lifespan shutdown)."""
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        logger.info("Cliente HTTP compartido de WebDriver cerrado.")
+    _client = None
+    _client_loop = None
@@ -0,0 +1,86 @@
+# core/management/commands/bench_db_writes.py
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections, transaction
+
+from core.models import Session
+from core.utils.result_store import append_captured_events
+
+
+def _drain_like_write(session_pk, batch_size: int, sequence: int) -> None:
+    """Misma escritura que un drenado: fila de sesión bloqueada + lote de CapturedEvent + cursor."""
+    items = [{"event": "GAEvent", "event_label": f"bench_{sequence}_{i}", "_captureTimestamp": sequence} for i in range(batch_size)]
+    with transaction.atomic():
+        session = Session.objects.select_for_update().only("capture_cursor").get(pk=session_pk)
+        append_captured_events(session_pk, items)
+        session.capture_cursor += batch_size
+        session.save(update_fields=["capture_cursor", "updated_at"])
+
+
+def _worker(session_pks, writes: int, batch_size: int, worker_index: int):
+    latencies, errors = [], 0
+    try:
+        for i in range(writes):
+            start = time.perf_counter()
+            try:
+                _drain_like_write(session_pks[(worker_index + i) % len(session_pks)], batch_size, i)
+            except OperationalError:  # "database is locked"
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        connections.close_all()  # Conexiones de este hilo
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide escrituras concurrentes a la BD con el patrón del drenado de captura "
+        "(select_for_update + bulk_create) desde varios hilos, cada uno con su conexión: "
+        "latencia p50/p95, escrituras por segundo y errores 'database is locked'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Escritores concurrentes (hilos).")
+        parser.add_argument("--writes", type=int, default=100, help="Transacciones por escritor.")
+        parser.add_argument("--sessions", type=int, default=4, help="Sesiones sobre las que se reparten las escrituras.")
+        parser.add_argument("--batch", type=int, default=20, help="Eventos insertados por transacción.")
+
+    def handle(self, *args, **options):
+        session_pks = [
+            Session.objects.create(url="https://example.com/bench", status=Session.STATUS_WAITING_USER).pk
+            for _ in range(options["sessions"])
+        ]
+        journal_mode = ""
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode")
+                journal_mode = f" (journal_mode={cursor.fetchone()[0]})"
+        self.stdout.write(f"Backend: {connection.vendor}{journal_mode}, {options['workers']} escritores")
+
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+                results = list(executor.map(
+                    lambda index: _worker(session_pks, options["writes"], options["batch"], index),
+                    range(options["workers"]),
+                ))
+            elapsed = time.perf_counter() - start
+        finally:
+            Session.objects.filter(pk__in=session_pks).delete()
+
+        latencies = sorted(latency for worker_latencies, _ in results for latency in worker_latencies)
+        errors = sum(worker_errors for _, worker_errors in results)
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f"Ninguna escritura completada ({errors} errores)."))
+            return
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(
+            f"{len(latencies)} transacciones en {elapsed:.2f} s ({len(latencies) / elapsed:.0f}/s), "
+            f"p50 {statistics.median(latencies):.2f} ms, p95 {p95:.2f} ms, máx {latencies[-1]:.2f} ms"
+        )
+        style = self.style.ERROR if errors else self.style.SUCCESS
+        self.stdout.write(style(f"Errores 'database is locked': {errors}"))
@@ -0,0 +1,112 @@
+# core/management/commands/bench_report_render.py
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Session
+from core.utils.report_generator import (
+    REPORT_TEMPLATE_NAME,
+    ReportGenerator,
+    build_report_environment,
+    get_report_environment,
+)
+from core.utils.result_store import load_validation_results
+
+
+def _synthetic_results(details_count):
+    """Resultados de validación sintéticos con una mezcla de válidos, inválidos y warnings."""
+    details = []
+    for i in range(details_count):
+        valid = i % 3 != 0
+        data = {"event": "GAEvent", "event_category": f"categoria_{i % 25}", "event_label": f"label_{i}"}
+        details.append({
+            "datalayer_index": i,
+            "data": data,
+            "valid": valid,
+            "errors": [] if valid else [f"Campo 'event_label' inesperado en el item {i}"],
+            "warnings": [f"Propiedad extra en el item {i}"] if i % 5 == 0 else [],
+            "matched_section_id": f"datalayer_{i % 25}",
+            "matched_section": f"Sección {i % 25}",
+            "match_score": 0.9,
+        })
+    valid_count = sum(1 for d in details if d["valid"])
+    return {
+        "url": "https://example.com/",
+        "valid": False,
+        "details": details,
+        "references": {
+            f"datalayer_{i}": {
+                "title": f"Sección {i}",
+                "properties": {"event": "GAEvent", "event_category": f"categoria_{i}", "event_label": "{{label}}"},
+            }
+            for i in range(25)
+        },
+        "summary": {
+            "unique_valid_matches": valid_count,
+            "unique_invalid_matches": details_count - valid_count,
+            "unique_datalayers_with_warnings": sum(1 for d in details if d["warnings"]),
+        },
+        "comparison": {
+            "reference_count": 25,
+            "matched_count": 20,
+            "missing_count": 5,
+            "coverage_percent": 80.0,
+            "missing_details": [
+                {"reference_title": f"Sección {i}", "reference_id": f"datalayer_{i}"}
+                for i in range(20, 25)
+            ],
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la latencia de render del reporte HTML: entorno Jinja2 nuevo por render "
+        "(comportamiento anterior), entorno nuevo con caché de bytecode (proceso recién "
+        "arrancado) y entorno compartido del proceso."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20, help="Renders por modo.")
+        parser.add_argument("--details", type=int, default=200, help="Detalles sintéticos por reporte.")
+        parser.add_argument("--session", help="Usar los resultados de validación de esta sesión en vez de datos sintéticos.")
+
+    def handle(self, *args, **options):
+        if options["session"]:
+            try:
+                session = Session.objects.only("url").get(pk=options["session"])
+            except (Session.DoesNotExist, ValueError):
+                raise CommandError(f"Sesión {options['session']} no encontrada.")
+            results, url = load_validation_results(session.pk), session.url
+        else:
+            results, url = _synthetic_results(options["details"]), "https://example.com/"
+
+        with tempfile.TemporaryDirectory() as bytecode_dir:
+            generator = ReportGenerator(config={"paths": {"output": bytecode_dir}})
+            context = generator.build_html_context(results, url)
+            # Poblar el bytecode en disco como lo haría el primer proceso del worker
+            build_report_environment(bytecode_dir=bytecode_dir).get_template(REPORT_TEMPLATE_NAME)
+            get_report_environment().get_template(REPORT_TEMPLATE_NAME)
+            modes = [
+                ("sin caché", lambda: build_report_environment()),
+                ("bytecode", lambda: build_report_environment(bytecode_dir=bytecode_dir)),
+                ("compartido", get_report_environment),
+            ]
+            self.stdout.write(f"{'modo':<12} {'carga p50':>10} {'render p50':>11} {'total p50':>10} {'total p95':>10} (ms)")
+            for name, env_factory in modes:
+                load_times, render_times = [], []
+                for _ in range(options["iterations"]):
+                    start = time.perf_counter()
+                    template = env_factory().get_template(REPORT_TEMPLATE_NAME)
+                    loaded = time.perf_counter()
+                    template.render(**context)
+                    load_times.append((loaded - start) * 1000)
+                    render_times.append((time.perf_counter() - loaded) * 1000)
+                totals = sorted(load + render for load, render in zip(load_times, render_times))
+                p95 = totals[min(len(totals) - 1, int(len(totals) * 0.95))]
+                self.stdout.write(
+                    f"{name:<12} {statistics.median(load_times):>10.2f} {statistics.median(render_times):>11.2f} "
+                    f"{statistics.median(totals):>10.2f} {p95:>10.2f}"
+                )
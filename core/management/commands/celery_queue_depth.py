@@ -0,0 +1,57 @@
+# core/management/commands/celery_queue_depth.py
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from webappdl.celery import app
+
+
+def active_consumers(timeout: float = 1.0) -> Counter:
+    """
+    Workers que consumen de cada cola, preguntados por broadcast de control
+    (``inspect().active_queues()``). El transporte Redis no lleva la cuenta de
+    consumidores en ``queue_declare``: siempre devuelve 0.
+    """
+    replies = app.control.inspect(timeout=timeout).active_queues() or {}
+    return Counter(queue["name"] for worker_queues in replies.values() for queue in worker_queues or [])
+
+
+class Command(BaseCommand):
+    help = "Muestra la profundidad (mensajes pendientes) y consumidores de cada cola Celery."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--watch",
+            type=int,
+            default=0,
+            help="Repetir cada N segundos (0 = una sola lectura).",
+        )
+
+    def handle(self, *args, **options):
+        queues = [
+            settings.CELERY_TASK_DEFAULT_QUEUE,
+            settings.CELERY_TASK_QUEUE_BROWSER,
+            settings.CELERY_TASK_QUEUE_CPU,
+        ]
+        while True:
+            try:
+                consumers = active_consumers()
+            except Exception as e:
+                self.stderr.write(f"No se pudo consultar a los workers: {e}")
+                consumers = None
+            with app.connection_for_read() as conn:
+                channel = conn.default_channel
+                for queue in queues:
+                    try:
+                        _, message_count, _ = channel.queue_declare(queue=queue, passive=True)
+                    except Exception as e:
+                        self.stderr.write(f"{queue:<10} error: {e}")
+                        continue
+                    consumer_count = "?" if consumers is None else consumers[queue]
+                    self.stdout.write(f"{queue:<10} pendientes={message_count:<6} consumidores={consumer_count}")
+            if not options["watch"]:
+                return
+            time.sleep(options["watch"])
+            self.stdout.write("")
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_session_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='capture_cursor',
+            field=models.PositiveIntegerField(default=0, help_text='Número de DataLayers del navegador ya drenados a captured_data'),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='last_heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Último heartbeat del worker sobre el navegador remoto', null=True),
+        ),
+    ]
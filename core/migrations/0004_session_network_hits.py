@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_session_capture_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='captured_network_hits',
+            field=models.JSONField(blank=True, help_text='Peticiones crudas de Google Analytics (collect) capturadas del log de red', null=True),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='network_hits_dropped',
+            field=models.PositiveIntegerField(default=0, help_text='Hits de red descartados por superar el tamaño máximo del buffer'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_session_network_hits'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='session',
+            name='status',
+            field=models.CharField(choices=[('queued', 'En cola'), ('pending', 'Pendiente'), ('starting', 'Iniciando'), ('waiting_user', 'Esperando Usuario'), ('finish_requested', 'Finalización Solicitada'), ('processing', 'Procesando'), ('completed', 'Completada'), ('error', 'Error')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_session_status_queued'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='webdriver_url',
+            field=models.URLField(blank=True, help_text='Hub WebDriver en el que vive selenium_session_id', max_length=500, null=True),
+        ),
+    ]
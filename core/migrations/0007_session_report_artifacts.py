@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_session_webdriver_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='report_csv_file',
+            field=models.FileField(blank=True, help_text='Errores de validación en CSV', null=True, upload_to='validation_reports/'),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='report_json_file',
+            field=models.FileField(blank=True, help_text='Resultados de validación completos en JSON', null=True, upload_to='validation_reports/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_session_report_artifacts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='results_hash',
+            field=models.CharField(blank=True, help_text='SHA-256 de validation_results', max_length=64, null=True),
+        ),
+    ]
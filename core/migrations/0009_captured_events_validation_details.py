@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_session_results_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='session',
+            name='captured_data',
+            field=models.JSONField(blank=True, help_text='DataLayers capturados durante la sesión interactiva (sesiones anteriores a CapturedEvent)', null=True),
+        ),
+        migrations.AlterField(
+            model_name='session',
+            name='validation_results',
+            field=models.JSONField(blank=True, help_text='Resultados de la validación vs el schema (sin los detalles por DataLayer)', null=True),
+        ),
+        migrations.CreateModel(
+            name='CapturedEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField(help_text='Posición en el orden de captura de la sesión')),
+                ('captured_at_ms', models.BigIntegerField(blank=True, help_text='Marca de tiempo de captura en el navegador (_captureTimestamp, ms epoch)', null=True)),
+                ('data', models.JSONField(help_text='DataLayer tal como se capturó (incluye _captureTimestamp)')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='captured_events', to='core.session')),
+            ],
+            options={
+                'ordering': ['session', 'sequence'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ValidationDetail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datalayer_index', models.PositiveIntegerField(help_text='Índice en la lista de DataLayers relevantes')),
+                ('valid', models.BooleanField(help_text='Válido, inválido o null si no coincide con ninguna referencia', null=True)),
+                ('matched_section_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('matched_section', models.CharField(blank=True, max_length=500, null=True)),
+                ('match_score', models.FloatField(blank=True, null=True)),
+                ('captured_at_ms', models.BigIntegerField(blank=True, null=True)),
+                ('source', models.CharField(default='capture', max_length=20)),
+                ('data', models.JSONField()),
+                ('errors', models.JSONField(default=list)),
+                ('warnings', models.JSONField(default=list)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='validation_details', to='core.session')),
+            ],
+            options={
+                'ordering': ['session', 'datalayer_index'],
+                'indexes': [models.Index(fields=['session', 'matched_section_id'], name='validation_detail_section'), models.Index(fields=['session', 'valid'], name='validation_detail_valid'), models.Index(fields=['session', 'captured_at_ms'], name='validation_detail_time')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='validationdetail',
+            constraint=models.UniqueConstraint(fields=('session', 'datalayer_index'), name='validation_detail_session_index'),
+        ),
+        migrations.AddIndex(
+            model_name='capturedevent',
+            index=models.Index(fields=['session', 'captured_at_ms'], name='captured_event_session_time'),
+        ),
+        migrations.AddConstraint(
+            model_name='capturedevent',
+            constraint=models.UniqueConstraint(fields=('session', 'sequence'), name='captured_event_session_sequence'),
+        ),
+    ]
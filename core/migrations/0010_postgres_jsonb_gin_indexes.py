@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Índices GIN (jsonb_path_ops) para consultas de contención (@>) sobre los JSON
+# de resultados. Solo en PostgreSQL: en SQLite la migración no hace nada.
+GIN_INDEXES = [
+    ("core_session_validation_results_gin", "Session", "validation_results"),
+    ("core_validationdetail_data_gin", "ValidationDetail", "data"),
+    ("core_capturedevent_data_gin", "CapturedEvent", "data"),
+]
+
+
+def create_gin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    quote = schema_editor.quote_name
+    for index_name, model_name, column in GIN_INDEXES:
+        table = apps.get_model("core", model_name)._meta.db_table
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {quote(index_name)} ON {quote(table)} "
+            f"USING GIN ({quote(column)} jsonb_path_ops)"
+        )
+
+
+def drop_gin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for index_name, _model_name, _column in GIN_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {schema_editor.quote_name(index_name)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_captured_events_validation_details'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_gin_indexes, drop_gin_indexes),
+    ]
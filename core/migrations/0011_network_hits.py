@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_postgres_jsonb_gin_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='session',
+            name='captured_network_hits',
+            field=models.JSONField(blank=True, help_text='Peticiones crudas de Google Analytics (collect) del log de red (sesiones anteriores a NetworkHit)', null=True),
+        ),
+        migrations.CreateModel(
+            name='NetworkHit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField(help_text='Posición en el orden de captura de la sesión')),
+                ('captured_at_ms', models.BigIntegerField(blank=True, help_text='Marca de tiempo del log de red (ms)', null=True)),
+                ('url', models.TextField()),
+                ('post_data', models.TextField(blank=True, help_text='Cuerpo POST (GA4 por lotes: un evento por línea)', null=True)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='network_hits', to='core.session')),
+            ],
+            options={
+                'ordering': ['session', 'sequence'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='networkhit',
+            constraint=models.UniqueConstraint(fields=('session', 'sequence'), name='network_hit_session_sequence'),
+        ),
+    ]
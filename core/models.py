@@ -7,8 +7,19 @@ from django.db import models
 # from django.conf import settings # Si usas settings.AUTH_USER_MODEL
 
 
+# Columnas JSON que pueden pesar megabytes: solo se cargan donde se usan
+SESSION_PAYLOAD_FIELDS = ("reference_schema", "captured_data", "captured_network_hits", "validation_results")
+
+
+class SessionQuerySet(models.QuerySet):
+    def metadata(self):
+        """Sesiones sin los blobs JSON (estado, URLs, IDs y marcas de tiempo)."""
+        return self.defer(*SESSION_PAYLOAD_FIELDS)
+
+
 class Session(models.Model):
     # Definir constantes para los estados
+    STATUS_QUEUED = "queued"
     STATUS_PENDING = "pending"
     STATUS_STARTING = "starting"
     STATUS_WAITING_USER = "waiting_user"
@@ -19,6 +30,7 @@ class Session(models.Model):
 
     # Opciones para el campo status
     STATUS_CHOICES = [
+        (STATUS_QUEUED, "En cola"),
         (STATUS_PENDING, "Pendiente"),
         (STATUS_STARTING, "Iniciando"),
         (STATUS_WAITING_USER, "Esperando Usuario"),
@@ -59,15 +71,49 @@ class Session(models.Model):
         blank=True,
         help_text="ID de la sesión específica en Selenium Grid/Standalone",
     )
+    webdriver_url = models.URLField(
+        max_length=500,
+        null=True,
+        blank=True,
+        help_text="Hub WebDriver en el que vive selenium_session_id",
+    )
+    # Estado de captura persistido entre las tareas cortas del worker
+    capture_cursor = models.PositiveIntegerField(
+        default=0,
+        help_text="Número de DataLayers del navegador ya drenados a captured_data",
+    )
+    last_heartbeat_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Último heartbeat del worker sobre el navegador remoto",
+    )
+    # Sesiones antiguas: los DataLayers nuevos se guardan en CapturedEvent
     captured_data = models.JSONField(
         null=True,
         blank=True,
-        help_text="DataLayers capturados durante la sesión interactiva",
+        help_text="DataLayers capturados durante la sesión interactiva (sesiones anteriores a CapturedEvent)",
     )
+    captured_network_hits = models.JSONField(
+        null=True,
+        blank=True,
+        help_text="Peticiones crudas de Google Analytics (collect) del log de red (sesiones anteriores a NetworkHit)",
+    )
+    network_hits_dropped = models.PositiveIntegerField(
+        default=0,
+        help_text="Hits de red descartados por superar el tamaño máximo del buffer",
+    )
+    # Resumen, comparación y referencias; los detalles van en ValidationDetail
     validation_results = models.JSONField(
         null=True,
         blank=True,
-        help_text="Resultados detallados de la validación vs el schema",
+        help_text="Resultados de la validación vs el schema (sin los detalles por DataLayer)",
+    )
+    # Clave de la caché de renders bajo demanda del reporte (cambia con los resultados)
+    results_hash = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        help_text="SHA-256 de validation_results",
     )
     # Usamos FileField para guardar el reporte generado
     # Necesitarás configurar MEDIA_ROOT y MEDIA_URL en settings.py
@@ -77,8 +123,23 @@ class Session(models.Model):
         blank=True,
         help_text="Archivo del reporte de validación generado",
     )
+    # Artefactos descargables generados junto al HTML (en la misma pasada)
+    report_csv_file = models.FileField(
+        upload_to="validation_reports/",
+        null=True,
+        blank=True,
+        help_text="Errores de validación en CSV",
+    )
+    report_json_file = models.FileField(
+        upload_to="validation_reports/",
+        null=True,
+        blank=True,
+        help_text="Resultados de validación completos en JSON",
+    )
     # Eliminamos reference_json_content ya que usaremos reference_schema (JSONField)
 
+    objects = SessionQuerySet.as_manager()
+
     def __str__(self):
         return f"Session {self.id} for {self.url} [{self.status}]"
 
@@ -86,3 +147,77 @@ class Session(models.Model):
         ordering = [
             "-created_at"
         ]  # Ordenar por defecto por fecha de creación descendente
+
+
+class CapturedEvent(models.Model):
+    """DataLayer capturado en el navegador, en orden de captura dentro de la sesión."""
+
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name="captured_events")
+    sequence = models.PositiveIntegerField(help_text="Posición en el orden de captura de la sesión")
+    captured_at_ms = models.BigIntegerField(
+        null=True,
+        blank=True,
+        help_text="Marca de tiempo de captura en el navegador (_captureTimestamp, ms epoch)",
+    )
+    data = models.JSONField(help_text="DataLayer tal como se capturó (incluye _captureTimestamp)")
+
+    class Meta:
+        ordering = ["session", "sequence"]
+        constraints = [
+            models.UniqueConstraint(fields=["session", "sequence"], name="captured_event_session_sequence"),
+        ]
+        indexes = [
+            models.Index(fields=["session", "captured_at_ms"], name="captured_event_session_time"),
+        ]
+
+    def __str__(self):
+        return f"CapturedEvent {self.sequence} of session {self.session_id}"
+
+
+class NetworkHit(models.Model):
+    """Petición cruda de Google Analytics capturada del log de red, en orden de captura."""
+
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name="network_hits")
+    sequence = models.PositiveIntegerField(help_text="Posición en el orden de captura de la sesión")
+    captured_at_ms = models.BigIntegerField(null=True, blank=True, help_text="Marca de tiempo del log de red (ms)")
+    url = models.TextField()
+    post_data = models.TextField(null=True, blank=True, help_text="Cuerpo POST (GA4 por lotes: un evento por línea)")
+
+    class Meta:
+        ordering = ["session", "sequence"]
+        constraints = [
+            models.UniqueConstraint(fields=["session", "sequence"], name="network_hit_session_sequence"),
+        ]
+
+    def __str__(self):
+        return f"NetworkHit {self.sequence} of session {self.session_id}"
+
+
+class ValidationDetail(models.Model):
+    """Resultado de validar un DataLayer capturado (una fila por detalle)."""
+
+    session = models.ForeignKey(Session, on_delete=models.CASCADE, related_name="validation_details")
+    datalayer_index = models.PositiveIntegerField(help_text="Índice en la lista de DataLayers relevantes")
+    valid = models.BooleanField(null=True, help_text="Válido, inválido o null si no coincide con ninguna referencia")
+    matched_section_id = models.CharField(max_length=100, null=True, blank=True)
+    matched_section = models.CharField(max_length=500, null=True, blank=True)
+    match_score = models.FloatField(null=True, blank=True)
+    captured_at_ms = models.BigIntegerField(null=True, blank=True)
+    source = models.CharField(max_length=20, default="capture")
+    data = models.JSONField()
+    errors = models.JSONField(default=list)
+    warnings = models.JSONField(default=list)
+
+    class Meta:
+        ordering = ["session", "datalayer_index"]
+        constraints = [
+            models.UniqueConstraint(fields=["session", "datalayer_index"], name="validation_detail_session_index"),
+        ]
+        indexes = [
+            models.Index(fields=["session", "matched_section_id"], name="validation_detail_section"),
+            models.Index(fields=["session", "valid"], name="validation_detail_valid"),
+            models.Index(fields=["session", "captured_at_ms"], name="validation_detail_time"),
+        ]
+
+    def __str__(self):
+        return f"ValidationDetail {self.datalayer_index} of session {self.session_id}"
@@ -1,7 +1,7 @@
 // core/static/core/js/session_app.js
 
 document.addEventListener('DOMContentLoaded', () => {
-    console.log("DOM Cargado. Iniciando JS de sesión (Polling Version).");
+    console.log("DOM Cargado. Iniciando JS de sesión (WebSocket + polling de respaldo).");
 
     // --- Obtener Session ID y URL de Status ---
     const sessionId = JSON.parse(document.getElementById('session-id-data').textContent);
@@ -15,9 +15,27 @@ document.addEventListener('DOMContentLoaded', () => {
     const finishButton = document.getElementById('finish-button');
     const reportLinkContainer = document.getElementById('report-link-container');
     const reportLinkElement = document.getElementById('report-link');
+    const queueInfoContainer = document.getElementById('queue-info-container');
+    const queuePositionElement = document.getElementById('queue-position');
+    const queueEtaElement = document.getElementById('queue-eta');
+    const datalayerList = document.getElementById('datalayer-list');
+    const datalayerEmpty = document.getElementById('datalayer-empty');
+    const datalayerCounts = document.getElementById('datalayer-counts');
 
     let pollingIntervalId = null;
-    const POLLING_INTERVAL_MS = 3000; // Consultar cada 3 segundos
+    const POLLING_INTERVAL_MS = 3000; // Consultar cada 3 segundos si no hay WebSocket
+    const FALLBACK_POLLING_INTERVAL_MS = 30000; // Respaldo lento con el WebSocket abierto
+    const WS_RECONNECT_DELAY_MS = 5000;
+    let sessionFinished = false;
+    const MAX_RENDERED_DATALAYERS = 200; // Limitar nodos en el DOM durante sesiones largas
+    const MATCH_BADGES = {
+        valid: ['bg-success', 'Válido'],
+        invalid: ['bg-danger', 'Con errores'],
+        unmatched: ['bg-warning text-dark', 'Sin coincidencia'],
+        filtered: ['bg-secondary', 'Ignorado'],
+        pending: ['bg-light text-dark', 'Pendiente'],
+    };
+    let liveSocket = null;
 
     // --- URL para finalizar la sesión ---
     const finishUrl = `/session/${sessionId}/finish/`; // URL que crearemos en Django
@@ -41,6 +59,17 @@ document.addEventListener('DOMContentLoaded', () => {
             statusElement.textContent = data.status || 'Desconocido';
         }
 
+        // Posición en la cola de admisión y espera estimada
+        if (queueInfoContainer) {
+            if (data.status_code === 'queued' && data.queue_position) {
+                queuePositionElement.textContent = data.queue_position;
+                queueEtaElement.textContent = formatEta(data.eta_seconds);
+                queueInfoContainer.style.display = 'block';
+            } else {
+                queueInfoContainer.style.display = 'none';
+            }
+        }
+
         // Mostrar/Ocultar enlace VNC y habilitar/deshabilitar botón Finalizar
         if (data.status_code === 'waiting_user') {
             // Mostrar enlace VNC y botón Finalizar
@@ -78,10 +107,18 @@ document.addEventListener('DOMContentLoaded', () => {
                  console.log("Report URL recibido:", reportUrl);
                  reportLinkElement.href = reportUrl;
                  reportLinkContainer.style.display = 'block'; // Mostrar contenedor del reporte
+                 // Descargas opcionales (JSON completo y CSV de errores)
+                 [['report-json-link', data.report_json_url], ['report-csv-link', data.report_csv_url]].forEach(([id, url]) => {
+                     const link = document.getElementById(id);
+                     if (!link) return;
+                     link.href = url || '#';
+                     link.style.display = url ? 'inline-block' : 'none';
+                 });
              } else {
                   // console.warn("Report URL no disponible o elementos no encontrados."); // Descomentar para debug
                   reportLinkContainer.style.display = 'none'; // Ocultar si no hay URL/elementos
              }
+             sessionFinished = true;
              stopPolling(); // Detener polling si está completado
         } else {
              if (reportLinkContainer) reportLinkContainer.style.display = 'none'; // Ocultar si no está completado
@@ -89,10 +126,17 @@ document.addEventListener('DOMContentLoaded', () => {
 
         // Detener polling si hay error final
         if (data.status_code === 'error') {
+             sessionFinished = true;
              stopPolling();
         }
     }
 
+    function formatEta(seconds) {
+        if (!seconds && seconds !== 0) return '-';
+        if (seconds < 60) return 'menos de 1 min';
+        return `~${Math.round(seconds / 60)} min`;
+    }
+
     // --- Función para realizar la consulta AJAX (Polling) ---
     function pollStatus() {
         console.log("Polling status...");
@@ -115,6 +159,12 @@ document.addEventListener('DOMContentLoaded', () => {
             });
     }
 
+    // --- Función para (re)iniciar el polling con un intervalo dado ---
+    function startPolling(intervalMs) {
+        stopPolling();
+        pollingIntervalId = setInterval(pollStatus, intervalMs);
+    }
+
     // --- Función para detener el polling ---
     function stopPolling() {
         if (pollingIntervalId) {
@@ -130,7 +180,7 @@ document.addEventListener('DOMContentLoaded', () => {
             console.log("Botón Finalizar clickeado.");
             finishButton.disabled = true; // Deshabilitar inmediatamente
             if (statusElement) statusElement.textContent = "Finalización solicitada...";
-            stopPolling(); // Detener polling al finalizar manualmente
+            // El WebSocket seguirá informando de PROCESSING/COMPLETED
 
             // Enviar petición POST para cambiar el estado
             fetch(finishUrl, {
@@ -184,9 +234,88 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    // --- Streaming en vivo de DataLayers (WebSocket) ---
+    function connectLiveStream() {
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        liveSocket = new WebSocket(`${scheme}://${window.location.host}/ws/session/${sessionId}/`);
+        liveSocket.onmessage = (message) => {
+            let data;
+            try {
+                data = JSON.parse(message.data);
+            } catch (e) {
+                console.error("Mensaje WebSocket inválido:", e);
+                return;
+            }
+            if (data.action === 'session_status') {
+                // Transición de estado publicada por el backend: actualización inmediata
+                updateUI(data);
+            } else if (data.action === 'datalayer_batch') {
+                renderDatalayerBatch(data.events || []);
+                renderDatalayerCounts(data.counts, 0);
+            } else if (data.action === 'datalayer_summary') {
+                renderDatalayerCounts(data.counts, data.skipped);
+            }
+        };
+        liveSocket.onopen = () => {
+            console.log("WebSocket de sesión abierto. Polling en modo respaldo.");
+            if (!sessionFinished) startPolling(FALLBACK_POLLING_INTERVAL_MS);
+        };
+        liveSocket.onclose = () => {
+            console.log("WebSocket de sesión cerrado.");
+            liveSocket = null;
+            if (sessionFinished) return;
+            // Sin WebSocket: volver al polling rápido e intentar reconectar
+            startPolling(POLLING_INTERVAL_MS);
+            setTimeout(connectLiveStream, WS_RECONNECT_DELAY_MS);
+        };
+    }
+
+    function renderDatalayerBatch(events) {
+        if (!datalayerList || !events.length) return;
+        if (datalayerEmpty) datalayerEmpty.remove();
+        // Un solo reflow por lote
+        const fragment = document.createDocumentFragment();
+        events.forEach(liveEvent => {
+            const match = liveEvent.match || {};
+            const [badgeClass, badgeLabel] = MATCH_BADGES[match.status] || MATCH_BADGES.pending;
+            const item = document.createElement('div');
+            item.className = 'border-bottom py-1 small';
+            const badge = document.createElement('span');
+            badge.className = `badge ${badgeClass} me-1`;
+            badge.textContent = badgeLabel;
+            const title = document.createElement('strong');
+            title.textContent = (liveEvent.data && liveEvent.data.event) || '(sin event)';
+            item.append(badge, title);
+            if (match.section) {
+                const section = document.createElement('div');
+                section.className = 'text-muted';
+                section.textContent = `${match.section} (score ${match.score})`;
+                item.appendChild(section);
+            }
+            item.title = JSON.stringify(liveEvent.data, null, 2);
+            fragment.appendChild(item);
+        });
+        datalayerList.appendChild(fragment);
+        while (datalayerList.children.length > MAX_RENDERED_DATALAYERS) {
+            datalayerList.removeChild(datalayerList.firstChild);
+        }
+        datalayerList.scrollTop = datalayerList.scrollHeight;
+    }
+
+    function renderDatalayerCounts(counts, skipped) {
+        if (!datalayerCounts || !counts) return;
+        const parts = Object.entries(counts).map(([status, count]) => {
+            const label = (MATCH_BADGES[status] || [null, status])[1];
+            return `${label}: ${count}`;
+        });
+        if (skipped) parts.push(`(${skipped} no mostrados)`);
+        datalayerCounts.textContent = parts.join(' · ');
+    }
+
     // --- Iniciar Polling ---
     pollStatus(); // Llamada inicial
-    pollingIntervalId = setInterval(pollStatus, POLLING_INTERVAL_MS); // Iniciar ciclo
+    startPolling(POLLING_INTERVAL_MS); // Hasta que abra el WebSocket
+    connectLiveStream();
 
     // --- Función auxiliar para obtener el token CSRF de las cookies ---
     function getCookie(name) {
@@ -2,20 +2,19 @@
 import logging
 import json
 import time
-import os # Necesario para manejo de archivos/rutas
-from pathlib import Path # Para manejo de rutas de archivo
-from datetime import datetime # Para timestamp en resultados
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta # Para timestamp en resultados
+from typing import Optional, Tuple
 
+import httpx
 from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
 from django.conf import settings
 from django.db import transaction
-from django.core.files.base import ContentFile # Para guardar archivo en modelo
 from django.utils import timezone # Para actualizar 'updated_at'
 
 # Importaciones de Selenium
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options as ChromeOptions
-from selenium.webdriver.chrome.service import Service as ChromeService # Usar Service
 from selenium.common.exceptions import (
     WebDriverException,
     TimeoutException,
@@ -25,14 +24,49 @@ from selenium.common.exceptions import (
 
 # --- Tus imports ---
 from .models import Session
+from .controllers.browser_pool import (
+    POOL_IDLE_KEY,
+    POOL_SESSIONS_KEY,
+    get_browser_pool,
+    attach_driver,
+    detach_driver,
+    read_performance_log,
+)
+from .controllers.controller_registry import registered_selenium_session_ids
+from .utils.capture_scripts import JS_CAPTURE_DATALAYER, JS_DRAIN_DATALAYERS
+from .utils.network_capture import extract_analytics_requests, decode_analytics_hits
 from .utils.validation_logic import ( # Importar funciones específicas
     filter_datalayers,
+    build_reference_index,
     compare_captured_with_reference,
     generate_validation_details,
     calculate_summary
 )
+from .utils import admission
+from .utils.grid_status import delete_grid_session, fetch_grid_sessions
+from .utils.webdriver_hubs import select_hub, total_capacity
+from .utils.redis_client import get_redis_client
 from .utils.schema_builder import SchemaBuilder
-from .utils.report_generator import ReportGenerator # Importar clase
+from .utils.session_signals import finish_signal_pending
+from .utils.session_events import broadcast_session_status, build_live_datalayer_events, send_session_event
+from .utils.report_generator import ReportGenerator, report_render_key, report_template_version, results_hash
+from .utils.result_store import (
+    append_captured_events,
+    append_network_hits,
+    load_captured_data,
+    load_network_hits,
+    load_validation_results,
+    save_validation_details,
+)
+from .utils.report_storage import (
+    delete_stored_files,
+    get_or_render_report,
+    get_report_storage,
+    release_render_lock,
+    store_report_data,
+    store_report_html,
+    store_report_shards,
+)
 
 # --- Configuración para ReportGenerator ---
 # Usamos MEDIA_ROOT definido en settings.py como base para la salida temporal
@@ -51,158 +85,167 @@ logger = logging.getLogger(__name__)
 
 # --- Constantes ---
 VNC_PASSWORD = "secret"
-STATUS_CHECK_INTERVAL_SECONDS = 3
+LIVE_SCHEMA_CACHE_SIZE = 32 # Schemas estructurados cacheados por proceso (indicador en vivo)
+_live_schema_cache: "OrderedDict[int, dict]" = OrderedDict()
 # SELENIUM_COMMAND_TIMEOUT_SECONDS = 120 # Ya no se usa aquí directamente
 
-# --- Script JavaScript (sin cambios) ---
-JS_CAPTURE_DATALAYER = """
-(() => {
-    console.log('Attempting to inject DataLayer capture script...');
-    const LS_KEY = 'capturedDataLayersLs';
-    // Asegurar que window.capturedDataLayers siempre sea un array
-    window.capturedDataLayers = window.capturedDataLayers || [];
-    console.log('Initial capturedDataLayers length:', window.capturedDataLayers.length);
-
-    // Cargar desde LocalStorage de forma segura
-    try {
-        const existingData = localStorage.getItem(LS_KEY);
-        if (existingData) {
-            const parsedData = JSON.parse(existingData);
-            // Sobrescribir solo si lo recuperado es un array válido
-            if (Array.isArray(parsedData)) {
-                window.capturedDataLayers = parsedData;
-                console.log('Loaded ' + parsedData.length + ' items from LocalStorage.');
-            } else {
-                 console.warn('Data in LocalStorage was not an array.');
-            }
-        }
-    } catch (e) {
-        console.error('Error reading or parsing LocalStorage:', e);
-        // Asegurar que sigue siendo un array en caso de error
-        if (!Array.isArray(window.capturedDataLayers)) {
-             window.capturedDataLayers = [];
-        }
-    }
+# --- Función Auxiliar VNC (sin cambios) ---
+def get_vnc_url(port: int = 7900, password: str = VNC_PASSWORD) -> str:
+    logger.info("Generando URL VNC apuntando a /vnc.html en localhost:%s", port)
+    return f"http://localhost:{port}/vnc.html?password={password}"
 
-    // Inicializar dataLayer si no existe
-    window.dataLayer = window.dataLayer || [];
-    const initialTimestamp = Date.now();
-    let initialItemsProcessed = false;
-
-    // Procesar items iniciales SOLO si dataLayer es un array y tiene elementos
-    if (Array.isArray(window.dataLayer) && window.dataLayer.length > 0) {
-        console.log('Processing initial items in existing dataLayer (length:', window.dataLayer.length + ')');
-        let addedFromInitial = 0;
-        // Usar un bucle for...of o un for clásico para más control si forEach da problemas
-        for (const obj of window.dataLayer) {
-            // Comprobar si el objeto es procesable y no tiene ya nuestro timestamp
-            if (typeof obj !== 'undefined' && obj !== null && typeof obj._captureTimestamp === 'undefined') {
-                try {
-                    // Clonar objeto para evitar modificar el original
-                    const clone = JSON.parse(JSON.stringify(obj));
-                    clone._captureTimestamp = initialTimestamp;
-                    window.capturedDataLayers.push(clone);
-                    addedFromInitial++;
-                } catch (e) {
-                    console.error('Error cloning initial DL object:', e, obj);
-                    // No detener el script por un objeto mal formado
-                }
-            }
-        }
-        if (addedFromInitial > 0) {
-            console.log('Processed ' + addedFromInitial + ' initial items.');
-            initialItemsProcessed = true;
-        }
-    } else {
-         console.log('window.dataLayer is not an array or is empty. Skipping initial processing.');
-    }
 
-    // Guardar en LS si se procesaron items iniciales
-    if (initialItemsProcessed) {
-        try {
-            localStorage.setItem(LS_KEY, JSON.stringify(window.capturedDataLayers));
-        } catch (e) {
-            console.error('Error saving initial DLs to LS:', e);
-        }
-    }
+def _mark_session_error(session_pk, reason: str) -> None:
+    """Marca la sesión como ERROR salvo que ya esté COMPLETED o ERROR."""
+    try:
+        with transaction.atomic():
+            updated_count = Session.objects.filter(pk=session_pk) \
+                                 .exclude(status__in=[Session.STATUS_COMPLETED, Session.STATUS_ERROR]) \
+                                 .update(status=Session.STATUS_ERROR, updated_at=timezone.now())
+        if updated_count > 0:
+            logger.info(f"Session {session_pk}: Estado actualizado a ERROR ({reason}).")
+            broadcast_session_status(session_pk)
+            dispatch_queued_sessions.delay() # Posible slot liberado
+        else:
+            logger.info(f"Session {session_pk}: Estado no actualizado a ERROR (ya era COMPLETED o ERROR).")
+    except Exception as db_err:
+        logger.error(f"Session {session_pk}: Error DB al marcar ERROR ({reason}): {db_err}")
+
+
+def _session_hub(session) -> str:
+    """Hub WebDriver de la sesión (las sesiones anteriores a los multi-hub usan el primero)."""
+    return session.webdriver_url or settings.WEBDRIVER_HUB_URLS[0]
+
+
+def _close_remote_session(session_pk, selenium_session_id, hub_url) -> None:
+    """Cierra la sesión remota de una sesión de la app que terminó con error."""
+    if not selenium_session_id:
+        return
+    try:
+        attach_driver(hub_url, selenium_session_id).quit()
+        logger.info(f"Session {session_pk}: Sesión Selenium {selenium_session_id} cerrada.")
+    except Exception as quit_exc:
+        logger.warning(f"Session {session_pk}: No se pudo cerrar la sesión Selenium {selenium_session_id}: {quit_exc}")
 
-    // Guardar referencia al push original SOLO si es una función
-    const originalPush = typeof window.dataLayer.push === 'function' ? window.dataLayer.push : null;
-
-    // Sobrescribir dataLayer.push
-    window.dataLayer.push = function(...args) {
-        const timestamp = Date.now();
-        let itemsPushedCount = 0;
-        // Asegurar que window.capturedDataLayers siga siendo un array
-        if (!Array.isArray(window.capturedDataLayers)) {
-            console.warn('window.capturedDataLayers was not an array during push. Re-initializing.');
-            window.capturedDataLayers = [];
-        }
 
-        args.forEach(obj => {
-            if (typeof obj !== 'undefined' && obj !== null) {
-                try {
-                    const clone = JSON.parse(JSON.stringify(obj));
-                    clone._captureTimestamp = timestamp;
-                    window.capturedDataLayers.push(clone);
-                    itemsPushedCount++;
-                } catch (e) {
-                    console.error('Error cloning/pushing DL object:', e, obj);
-                }
-            }
-        });
-
-        // Guardar en LS después de cada push exitoso
-        if (itemsPushedCount > 0) {
-            try {
-                localStorage.setItem(LS_KEY, JSON.stringify(window.capturedDataLayers));
-            } catch (e) {
-                console.error('Error saving pushed DLs to LS:', e);
-            }
-        }
+def _drain_captured_datalayers(session_pk, driver, cursor: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Copia a la BD (``CapturedEvent``) los DataLayers capturados en el navegador
+    desde el último drenado (``Session.capture_cursor``). Re-inyecta el script
+    si la página cambió.
 
-        console.log('dataLayer.push intercepted. Items pushed now:', itemsPushedCount, 'Total items:', window.capturedDataLayers.length);
-
-        // Llamar al push original SOLO si existía y era una función
-        if (originalPush) {
-             // Usar try-catch por si el push original falla o tiene efectos secundarios inesperados
-             try {
-                return originalPush.apply(window.dataLayer, args);
-             } catch(pushErr) {
-                 console.error("Error calling original dataLayer.push:", pushErr);
-                 // Decidir si retornar algo o no en caso de error
-             }
-        }
-        // Si no había push original, no retornamos nada explícito (o retornamos undefined)
-    };
+    Args:
+        cursor: Cursor conocido por el llamador (heartbeat); si es None se lee de la BD.
 
-    console.log('DataLayer capture script injected successfully. Current total items:', window.capturedDataLayers.length);
-})();
-"""
+    Returns:
+        (número de items nuevos guardados, cursor tras el drenado).
+    """
+    if cursor is None:
+        cursor = Session.objects.filter(pk=session_pk).values_list("capture_cursor", flat=True).first() or 0
+    drained = driver.execute_script(JS_DRAIN_DATALAYERS, cursor)
+    if drained is None:
+        # Página nueva: el script se carga de nuevo desde localStorage (mismo origen)
+        logger.info(f"Session {session_pk}: Script de captura ausente. Re-inyectando...")
+        driver.execute_script(JS_CAPTURE_DATALAYER)
+        drained = driver.execute_script(JS_DRAIN_DATALAYERS, cursor)
+    if not isinstance(drained, dict):
+        logger.warning(f"Session {session_pk}: Drenado devolvió {type(drained)}. Se ignora.")
+        return 0, cursor
+
+    total = drained.get("total") or 0
+    new_items = drained.get("items") or []
+    if total < cursor:
+        # Otro origen (otro localStorage): el array empezó de cero. La deduplicación
+        # de la validación absorbe posibles repeticiones.
+        new_items = driver.execute_script(JS_DRAIN_DATALAYERS, 0).get("items") or []
+    if not new_items and total == cursor:
+        return 0, cursor
+
+    with transaction.atomic():
+        session = Session.objects.select_for_update().only("capture_cursor").get(pk=session_pk)
+        if session.capture_cursor != cursor:
+            # Otro drenado concurrente ya avanzó el cursor: descartar este lote
+            logger.debug(f"Session {session_pk}: Cursor cambió durante el drenado. Lote descartado.")
+            return 0, session.capture_cursor
+        # Solo se insertan los nuevos: no se reescribe lo ya capturado
+        append_captured_events(session_pk, new_items)
+        session.capture_cursor = total
+        session.save(update_fields=["capture_cursor", "updated_at"])
+    logger.info(f"Session {session_pk}: {len(new_items)} DataLayers drenados (cursor {cursor} -> {total}).")
+    _publish_live_datalayers(session_pk, new_items)
+    return len(new_items), total
+
+
+def _get_live_schema(session_pk) -> dict:
+    """Schema estructurado para el indicador en vivo, cacheado por proceso."""
+    schema = _live_schema_cache.get(session_pk)
+    if schema is None:
+        reference = Session.objects.filter(pk=session_pk).values_list("reference_schema", flat=True).first()
+        try:
+            schema = SchemaBuilder(reference_datalayers=reference).build_schema() if isinstance(reference, list) else {}
+        except Exception as e:
+            logger.warning(f"Session {session_pk}: No se pudo construir el schema en vivo: {e}")
+            schema = {}
+        _live_schema_cache[session_pk] = schema
+        while len(_live_schema_cache) > LIVE_SCHEMA_CACHE_SIZE:
+            _live_schema_cache.popitem(last=False)
+    return schema
+
+
+def _publish_live_datalayers(session_pk, new_items) -> None:
+    """Envía el lote drenado (con indicador de coincidencia) a la página de la sesión."""
+    if not new_items:
+        return
+    try:
+        events = build_live_datalayer_events(new_items, _get_live_schema(session_pk))
+    except Exception as e:
+        logger.warning(f"Session {session_pk}: Error anotando DataLayers en vivo: {e}")
+        return
+    send_session_event(session_pk, "datalayer.batch", {"events": events})
 
-# --- Función Auxiliar VNC (sin cambios) ---
-def get_vnc_url(port: int = 7900, password: str = VNC_PASSWORD) -> str:
-    logger.info("Generando URL VNC apuntando a /vnc.html en localhost:%s", port)
-    return f"http://localhost:{port}/vnc.html?password={password}"
+
+def _drain_network_hits(session_pk, driver) -> int:
+    """
+    Guarda las peticiones de Google Analytics del log de red desde el último
+    drenado (filas ``NetworkHit``). El total por sesión está acotado por
+    ``NETWORK_HITS_MAX_BUFFER``; la decodificación se hace después, en la
+    validación (cola CPU).
+
+    Returns:
+        Número de peticiones nuevas guardadas.
+    """
+    hits = extract_analytics_requests(read_performance_log(driver))
+    if not hits:
+        return 0
+    with transaction.atomic():
+        # Bloqueo de la fila de sesión solo para serializar ``sequence`` entre drenados
+        Session.objects.select_for_update().only("pk").get(pk=session_pk)
+        accepted = append_network_hits(session_pk, hits, settings.NETWORK_HITS_MAX_BUFFER)
+    dropped = len(hits) - accepted
+    if dropped:
+        logger.warning(f"Session {session_pk}: Buffer de hits de red lleno. {dropped} hits descartados.")
+    logger.info(f"Session {session_pk}: {accepted} hits de GA drenados del log de red.")
+    return accepted
 
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=10)
-def run_selenium_validation(self, session_pk):
+def provision_browser_session(self, session_pk):
     """
-    Tarea Celery: Crea sesión WebDriver, espera interacción VNC, recupera datos,
-    valida, genera reporte y guarda resultados.
+    Tarea Celery (1/5): Obtiene un navegador del pool, navega a la URL, inyecta el
+    script de captura y deja la sesión en WAITING_USER. El navegador queda vivo en
+    el grid (``selenium_session_id``) y el worker se libera.
     """
     logger.info(
-        f"TASK run_selenium_validation: Iniciando para Session PK: {session_pk}"
+        f"TASK provision_browser_session: Iniciando para Session PK: {session_pk}"
     )
-    session = None  # Asegurar que session se define antes del try
-    driver = None   # Inicializar driver a None
-
+    driver = None
+    browser_pool = None
     try:
         # --- Obtener sesión y marcar como iniciando ---
         with transaction.atomic():
-            session = Session.objects.select_for_update().get(pk=session_pk)
-            if session.status not in [Session.STATUS_PENDING, Session.STATUS_ERROR]:
+            session = Session.objects.select_for_update().metadata().get(pk=session_pk)
+            # Solo PENDING: una sesión en ERROR ya liberó su slot (puede estar ocupado por otra)
+            if session.status != Session.STATUS_PENDING:
                 logger.warning(
                     f"Session {session_pk}: Tarea no iniciada (estado: {session.status}). Abortando."
                 )
@@ -211,33 +254,20 @@ def run_selenium_validation(self, session_pk):
             session.updated_at = timezone.now() # Actualizar timestamp
             session.save(update_fields=["status", "updated_at"])
         logger.info(f"Session {session_pk}: Estado actualizado a STARTING.")
+        broadcast_session_status(session_pk)
 
-        # --- Crear y controlar sesión usando webdriver.Remote ---
+        # --- Obtener sesión WebDriver del pool de sesiones precalentadas ---
         logger.info(
-            f"Session {session_pk}: Creando sesión remota vía webdriver.Remote..."
-        )
-        command_executor_url = settings.SELENOID_URL # Usa la URL del standalone-chrome ahora
-        if not command_executor_url:
-            # Considera usar logger.critical o similar si es un error fatal de configuración
-            logger.error("SELENOID_URL (WebDriver URL) no definido en settings.")
-            raise ValueError("SELENOID_URL (WebDriver URL) no definido en settings.")
-
-        options = ChromeOptions()
-        options.add_argument("--window-size=1280,1024")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        # options.add_argument("--disable-gpu") # Descomentar si hay problemas VNC
-        # Establecer timeouts es buena práctica
-        options.timeouts = {"implicit": 0, "pageLoad": 300000, "script": 30000} # en milisegundos
-
-        # Inicializar driver usando webdriver.Remote
-        driver = webdriver.Remote(
-            command_executor=command_executor_url, options=options, keep_alive=True
+            f"Session {session_pk}: Obteniendo sesión remota del pool de navegadores..."
         )
+        # Hub sano menos cargado; el navegador sale del pool de ese hub
+        hub_url = select_hub()
+        browser_pool = get_browser_pool(hub_url)
+        driver = browser_pool.acquire()
 
         selenium_session_id = driver.session_id
         logger.info(
-            f"Session {session_pk}: Sesión Selenium {selenium_session_id} creada."
+            f"Session {session_pk}: Sesión Selenium {selenium_session_id} asignada."
         )
 
         # Generar URL VNC
@@ -245,247 +275,503 @@ def run_selenium_validation(self, session_pk):
 
         # --- Guardar datos y actualizar estado a WAITING_USER ---
         with transaction.atomic():
-            # Re-obtener por si acaso, aunque select_for_update la bloqueó antes
-            session = Session.objects.select_for_update().get(pk=session_pk)
+            session = Session.objects.select_for_update().metadata().get(pk=session_pk)
             session.selenium_session_id = selenium_session_id
+            session.webdriver_url = hub_url
             session.vnc_url = vnc_url
+            session.capture_cursor = 0
+            session.network_hits_dropped = 0
+            session.last_heartbeat_at = timezone.now()
             session.status = Session.STATUS_WAITING_USER
             session.updated_at = timezone.now()
             session.save(
-                update_fields=["status", "selenium_session_id", "vnc_url", "updated_at"]
+                update_fields=[
+                    "status", "selenium_session_id", "webdriver_url", "vnc_url", "capture_cursor",
+                    "network_hits_dropped", "last_heartbeat_at", "updated_at",
+                ]
             )
         logger.info(f"Session {session_pk}: Info VNC guardada. Estado actualizado a WAITING_USER.")
+        broadcast_session_status(session_pk)
 
         # --- Control del Navegador: Navegar e Inyectar Script ---
         logger.info(f"Session {session_pk}: Navegando a {session.url}")
+        # Por debajo del soft_time_limit: una carga lenta falla como TimeoutException
+        driver.set_page_load_timeout(settings.PROVISION_PAGE_LOAD_TIMEOUT_SECONDS)
         driver.get(session.url)
         logger.info(f"Session {session_pk}: Navegación completada.")
 
         logger.info(f"Session {session_pk}: Inyectando script de captura...")
-        # Usar la constante JS_CAPTURE_DATALAYER definida a nivel de módulo
         driver.execute_script(JS_CAPTURE_DATALAYER)
         logger.info(f"Session {session_pk}: Script inyectado.")
 
-        # --- Bucle de Espera ---
-        logger.info(f"Session {session_pk}: Entrando en bucle de espera...")
-        while True:
-            session.refresh_from_db() # Consultar estado actual de la BD
-            if session.status == Session.STATUS_FINISH_REQUESTED:
-                logger.info(f"Session {session_pk}: Estado FINISH_REQUESTED detectado.")
-                break # Salir del bucle para procesar
-
-            # Verificar si el navegador/driver sigue vivo
-            try:
-                _ = driver.current_url # Intenta una operación simple
-            except (WebDriverException, NoSuchWindowException) as wd_exc:
-                logger.error(
-                    f"Session {session_pk}: Navegador remoto cerrado inesperadamente durante espera: {wd_exc}",
-                    exc_info=False, # No necesitamos el traceback completo aquí generalmente
-                )
-                # Marcar como error y propagar para salir y limpiar
-                try: # Anidar try para asegurar que el fallo de DB no oculte el error original
-                    with transaction.atomic():
-                        session_err = Session.objects.select_for_update().get(pk=session_pk)
-                        session_err.status = Session.STATUS_ERROR
-                        session_err.updated_at = timezone.now()
-                        # Guardar mensaje de error si tienes un campo para ello
-                        # session_err.error_message = "Navegador remoto cerrado inesperadamente"
-                        session_err.save(update_fields=["status", "updated_at"]) # Añadir error_message si existe
-                except Exception as db_sub_err:
-                    logger.error(f"Session {session_pk}: Error DB al intentar marcar ERROR por cierre inesperado: {db_sub_err}")
-                # Propagar el error original para que el try/except exterior lo maneje
-                raise RuntimeError("Navegador remoto cerrado inesperadamente") from wd_exc
-
-            # Esperar antes de volver a checkear el estado en la BD
-            time.sleep(STATUS_CHECK_INTERVAL_SECONDS)
-
-        # --- INICIO: PASO 8 - Lógica de Procesamiento ---
-        logger.info(f"Session {session_pk}: Bucle finalizado. Iniciando procesamiento final...")
-
-        # 8.1. Actualizar estado a Procesando
+        # El navegador pertenece ahora a la sesión de la app: soltarlo sin cerrarlo
+        browser_pool.detach(driver)
+        driver = None
+
+        drain_browser_session.apply_async(
+            args=[session_pk],
+            kwargs={"selenium_session_id": selenium_session_id, "hub_url": hub_url, "capture_cursor": 0, "heartbeat_at": time.time()},
+            countdown=settings.DRAIN_HEARTBEAT_INTERVAL_SECONDS,
+        )
+        logger.info(f"Session {session_pk}: Heartbeat programado cada {settings.DRAIN_HEARTBEAT_INTERVAL_SECONDS}s.")
+
+    except (WebDriverException, TimeoutException, RuntimeError, ValueError, JavascriptException, AttributeError) as processing_exc:
+        logger.error(f"Session {session_pk}: Error aprovisionando navegador: {processing_exc}", exc_info=True)
+        _mark_session_error(session_pk, "error aprovisionando navegador")
+        # No reintentamos errores de lógica/procesamiento automáticamente aquí
+
+    except SoftTimeLimitExceeded:
+        # El driver (si lo hay) se descarta en finally antes de que llegue el time_limit duro
+        logger.error(f"Session {session_pk}: Tiempo límite agotado aprovisionando el navegador.")
+        _mark_session_error(session_pk, "tiempo límite aprovisionando navegador")
+
+    except Exception as exc:
+        logger.error(f"Session {session_pk}: Error GENERAL INESPERADO en provision_browser_session: {exc}", exc_info=True)
+        if self.request.retries >= self.max_retries:
+            logger.error(f"Session {session_pk}: MaxRetries alcanzado para error general.")
+            _mark_session_error(session_pk, "error general aprovisionando")
+            return
+        # Reintentar (posible fallo temporal de red, etc.) conservando el slot: la sesión
+        # vuelve a PENDING solo si sigue en PENDING/STARTING; si otro proceso ya la movió
+        # (p. ej. el reaper la marcó ERROR y liberó el slot) no se reintenta.
         with transaction.atomic():
-            session = Session.objects.select_for_update().get(pk=session_pk)
-            session.status = Session.STATUS_PROCESSING
-            session.updated_at = timezone.now()
-            session.save(update_fields=["status", "updated_at"])
-        logger.info(f"Session {session_pk}: Estado actualizado a PROCESSING.")
+            reverted = Session.objects.filter(pk=session_pk, status__in=[Session.STATUS_PENDING, Session.STATUS_STARTING]) \
+                                      .update(status=Session.STATUS_PENDING, updated_at=timezone.now())
+        if not reverted:
+            logger.warning(f"Session {session_pk}: La sesión ya no está aprovisionándose. No se reintenta.")
+            _mark_session_error(session_pk, "error general aprovisionando")
+            return
+        broadcast_session_status(session_pk)
+        raise self.retry(exc=exc)
 
-        # 8.2. Recuperar datos del navegador
-        captured_data_raw = []
-        try:
-            # Esperar un instante muy breve por si acaso algún evento final tarda en registrarse
-            time.sleep(0.5)
-            captured_data_raw = driver.execute_script("return window.capturedDataLayers;")
-            # Validar que sea una lista (puede ser null o undefined si hubo error JS)
-            if captured_data_raw is None or not isinstance(captured_data_raw, list):
-                 logger.warning(f"Session {session_pk}: window.capturedDataLayers devolvió {type(captured_data_raw)}. Se tratará como lista vacía.")
-                 captured_data_raw = []
-            logger.info(f"Session {session_pk}: Datos recuperados del navegador ({len(captured_data_raw)} items).")
-
-        except JavascriptException as js_exc:
-            logger.error(f"Session {session_pk}: Error ejecutando script JS para recuperar datos: {js_exc}")
-            # Considerar esto un error de sesión, ya que no tenemos los datos
-            raise RuntimeError("Fallo crítico al recuperar datos del navegador vía JS") from js_exc
-        except WebDriverException as wd_get_exc:
-             logger.error(f"Session {session_pk}: Error de WebDriver al intentar recuperar datos: {wd_get_exc}")
-             raise RuntimeError("Fallo de WebDriver al recuperar datos") from wd_get_exc
-
-        # --- 8.2b Usar SchemaBuilder ---
+    finally:
+        # Si el driver sigue asignado hubo un error: descartarlo en vez de devolverlo al pool
+        if driver:
+            logger.info(f"Session {session_pk}: Descartando driver Selenium en finally...")
+            browser_pool.discard(driver)
+
+
+@shared_task
+def drain_browser_session(session_pk, selenium_session_id=None, hub_url=None, capture_cursor=None, heartbeat_at=None):
+    """
+    Tarea Celery (2/5): Heartbeat corto mientras el usuario interactúa. Verifica
+    que el navegador siga vivo, drena los DataLayers nuevos a la BD y se
+    re-programa. Termina sola con la señal de finalización (Redis) o cuando la
+    sesión deja WAITING_USER.
+
+    El estado del heartbeat (sesión Selenium, hub, cursor y último
+    ``last_heartbeat_at`` escrito) viaja en los argumentos: un ciclo sin
+    capturas no lee ni escribe la fila de la sesión salvo que el heartbeat
+    vaya a quedar viejo (``DRAIN_HEARTBEAT_WRITE_SECONDS``).
+    """
+    if selenium_session_id is None:
+        # Primer ciclo sin estado (tareas encoladas antes de este formato): leerlo de la BD
+        session = Session.objects.filter(pk=session_pk).only(
+            "status", "selenium_session_id", "webdriver_url", "capture_cursor", "last_heartbeat_at"
+        ).first()
+        if session is None or session.status != Session.STATUS_WAITING_USER:
+            logger.info(f"Session {session_pk}: Heartbeat detenido (estado: {getattr(session, 'status', None)}).")
+            return
+        selenium_session_id = session.selenium_session_id
+        hub_url = _session_hub(session)
+        capture_cursor = session.capture_cursor
+        heartbeat_at = session.last_heartbeat_at.timestamp() if session.last_heartbeat_at else 0
+
+    finished = finish_signal_pending(session_pk)
+    if finished is None:
+        # Sin Redis: se vuelve a la consulta del estado en la BD
+        status = Session.objects.filter(pk=session_pk).values_list("status", flat=True).first()
+        finished = status != Session.STATUS_WAITING_USER
+    if finished:
+        logger.info(f"Session {session_pk}: Heartbeat detenido (finalización solicitada).")
+        return
+
+    driver = None
+    try:
+        driver = attach_driver(hub_url, selenium_session_id)
+        _ = driver.current_url # Verificar que el navegador sigue vivo
+        captured, capture_cursor = _drain_captured_datalayers(session_pk, driver, cursor=capture_cursor)
+        hits = _drain_network_hits(session_pk, driver)
+        now = time.time()
+        if captured or hits or now - (heartbeat_at or 0) >= settings.DRAIN_HEARTBEAT_WRITE_SECONDS:
+            # La escritura del heartbeat confirma también que la sesión sigue en WAITING_USER
+            updated = Session.objects.filter(pk=session_pk, status=Session.STATUS_WAITING_USER) \
+                                     .update(last_heartbeat_at=timezone.now())
+            if not updated:
+                logger.info(f"Session {session_pk}: Heartbeat detenido (la sesión dejó WAITING_USER).")
+                return
+            heartbeat_at = now
+    except (WebDriverException, NoSuchWindowException) as wd_exc:
+        logger.error(
+            f"Session {session_pk}: Navegador remoto cerrado inesperadamente durante espera: {wd_exc}",
+            exc_info=False,
+        )
+        _mark_session_error(session_pk, "navegador remoto cerrado inesperadamente")
+        return
+    except Exception as exc:
+        # Un fallo puntual del heartbeat no debe matar la sesión: se reintenta en el próximo ciclo
+        logger.error(f"Session {session_pk}: Error en heartbeat: {exc}", exc_info=True)
+    finally:
+        if driver:
+            detach_driver(driver)
+
+    drain_browser_session.apply_async(
+        args=[session_pk],
+        kwargs={"selenium_session_id": selenium_session_id, "hub_url": hub_url, "capture_cursor": capture_cursor, "heartbeat_at": heartbeat_at},
+        countdown=settings.DRAIN_HEARTBEAT_INTERVAL_SECONDS,
+    )
+
+
+@shared_task
+def finalize_browser_session(session_pk):
+    """
+    Tarea Celery (3/5): Tras la solicitud de finalización, pasa la sesión a
+    PROCESSING, hace el drenado final, devuelve el navegador al pool y encola
+    la validación.
+    """
+    logger.info(f"TASK finalize_browser_session: Iniciando para Session PK: {session_pk}")
+    with transaction.atomic():
+        session = Session.objects.select_for_update().only("status", "selenium_session_id", "webdriver_url").get(pk=session_pk)
+        if session.status != Session.STATUS_FINISH_REQUESTED:
+            logger.warning(f"Session {session_pk}: Finalización ignorada (estado: {session.status}).")
+            return
+        session.status = Session.STATUS_PROCESSING
+        session.save(update_fields=["status", "updated_at"])
+    logger.info(f"Session {session_pk}: Estado actualizado a PROCESSING.")
+    broadcast_session_status(session_pk)
+
+    driver = None
+    try:
+        driver = attach_driver(_session_hub(session), session.selenium_session_id)
+        # Esperar un instante muy breve por si algún evento final tarda en registrarse
+        time.sleep(0.5)
+        _drain_captured_datalayers(session_pk, driver)
+        _drain_network_hits(session_pk, driver)
+    except (WebDriverException, JavascriptException, ValueError) as wd_get_exc:
+        logger.error(f"Session {session_pk}: Error de WebDriver en el drenado final: {wd_get_exc}")
+        _mark_session_error(session_pk, "fallo al recuperar datos del navegador")
+        if driver:
+            _close_remote_session(session_pk, session.selenium_session_id, _session_hub(session))
+            detach_driver(driver)
+        return
+
+    # El navegador ya no se necesita: devolverlo al pool (reseteado) antes de validar
+    get_browser_pool(_session_hub(session)).release(driver)
+    _live_schema_cache.pop(session_pk, None)
+    # Slot liberado: dar paso a la siguiente sesión en cola
+    dispatch_queued_sessions.delay()
+    validate_session_results.delay(session_pk)
+
+
+@shared_task
+def validate_session_results(session_pk):
+    """
+    Tarea Celery (4/5): Construye el schema estructurado, valida los DataLayers
+    capturados y guarda ``validation_results`` (y su hash). Encola el render
+    del reporte; con ``REPORT_RENDER_ON_DEMAND`` marca ya la sesión COMPLETED.
+    """
+    logger.info(f"TASK validate_session_results: Iniciando para Session PK: {session_pk}")
+    try:
+        session = Session.objects.defer("validation_results", "captured_data", "captured_network_hits").get(pk=session_pk)
+        captured_data_raw = load_captured_data(session)
+        logger.info(f"Session {session_pk}: {len(captured_data_raw)} DataLayers capturados a validar.")
+
+        # --- Usar SchemaBuilder ---
         logger.info(f"Session {session_pk}: Construyendo schema estructurado desde la referencia...")
-        structured_schema = None # Inicializar
         # Verificar que la entrada guardada sea una lista, como se espera ahora
         if not isinstance(session.reference_schema, list):
             logger.error(f"Session {session_pk}: El JSON de referencia guardado no es una lista (tipo: {type(session.reference_schema)}). No se puede construir el schema.")
             raise ValueError("El JSON de referencia proporcionado no es una lista válida.")
 
         try:
-            # Crear el schema estructurado usando SchemaBuilder
             builder = SchemaBuilder(reference_datalayers=session.reference_schema)
-            structured_schema = builder.build_schema() # Este debería ser el diccionario esperado
-
-            # Verificar que el builder funcionó y devolvió un diccionario
+            structured_schema = builder.build_schema()
             if not structured_schema or not isinstance(structured_schema, dict):
                  logger.error(f"SchemaBuilder no generó un diccionario válido. Resultado: {structured_schema}")
                  raise RuntimeError("SchemaBuilder no pudo generar un schema estructurado válido.")
             logger.info(f"Session {session_pk}: Schema estructurado construido exitosamente.")
-
         except Exception as build_exc:
              logger.exception(f"Session {session_pk}: Error durante la construcción del schema con SchemaBuilder: {build_exc}")
              raise RuntimeError("Error construyendo el schema de validación") from build_exc
-        # --- Fin Uso SchemaBuilder ---
 
-
-        # 8.3. Procesar Datos y Validar (Usando el schema ESTRUCTURADO)
+        # --- Procesar Datos y Validar (Usando el schema ESTRUCTURADO) ---
         logger.info(f"Session {session_pk}: Iniciando validación lógica con schema construido...")
-        final_validation_results = {} # Inicializar
         try:
-            # AHORA pasamos structured_schema a las funciones de validación
-            # Nota: Ajusta si tus funciones devuelven/necesitan algo diferente
             validation_details = generate_validation_details(captured_data_raw, structured_schema)
             comparison_results = compare_captured_with_reference(validation_details, structured_schema)
             summary_results = calculate_summary(validation_details, comparison_results)
 
+            # Hits de red: mismo matcher, sección de cobertura separada
+            # Solo los recuentos y la comparación: los hits crudos quedan en NetworkHit
+            network_hits = load_network_hits(session)
+            network_events = decode_analytics_hits(network_hits)
+            network_results = {
+                "hits_count": len(network_hits),
+                "hits_dropped": session.network_hits_dropped,
+                "events_count": len(network_events),
+                "comparison": compare_captured_with_reference(network_events, structured_schema),
+            }
+
             # Combinar resultados en un solo JSON para guardar
             final_validation_results = {
                 "summary": summary_results,
                 "comparison": comparison_results,
                 "details": validation_details,
+                "details_count": len(validation_details),
+                "references": build_reference_index(structured_schema), # Propiedades por matched_section_id
+                "network": network_results,
                 "processing_timestamp": timezone.now().isoformat(),
                 "validated_url": session.url,
-                # "is_overall_valid": summary_results.get('is_valid', False) # Opcional
             }
             logger.info(f"Session {session_pk}: Validación lógica completada.")
-
         except Exception as val_exc:
             logger.exception(f"Session {session_pk}: Error durante la ejecución de validation_logic: {val_exc}")
             raise RuntimeError("Error durante el proceso de validación de datos") from val_exc
 
-        # 8.4. Generar Reporte HTML
-        logger.info(f"Session {session_pk}: Generando reporte HTML...")
-        report_filepath_temp = None # Para asegurar limpieza en caso de error
-        try:
-            report_generator = ReportGenerator(config=REPORT_CONFIG)
-            report_filepath_temp = report_generator.generate_html_report(
-                validation_results=final_validation_results,
-                url=session.url,
-                schema=structured_schema # Pasar el schema construido
+        fields = {
+            # El JSON queda pequeño: los detalles van a ValidationDetail
+            "validation_results": {k: v for k, v in final_validation_results.items() if k != "details"},
+            "results_hash": results_hash(final_validation_results),
+            "updated_at": timezone.now(),
+        }
+        if settings.REPORT_RENDER_ON_DEMAND:
+            # El HTML se renderiza al pedirlo: la sesión queda completada ya
+            fields["status"] = Session.STATUS_COMPLETED
+        with transaction.atomic():
+            details_count = save_validation_details(session_pk, validation_details)
+            Session.objects.filter(pk=session_pk).update(**fields)
+        logger.info(f"Session {session_pk}: Resultados de validación guardados ({details_count} detalles).")
+        if settings.REPORT_RENDER_ON_DEMAND:
+            broadcast_session_status(session_pk)
+
+    except Exception as exc:
+        logger.error(f"Session {session_pk}: Error validando resultados: {exc}", exc_info=True)
+        _mark_session_error(session_pk, "error de validación")
+        return
+
+    render_session_report.delay(session_pk)
+
+
+@shared_task
+def render_session_report(session_pk):
+    """
+    Tarea Celery (5/5): Genera el JSON de resultados y el CSV de errores
+    (``report_json_file``/``report_csv_file``). Sin ``REPORT_RENDER_ON_DEMAND``
+    también renderiza el reporte HTML a ``report_file`` y marca la sesión como
+    COMPLETED; con él, la sesión ya está completada y el HTML se renderiza en la
+    primera petición (``session_report_render_view``).
+    """
+    logger.info(f"TASK render_session_report: Iniciando para Session PK: {session_pk}")
+    on_demand = settings.REPORT_RENDER_ON_DEMAND
+    saved_names = [] # Archivos ya guardados, para borrarlos si algo falla después
+    report_storage = get_report_storage()
+    try:
+        session = Session.objects.only("url", "results_hash").get(pk=session_pk)
+
+        logger.info(f"Session {session_pk}: Generando reportes...")
+        report_generator = ReportGenerator(config=REPORT_CONFIG)
+        validation_results = load_validation_results(session_pk)
+        report_name = session.report_file.field.generate_filename(
+            session, report_generator.generate_filename(session.url, "html")
+        )
+        lazy_manifest = None
+        if not on_demand:
+            render_key = report_render_key(session.results_hash or results_hash(validation_results), report_template_version())
+            lazy_manifest = store_report_shards(
+                session_pk, render_key, report_generator, validation_results, report_storage, saved_names
+            )
+        # El HTML se renderiza en un hilo mientras JSON y CSV se escriben en una
+        # sola pasada sobre los detalles (la compresión libera el GIL)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            html_future = None if on_demand else executor.submit(
+                store_report_html,
+                report_generator, validation_results, session.url, lazy_manifest, report_storage, report_name, saved_names,
             )
+            json_name, csv_name = store_report_data(
+                report_generator,
+                validation_results,
+                report_storage,
+                json_name=report_name.rsplit(".", 1)[0] + ".json",
+                csv_name=report_name.rsplit(".", 1)[0] + ".csv",
+                saved_names=saved_names,
+            )
+            stored_name = html_future.result() if html_future is not None else None
+        logger.info(f"Session {session_pk}: Reportes guardados en el storage: {', '.join(saved_names)}.")
 
-            if not report_filepath_temp or "(ERROR)" in report_filepath_temp:
-                raise RuntimeError(f"Fallo al generar el reporte HTML: {report_filepath_temp}")
-
-            logger.info(f"Session {session_pk}: Reporte HTML generado temporalmente en {report_filepath_temp}.")
-
-            # 8.5. Guardar Resultados y Reporte en el Modelo Session
-            logger.info(f"Session {session_pk}: Guardando resultados y reporte en la base de datos...")
-            with transaction.atomic():
-                session_to_save = Session.objects.select_for_update().get(pk=session_pk)
-                session_to_save.captured_data = captured_data_raw
-                session_to_save.validation_results = final_validation_results
-
-                report_filename = Path(report_filepath_temp).name
-                try:
-                    with open(report_filepath_temp, 'rb') as f_report:
-                        # Usar save=False y luego guardar el modelo una sola vez
-                        session_to_save.report_file.save(report_filename, ContentFile(f_report.read()), save=False)
-                    logger.info(f"Session {session_pk}: Contenido del reporte preparado para guardar como {report_filename}.")
-                except Exception as file_err:
-                     logger.error(f"Session {session_pk}: Error leyendo o preparando archivo de reporte para modelo: {file_err}", exc_info=True)
-                     raise RuntimeError("Fallo al leer/preparar el archivo de reporte") from file_err
-
-                session_to_save.status = Session.STATUS_COMPLETED # Marcar como completada
-                session_to_save.updated_at = timezone.now()
-                # Guardar todos los campos actualizados
-                session_to_save.save(update_fields=['captured_data', 'validation_results', 'report_file', 'status', 'updated_at'])
-
-            logger.info(f"Session {session_pk}: Resultados y reporte guardados. Estado actualizado a COMPLETED.")
-
-        except Exception as report_save_exc:
-             logger.exception(f"Session {session_pk}: Error generando o guardando reporte/resultados: {report_save_exc}")
-             raise RuntimeError("Fallo procesando/guardando resultados o reporte") from report_save_exc
-        finally:
-            # Limpiar archivo temporal si existe
-            if report_filepath_temp and os.path.exists(str(report_filepath_temp)): # os.path.exists necesita string
-                 try:
-                      os.remove(str(report_filepath_temp))
-                      logger.debug(f"Archivo temporal {report_filepath_temp} eliminado.")
-                 except OSError as rm_err:
-                      logger.warning(f"No se pudo eliminar el archivo temporal {report_filepath_temp}: {rm_err}")
-        # --- FIN: PASO 8 ---
-
-    # --- Bloque except principal para errores durante el procesamiento ---
-    except (WebDriverException, TimeoutException, RuntimeError, ValueError, JavascriptException, AttributeError) as processing_exc:
-        logger.error(f"Session {session_pk}: Error durante ejecución de tarea o procesamiento: {processing_exc}", exc_info=True)
-        try:
-            with transaction.atomic():
-                # Actualizar estado a ERROR solo si no está ya COMPLETED o ERROR
-                updated_count = Session.objects.filter(pk=session_pk) \
-                                     .exclude(status__in=[Session.STATUS_COMPLETED, Session.STATUS_ERROR]) \
-                                     .update(status=Session.STATUS_ERROR, updated_at=timezone.now())
-                if updated_count > 0:
-                    logger.info(f"Session {session_pk}: Estado actualizado a ERROR debido a excepción.")
-                else:
-                    logger.info(f"Session {session_pk}: Estado no actualizado a ERROR (ya era COMPLETED o ERROR).")
-        except Exception as db_err_on_err:
-             logger.error(f"Session {session_pk}: Error DB al intentar marcar ERROR final: {db_err_on_err}")
-        # No reintentamos errores de lógica/procesamiento automáticamente aquí
+        # Fuera de la escritura de los archivos: un único UPDATE, sin bloquear la fila durante la E/S
+        fields = {"report_json_file": json_name, "report_csv_file": csv_name, "updated_at": timezone.now()}
+        if not on_demand:
+            fields.update(report_file=stored_name, status=Session.STATUS_COMPLETED)
+        updated = Session.objects.filter(pk=session_pk).update(**fields)
+        if not updated:
+            raise Session.DoesNotExist(f"La sesión {session_pk} ya no existe.")
 
-    # --- Bloque except para errores muy generales/inesperados ---
+        logger.info(f"Session {session_pk}: Reportes guardados{'' if on_demand else '. Estado actualizado a COMPLETED'}.")
+        broadcast_session_status(session_pk)
+
+    except Exception as report_save_exc:
+        logger.exception(f"Session {session_pk}: Error generando o guardando reporte: {report_save_exc}")
+        delete_stored_files(report_storage, saved_names, session_pk)
+        if not on_demand: # Bajo demanda el reporte HTML sigue disponible
+            _mark_session_error(session_pk, "fallo generando/guardando el reporte")
+
+
+@shared_task
+def render_report_on_demand(session_pk, results_hash):
+    """
+    Tarea Celery (cola CPU): renderiza el reporte HTML que pidió
+    ``session_report_render_view`` y libera su cerrojo al terminar (también si
+    falla: la siguiente petición lo vuelve a encolar).
+    """
+    try:
+        get_or_render_report(session_pk, results_hash)
     except Exception as exc:
-        logger.error(f"Session {session_pk}: Error GENERAL INESPERADO en run_selenium_validation: {exc}", exc_info=True)
-        # Marcar como ERROR (con la lógica mejorada)
-        try:
-             with transaction.atomic():
-                 updated_count = Session.objects.filter(pk=session_pk) \
-                                     .exclude(status__in=[Session.STATUS_COMPLETED, Session.STATUS_ERROR]) \
-                                     .update(status=Session.STATUS_ERROR, updated_at=timezone.now())
-                 if updated_count > 0:
-                     logger.info(f"Session {session_pk}: Estado actualizado a ERROR debido a excepción general.")
-                 else:
-                    logger.info(f"Session {session_pk}: Estado no actualizado a ERROR (ya era COMPLETED o ERROR).")
-        except Exception as db_err:
-             logger.error(f"Session {session_pk}: Error DB al marcar ERROR general: {db_err}")
-
-        # Considerar reintentar para errores genéricos (podría ser fallo temporal de red, etc.)
+        logger.exception(f"Session {session_pk}: Error renderizando el reporte bajo demanda: {exc}")
+    finally:
+        release_render_lock(session_pk, results_hash)
+
+
+# Estados en los que una sesión de la app puede tener un navegador asignado
+ACTIVE_BROWSER_STATUSES = [
+    Session.STATUS_STARTING,
+    Session.STATUS_WAITING_USER,
+    Session.STATUS_FINISH_REQUESTED,
+    Session.STATUS_PROCESSING,
+]
+
+
+def _reap_stale_sessions(now) -> int:
+    """
+    Marca como ERROR las sesiones que llevan demasiado tiempo sin cambios en su
+    estado (o sin heartbeat en WAITING_USER) y cierra sus navegadores.
+    La actualización condicional evita pisar una transición concurrente.
+    """
+    candidates = []
+    for status, timeout_seconds in settings.REAPER_IDLE_TIMEOUTS.items():
+        stale_filter = {"status": status, "updated_at__lt": now - timedelta(seconds=timeout_seconds)}
+        candidates += [(pk, sid, hub, stale_filter) for pk, sid, hub in
+                       Session.objects.filter(**stale_filter).values_list("pk", "selenium_session_id", "webdriver_url")]
+    heartbeat_filter = {
+        "status": Session.STATUS_WAITING_USER,
+        "last_heartbeat_at__lt": now - timedelta(seconds=settings.REAPER_HEARTBEAT_STALE_SECONDS),
+    }
+    candidates += [(pk, sid, hub, heartbeat_filter) for pk, sid, hub in
+                   Session.objects.filter(**heartbeat_filter).values_list("pk", "selenium_session_id", "webdriver_url")]
+
+    reaped = set()
+    for session_pk, selenium_session_id, hub_url, stale_filter in candidates:
+        if session_pk in reaped:
+            continue
+        if not Session.objects.filter(pk=session_pk, **stale_filter).update(status=Session.STATUS_ERROR, updated_at=now):
+            continue # Cambió de estado entre la consulta y la actualización
+        reaped.add(session_pk)
+        logger.warning(f"Reaper: Session {session_pk} inactiva en '{stale_filter['status']}'. Marcada como ERROR.")
+        if stale_filter["status"] == Session.STATUS_QUEUED:
+            admission.remove_from_queue(session_pk)
+        broadcast_session_status(session_pk)
+        if selenium_session_id:
+            delete_grid_session(hub_url or settings.WEBDRIVER_HUB_URLS[0], selenium_session_id)
+    return len(reaped)
+
+
+def _reap_orphaned_grid_sessions(now) -> int:
+    """
+    Cierra, en cada hub configurado, las sesiones del grid que no pertenecen a
+    ninguna sesión activa de la app, ni a un BrowserController registrado, ni
+    a un pool con latido reciente.
+    """
+    grid_sessions = {} # session_id -> (hub, info)
+    for hub_url in settings.WEBDRIVER_HUB_URLS:
         try:
-            # bind=True en @shared_task nos da 'self' para llamar a retry
-            raise self.retry(exc=exc)
-        except self.MaxRetriesExceededError:
-            logger.error(f"Session {session_pk}: MaxRetries alcanzado para error general.")
-        except Exception as retry_err: # Otros errores durante el reintento
-            logger.error(f"Session {session_pk}: Error durante el reintento: {retry_err}")
+            for selenium_session_id, info in fetch_grid_sessions(hub_url).items():
+                grid_sessions[selenium_session_id] = (hub_url, info)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"Reaper: No se pudo consultar el estado del hub {hub_url}: {e}")
+    if not grid_sessions:
+        return 0
+
+    owned = set(
+        Session.objects.filter(status__in=ACTIVE_BROWSER_STATUSES, selenium_session_id__isnull=False)
+        .values_list("selenium_session_id", flat=True)
+    )
+    try:
+        owned |= registered_selenium_session_ids()
+        redis_client = get_redis_client()
+        pool_cutoff = now.timestamp() - settings.REAPER_POOL_STALE_SECONDS
+        redis_client.zremrangebyscore(POOL_SESSIONS_KEY, "-inf", pool_cutoff)
+        redis_client.zremrangebyscore(POOL_IDLE_KEY, "-inf", pool_cutoff)
+        owned |= {sid.decode() for sid in redis_client.zrange(POOL_SESSIONS_KEY, 0, -1)}
+    except Exception as e:
+        # Sin los registros de Redis no se puede distinguir un navegador de pool de un huérfano
+        logger.error(f"Reaper: Registros de Redis no disponibles, se omite la limpieza del grid: {e}")
+        return 0
+
+    reaped = 0
+    for selenium_session_id, (hub_url, info) in grid_sessions.items():
+        if selenium_session_id in owned:
+            continue
+        started = info.get("start")
+        if started and (now - started).total_seconds() < settings.REAPER_ORPHAN_MIN_AGE_SECONDS:
+            continue # Puede estar aprovisionándose todavía
+        if delete_grid_session(hub_url, selenium_session_id):
+            reaped += 1
+            logger.warning(f"Reaper: Sesión huérfana {selenium_session_id} (hub {hub_url}, nodo {info.get('node')}) cerrada.")
+    return reaped
+
+
+@shared_task
+def reap_orphaned_browser_sessions():
+    """
+    Tarea periódica (Celery beat): aplica los timeouts de inactividad por estado
+    a las sesiones de la app y devuelve al grid los navegadores huérfanos.
+    """
+    now = timezone.now()
+    stale_count = _reap_stale_sessions(now)
+    orphan_count = _reap_orphaned_grid_sessions(now)
+    if stale_count or orphan_count:
+        dispatch_queued_sessions.delay()
+        logger.info(f"Reaper: {stale_count} sesiones marcadas como ERROR, {orphan_count} sesiones del grid cerradas.")
+    return {"stale_sessions": stale_count, "orphaned_grid_sessions": orphan_count}
 
-    # --- Bloque Finally para asegurar limpieza ---
+
+@shared_task
+def dispatch_queued_sessions():
+    """
+    Control de admisión: concede los slots libres de los hubs a las sesiones en
+    cola por orden de llegada y lanza su aprovisionamiento. Se ejecuta desde
+    Celery beat y en cuanto se crea una sesión o se libera un navegador.
+    """
+    if not admission.queue_length():
+        return 0
+    if not admission.acquire_dispatch_lock():
+        logger.debug("Admisión: Otro despachador en curso.")
+        return 0
+    admitted = 0
+    try:
+        # Suma de los hubs sanos (los caídos no aportan slots)
+        capacity = total_capacity(refresh=True)
+        if not capacity["total_slots"]:
+            logger.error("Admisión: Ningún hub WebDriver sano. No se admiten sesiones.")
+            return 0
+        admission.remember_total_slots(capacity["total_slots"])
+        free_slots = admission.available_slots(capacity)
+        while free_slots > 0:
+            session_pk = admission.pop_next_queued()
+            if session_pk is None:
+                break
+            if not Session.objects.filter(pk=session_pk, status=Session.STATUS_QUEUED).update(
+                status=Session.STATUS_PENDING, updated_at=timezone.now()
+            ):
+                continue # Caducó o se canceló mientras esperaba
+            provision_browser_session.delay(session_pk)
+            broadcast_session_status(session_pk)
+            admitted += 1
+            free_slots -= 1
+        if admitted:
+            logger.info(f"Admisión: {admitted} sesiones admitidas ({capacity['total_slots']} slots en el grid).")
+            # Las sesiones que siguen en cola avanzan de posición
+            for queued_pk in admission.queued_session_ids():
+                broadcast_session_status(queued_pk)
     finally:
-        # Cerrar el driver de Selenium si se llegó a crear
-        if driver:
-            logger.info(f"Session {session_pk}: Cerrando driver Selenium en finally...")
-            try:
-                driver.quit()
-                logger.info(f"Session {session_pk}: Driver Selenium cerrado.")
-            except Exception as quit_exc:
-                # Loggear error al cerrar, pero no relanzar para no ocultar error original si hubo uno
-                logger.error(
-                    f"Session {session_pk}: Error cerrando driver en finally: {quit_exc}",
-                    exc_info=False, # Podríamos poner True si queremos el traceback completo
-                )
+        admission.release_dispatch_lock()
+    return admitted
@@ -1,3 +1,1050 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from celery.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from markupsafe import escape
+from selenium.common.exceptions import WebDriverException
+
+from .consumers import SessionConsumer
+from .controllers import controller_registry, http_client
+from .controllers.browser_controller import BrowserController
+from .controllers.browser_pool import BrowserPool
+from .tasks import (
+    _drain_captured_datalayers,
+    _drain_network_hits,
+    _reap_orphaned_grid_sessions,
+    _reap_stale_sessions,
+    drain_browser_session,
+    provision_browser_session,
+    render_report_on_demand,
+    render_session_report,
+    validate_session_results,
+)
+from .models import SESSION_PAYLOAD_FIELDS, Session
+from .utils.report_generator import (
+    ReportGenerator,
+    get_report_environment,
+    report_render_key,
+    report_template_version,
+    results_hash,
+)
+from .utils.report_storage import RENDERED_REPORTS_DIR, get_or_render_report
+from .utils.admission import available_slots
+from .utils.webdriver_hubs import select_hub
+from .utils.precompressed import accepts_encoding
+from .utils.network_capture import decode_analytics_hits, extract_analytics_requests
+from .utils.result_store import load_network_hits, load_validation_results
+from .utils.validation_logic import align_reference, build_reference_index, generate_validation_details
+from .utils.session_events import invalidate_session_status
+
+
+def _bytes_read(captured_queries):
+    """Re-ejecuta los SELECT capturados y suma el tamaño de los valores devueltos."""
+    total = 0
+    with connection.cursor() as cursor:
+        for query in captured_queries:
+            sql = query["sql"]
+            if not sql.lstrip().upper().startswith("SELECT"):
+                continue
+            cursor.execute(sql.replace(" FOR UPDATE", ""))
+            total += sum(len(str(value)) for row in cursor.fetchall() for value in row)
+    return total
+
+
+TEST_SETTINGS = {
+    # Sin manifest de collectstatic ni Redis en tests
+    "STATICFILES_STORAGE": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    "CACHES": {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+}
+
+
+@override_settings(**TEST_SETTINGS)
+class SessionMetadataReadPathTests(TestCase):
+    # Límite holgado para una fila sin blobs (UUID, URL, estado, fechas...)
+    MAX_METADATA_BYTES = 2048
+
+    def setUp(self):
+        cache.clear()
+        big_blob = [{"event": "GAEvent", "event_label": "x" * 500, "index": i} for i in range(500)]
+        self.session = Session.objects.create(
+            url="https://example.com/",
+            reference_schema=big_blob,
+            captured_data=big_blob,
+            captured_network_hits=big_blob,
+            validation_results={"details": big_blob},
+            status=Session.STATUS_WAITING_USER,
+        )
+
+    def assertMetadataOnly(self, captured):
+        for query in captured.captured_queries:
+            for field in SESSION_PAYLOAD_FIELDS:
+                self.assertNotIn(f'"{field}"', query["sql"])
+        self.assertLess(_bytes_read(captured.captured_queries), self.MAX_METADATA_BYTES)
+
+    def test_status_endpoint(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse("get_session_status", args=[self.session.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status_code"], Session.STATUS_WAITING_USER)
+        self.assertEqual(len(captured), 1)
+        self.assertMetadataOnly(captured)
+
+    def test_session_page(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse("session_page", args=[self.session.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(captured), 1)
+        self.assertMetadataOnly(captured)
+
+    @mock.patch("core.views.finalize_browser_session")
+    def test_finish_endpoint(self, _finalize_task):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(reverse("finish_session", args=[self.session.pk]))
+        self.assertEqual(response.status_code, 200)
+        # SELECT ... FOR UPDATE + UPDATE (más savepoint/transacción según backend)
+        self.assertEqual(sum(1 for q in captured.captured_queries if q["sql"].startswith("SELECT")), 1)
+        self.assertMetadataOnly(captured)
+
+    def test_consumer_session_lookup(self):
+        with CaptureQueriesContext(connection) as captured:
+            session = async_to_sync(SessionConsumer().get_session_db)(str(self.session.pk))
+        self.assertEqual(session.url, "https://example.com/")
+        self.assertEqual(len(captured), 1)
+        self.assertMetadataOnly(captured)
+
+
+@override_settings(**TEST_SETTINGS)
+class QueuedSessionStatusTests(TestCase):
+    def test_queue_progress_changes_the_etag(self):
+        session = Session.objects.create(url="https://example.com/", status=Session.STATUS_QUEUED)
+        url = reverse("get_session_status", args=[session.pk])
+        cache.clear()
+        with mock.patch("core.utils.session_events.queue_info", return_value={"queue_position": 3, "eta_seconds": 600}):
+            first = self.client.get(url)
+        self.assertEqual(first.json()["queue_position"], 3)
+        self.assertNotIn("Last-Modified", first)
+        # La fila (y su caché) no cambian, pero la sesión avanzó en la cola
+        with mock.patch("core.utils.session_events.queue_info", return_value={"queue_position": 1, "eta_seconds": 300}):
+            second = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+            third = self.client.get(url, HTTP_IF_NONE_MATCH=second["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()["queue_position"], 1)
+        self.assertEqual(third.status_code, 304)
+
+
+@override_settings(**TEST_SETTINGS)
+class SessionStatusConditionalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.session = Session.objects.create(url="https://example.com/", status=Session.STATUS_WAITING_USER)
+        self.url = reverse("get_session_status", args=[self.session.pk])
+
+    def test_not_modified_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_transition_changes_etag(self):
+        first = self.client.get(self.url)
+        Session.objects.filter(pk=self.session.pk).update(status=Session.STATUS_PROCESSING)
+        invalidate_session_status(self.session.pk)
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()["status_code"], Session.STATUS_PROCESSING)
+
+
+@override_settings(**TEST_SETTINGS, REPORT_RENDER_ON_DEMAND=False)
+class ReportTemplateCacheTests(TestCase):
+    def test_generators_share_compiled_template(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            first = ReportGenerator(config={"paths": {"output": output_dir}})
+            second = ReportGenerator(config={"paths": {"output": output_dir}})
+            self.assertIs(first.jinja_env, get_report_environment())
+            self.assertIs(second.jinja_env, first.jinja_env)
+            report_path = second.generate_html_report({"details": [], "url": "https://example.com/"}, "https://example.com/")
+            self.assertNotIn("ERROR", report_path)
+            with open(report_path, encoding="utf-8") as f:
+                self.assertIn("https://example.com/", f.read())
+
+    def test_details_reference_sections_by_id(self):
+        properties = {"event": "GAEvent", "event_category": "home", "event_label": "{{label}}"}
+        schema = {"sections": [{"id": "datalayer_1", "title": "Home", "datalayer": {"properties": properties}}]}
+        captured = {"event_label": "banner", "event": "GAEvent", "event_category": "home"}
+        details = generate_validation_details([captured], schema)
+        self.assertEqual(details[0]["matched_section_id"], "datalayer_1")
+        self.assertNotIn("reference_data", details[0])
+        results = {"details": details, "references": build_reference_index(schema), "url": "https://example.com/"}
+
+        buffer = io.BytesIO()
+        ReportGenerator(config={"paths": {"output": tempfile.gettempdir()}}).write_html_report(
+            buffer, results, "https://example.com/"
+        )
+        # Referencia alineada al renderizar: claves en el orden del DataLayer capturado
+        aligned = json.dumps(align_reference(captured, properties), indent=2, ensure_ascii=False)
+        self.assertTrue(aligned.startswith('{\n  "event_label"'))
+        self.assertIn(str(escape(aligned)), buffer.getvalue().decode("utf-8"))
+
+    @mock.patch("core.tasks.broadcast_session_status")
+    def test_render_task_streams_report_into_storage(self, _broadcast):
+        session = Session.objects.create(
+            url="https://example.com/",
+            validation_results={"details": [], "url": "https://example.com/"},
+            status=Session.STATUS_PROCESSING,
+        )
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            render_session_report(session.pk)
+            session.refresh_from_db()
+            self.assertEqual(session.status, Session.STATUS_COMPLETED)
+            self.assertTrue(session.report_file.name.startswith("validation_reports/"))
+            self.assertTrue(session.report_file.name.endswith(".html.gz"))
+            with session.report_file.open("rb") as f:
+                self.assertIn(b"https://example.com/", gzip.decompress(f.read()))
+
+            report_url = self.client.get(reverse("get_session_status", args=[session.pk])).json()["report_url"]
+            self.assertTrue(report_url.endswith(".html"))
+            response = self.client.get(report_url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            self.assertIn("immutable", response["Cache-Control"])
+            self.assertEqual(response["Content-Disposition"], f'inline; filename="{report_url.rsplit("/", 1)[1]}"')
+            self.assertEqual(response["Vary"], "Accept-Encoding")
+            self.assertIn(b"https://example.com/", gzip.decompress(b"".join(response.streaming_content)))
+            # q=0 rechaza la codificación: se sirve descomprimido
+            response = self.client.get(report_url, HTTP_ACCEPT_ENCODING="br;q=0, gzip;q=0")
+            self.assertFalse(response.has_header("Content-Encoding"))
+            response = self.client.get(report_url)
+            self.assertFalse(response.has_header("Content-Encoding"))
+            self.assertIn(b"https://example.com/", b"".join(response.streaming_content))
+
+    @mock.patch("core.tasks.broadcast_session_status")
+    def test_render_task_stores_json_and_csv_artifacts(self, _broadcast):
+        results = {
+            "url": "https://example.com/",
+            "valid": False,
+            "details": [
+                {"datalayer_index": 0, "data": {"event": "GAEvent"}, "valid": True, "errors": [], "warnings": []},
+                {"datalayer_index": 1, "data": {"event": "GAEvent"}, "valid": False, "errors": ["falta 'ñ'"],
+                 "warnings": [], "matched_section": "Sección", "match_score": 0.9},
+            ],
+        }
+        session = Session.objects.create(url="https://example.com/", validation_results=results,
+                                         status=Session.STATUS_PROCESSING)
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            render_session_report(session.pk)
+            status = self.client.get(reverse("get_session_status", args=[session.pk])).json()
+            json_response = self.client.get(status["report_json_url"])
+            self.assertEqual(json.loads(b"".join(json_response.streaming_content)), results)
+            csv_response = self.client.get(status["report_csv_url"])
+            self.assertIn("attachment", csv_response["Content-Disposition"])
+            self.assertEqual(
+                b"".join(csv_response.streaming_content).decode("utf-8").splitlines(),
+                ["datalayer_index,matched_section,error_message", "2,Sección,falta 'ñ'"],
+            )
+
+
+class AcceptEncodingTests(SimpleTestCase):
+    def test_q_values_and_wildcard(self):
+        self.assertTrue(accepts_encoding("gzip, deflate, br", "br"))
+        self.assertFalse(accepts_encoding("gzip, br;q=0", "br"))
+        self.assertTrue(accepts_encoding("gzip;q=0.5", "gzip"))
+        self.assertFalse(accepts_encoding("gzip;q=0.000", "gzip"))
+        self.assertTrue(accepts_encoding("*", "br"))
+        self.assertFalse(accepts_encoding("*;q=0, gzip", "br"))
+        self.assertFalse(accepts_encoding("", "gzip"))
+        self.assertFalse(accepts_encoding("sbr, x-gzip", "br")) # Sin coincidencias por subcadena
+
+
+@override_settings(**TEST_SETTINGS, REPORT_LAZY_MIN_DETAILS=3, REPORT_SHARD_SIZE=2, REPORT_RENDER_ON_DEMAND=False)
+class LazyReportTests(TestCase):
+    @mock.patch("core.tasks.broadcast_session_status")
+    def test_large_report_is_sharded_and_served_gzipped(self, _broadcast):
+        details = [
+            {"datalayer_index": i, "data": {"event": "GAEvent", "marker": f"detalle-{i}"}, "valid": i != 1,
+             "errors": ["error"] if i == 1 else [], "warnings": [], "matched_section": "Sección", "match_score": 0.9}
+            for i in range(5)
+        ]
+        session = Session.objects.create(
+            url="https://example.com/",
+            validation_results={"details": details, "url": "https://example.com/"},
+            status=Session.STATUS_PROCESSING,
+        )
+        render_key = report_render_key(results_hash(session.validation_results), report_template_version())
+        data_url = reverse("session_report_data", args=[session.pk, render_key])
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            render_session_report(session.pk)
+            session.refresh_from_db()
+            self.assertEqual(session.status, Session.STATUS_COMPLETED)
+            with session.report_file.open("rb") as f:
+                html = gzip.decompress(f.read()).decode("utf-8")
+            self.assertIn('id="lazy-details"', html)
+            self.assertIn(data_url, html)
+            self.assertNotIn("detalle-4", html)
+
+            response = self.client.get(data_url, {"subset": "all", "shard": 2}, HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual(response["Content-Encoding"], "gzip")
+            self.assertEqual([d["datalayer_index"] for d in json.loads(gzip.decompress(response.content))], [4])
+
+            response = self.client.get(data_url, {"subset": "invalid", "shard": 0})
+            self.assertEqual([d["datalayer_index"] for d in response.json()], [1])
+            self.assertEqual(self.client.get(data_url, {"subset": "invalid", "shard": 1}).status_code, 404)
+
+
+@override_settings(**TEST_SETTINGS)
+class OnDemandReportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _get_rendered(self, url, **headers):
+        """Primera petición: 202 y render encolado (aquí se ejecuta en línea); la siguiente lo sirve."""
+        with mock.patch("core.views.render_report_on_demand.delay", side_effect=render_report_on_demand) as delay:
+            pending = self.client.get(url, **headers)
+        self.assertEqual(pending.status_code, 202)
+        self.assertEqual(pending["Retry-After"], str(settings.REPORT_RENDER_RETRY_AFTER_SECONDS))
+        delay.assert_called_once()
+        return self.client.get(url, **headers)
+
+    def test_concurrent_requests_enqueue_a_single_render(self):
+        results = {"details": [], "url": "https://example.com/"}
+        session = Session.objects.create(url="https://example.com/", validation_results=results,
+                                         results_hash=results_hash(results), status=Session.STATUS_COMPLETED)
+        url = reverse("session_report_render", args=[session.pk])
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root), \
+                mock.patch("core.views.render_report_on_demand.delay") as delay:
+            responses = [self.client.get(url) for _ in range(3)]
+        self.assertEqual([response.status_code for response in responses], [202, 202, 202])
+        delay.assert_called_once_with(str(session.pk), session.results_hash)
+
+    def test_report_rendered_on_first_request_and_revalidated_by_etag(self):
+        results = {"details": [], "url": "https://example.com/"}
+        session = Session.objects.create(url="https://example.com/", validation_results=results,
+                                         results_hash=results_hash(results), status=Session.STATUS_COMPLETED)
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            report_url = self.client.get(reverse("get_session_status", args=[session.pk])).json()["report_url"]
+            self.assertEqual(report_url, reverse("session_report_render", args=[session.pk]))
+            first = self._get_rendered(report_url, HTTP_ACCEPT_ENCODING="gzip")
+            self.assertEqual(first["Content-Encoding"], "gzip")
+            self.assertIn(b"https://example.com/", gzip.decompress(b"".join(first.streaming_content)))
+            self.assertEqual(self.client.get(report_url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+
+            # Una plantilla nueva invalida el render cacheado sin volver a validar
+            with mock.patch("core.utils.report_storage.report_template_version", return_value="nueva"), \
+                    mock.patch("core.views.report_template_version", return_value="nueva"):
+                second = self._get_rendered(report_url, HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual(second.status_code, 200)
+            self.assertNotEqual(second["ETag"], first["ETag"])
+            rendered_dir = os.path.join(media_root, RENDERED_REPORTS_DIR, str(session.pk))
+            self.assertEqual(os.listdir(rendered_dir), [f"{session.results_hash[:16]}-nueva.html.gz"])
+
+    @override_settings(REPORT_LAZY_MIN_DETAILS=3, REPORT_SHARD_SIZE=2)
+    def test_shards_are_versioned_per_render_and_pruned_with_it(self):
+        details = [{"datalayer_index": i, "data": {"event": "GAEvent"}, "valid": True, "errors": [], "warnings": []}
+                   for i in range(3)]
+        results = {"details": details, "url": "https://example.com/"}
+        session = Session.objects.create(url="https://example.com/", validation_results=results,
+                                         results_hash=results_hash(results), status=Session.STATUS_COMPLETED)
+        old_key = report_render_key(session.results_hash, report_template_version())
+        new_key = report_render_key(session.results_hash, "nueva")
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            shards_dir = os.path.join(media_root, "validation_reports", "shards", str(session.pk))
+            get_or_render_report(session.pk, session.results_hash)
+            self.assertEqual(os.listdir(shards_dir), [old_key])
+            shard_path = os.path.join(shards_dir, old_key, "all-00000.json.gz")
+            written_at = os.stat(shard_path).st_mtime_ns
+
+            # Otra petición con el mismo render: los shards guardados no se reescriben
+            with mock.patch("core.utils.report_storage._find_stored_variant", return_value=None):
+                get_or_render_report(session.pk, session.results_hash)
+            self.assertEqual(os.stat(shard_path).st_mtime_ns, written_at)
+            self.assertEqual(sorted(os.listdir(os.path.join(shards_dir, old_key))), ["all-00000.json.gz", "all-00001.json.gz"])
+
+            with mock.patch("core.utils.report_storage.report_template_version", return_value="nueva"):
+                get_or_render_report(session.pk, session.results_hash)
+            self.assertEqual(os.listdir(shards_dir), [new_key])
+            response = self.client.get(reverse("session_report_data", args=[session.pk, new_key]), {"shard": 1})
+            self.assertEqual([d["datalayer_index"] for d in response.json()], [2])
+
+
+@override_settings(**TEST_SETTINGS, DETAIL_EXPORT_CHUNK_SIZE=2)
+class DetailExportTests(TestCase):
+    def setUp(self):
+        details = [
+            {"datalayer_index": 0, "valid": True, "matched_section_id": "datalayer_1", "_captureTimestamp": 1000},
+            {"datalayer_index": 1, "valid": False, "matched_section_id": "datalayer_2", "_captureTimestamp": 2000},
+            {"datalayer_index": 2, "valid": None, "matched_section_id": None, "_captureTimestamp": 3000},
+            {"datalayer_index": 3, "valid": True, "matched_section_id": "datalayer_2", "_captureTimestamp": 4000},
+        ]
+        session = Session.objects.create(url="https://example.com/", validation_results={"details": details})
+        self.url = reverse("session_details_export", args=[session.pk])
+
+    def _indexes(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        return [json.loads(line)["datalayer_index"] for line in lines]
+
+    def test_streams_one_line_per_detail_in_order(self):
+        self.assertEqual(self._indexes(), [0, 1, 2, 3])
+
+    def test_filters_are_applied_in_the_database(self):
+        self.assertEqual(self._indexes(status="valid"), [0, 3])
+        self.assertEqual(self._indexes(status="invalid"), [1])
+        self.assertEqual(self._indexes(status="unmatched"), [2])
+        self.assertEqual(self._indexes(section="datalayer_2"), [1, 3])
+        self.assertEqual(self._indexes(since=2000, until=3000), [1, 2])
+        self.assertEqual(self.client.get(self.url, {"status": "otro"}).status_code, 400)
+
+
+@override_settings(**TEST_SETTINGS, RESULT_STORE_BATCH_SIZE=2)
+class ResultStoreTests(TestCase):
+    @mock.patch("core.tasks.broadcast_session_status")
+    @mock.patch("core.tasks.render_session_report.delay")
+    @mock.patch("core.tasks._publish_live_datalayers")
+    def test_capture_and_validation_are_stored_as_rows(self, _publish, _render, _broadcast):
+        session = Session.objects.create(
+            url="https://example.com/", reference_schema=[{"event": "GAEvent", "event_category": "home"}],
+            status=Session.STATUS_PROCESSING,
+        )
+        driver = mock.Mock()
+        driver.execute_script.side_effect = [
+            {"total": 2, "items": [{"event": "GAEvent", "event_category": "home", "_captureTimestamp": 1000},
+                                   {"event": "GAEvent", "event_category": "otra", "_captureTimestamp": 2000}]},
+            {"total": 3, "items": [{"event": "GAEvent", "event_category": "home", "_captureTimestamp": 3000}]},
+        ]
+        _drain_captured_datalayers(session.pk, driver)
+        _drain_captured_datalayers(session.pk, driver)
+        self.assertEqual(
+            list(session.captured_events.values_list("sequence", "captured_at_ms")),
+            [(0, 1000), (1, 2000), (2, 3000)],
+        )
+
+        validate_session_results(session.pk)
+        session.refresh_from_db()
+        self.assertNotIn("details", session.validation_results)
+        self.assertEqual(session.validation_results["details_count"], 2) # El tercero es un duplicado
+        details = load_validation_results(session.pk)["details"]
+        self.assertEqual([(d["valid"], d["_captureTimestamp"]) for d in details], [(True, 1000), (False, 2000)])
+
+        response = self.client.get(reverse("session_details_export", args=[session.pk]), {"status": "invalid"})
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line)["data"]["event_category"] for line in lines], ["otra"])
+
+
+@override_settings(**TEST_SETTINGS, DRAIN_HEARTBEAT_WRITE_SECONDS=30)
+@mock.patch("core.tasks.detach_driver")
+@mock.patch("core.tasks.read_performance_log", return_value=[])
+@mock.patch("core.tasks.attach_driver")
+class DrainHeartbeatTests(TestCase):
+    def setUp(self):
+        self.session = Session.objects.create(
+            url="https://example.com/", status=Session.STATUS_WAITING_USER, selenium_session_id="selenium-1",
+        )
+        self.state = {"selenium_session_id": "selenium-1", "hub_url": "http://hub:4444/wd/hub", "capture_cursor": 0}
+
+    def _tick(self, heartbeat_at, finished=False):
+        with mock.patch("core.tasks.finish_signal_pending", return_value=finished), \
+                mock.patch.object(drain_browser_session, "apply_async") as reschedule:
+            drain_browser_session(self.session.pk, heartbeat_at=heartbeat_at, **self.state)
+        return reschedule
+
+    def test_quiet_tick_does_not_touch_the_session_row(self, attach, _log, _detach):
+        attach.return_value.execute_script.return_value = {"total": 0, "items": []}
+        with CaptureQueriesContext(connection) as queries:
+            reschedule = self._tick(heartbeat_at=time.time())
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(reschedule.call_args.kwargs["kwargs"]["capture_cursor"], 0)
+
+    def test_heartbeat_is_written_before_it_goes_stale(self, attach, _log, _detach):
+        attach.return_value.execute_script.return_value = {"total": 0, "items": []}
+        reschedule = self._tick(heartbeat_at=time.time() - 31)
+        self.session.refresh_from_db()
+        self.assertIsNotNone(self.session.last_heartbeat_at)
+        self.assertAlmostEqual(reschedule.call_args.kwargs["kwargs"]["heartbeat_at"], time.time(), delta=5)
+
+    def test_finish_signal_stops_the_chain(self, attach, _log, _detach):
+        reschedule = self._tick(heartbeat_at=time.time(), finished=True)
+        attach.assert_not_called()
+        reschedule.assert_not_called()
+
+
+@override_settings(**TEST_SETTINGS)
+@mock.patch("core.tasks.broadcast_session_status")
+@mock.patch("core.tasks.dispatch_queued_sessions")
+class ProvisionRetryTests(TestCase):
+    def test_no_retry_once_the_session_was_marked_error(self, _dispatch, _broadcast):
+        session = Session.objects.create(url="https://example.com/", status=Session.STATUS_PENDING)
+
+        def reaped_then_fails(*args, **kwargs):
+            Session.objects.filter(pk=session.pk).update(status=Session.STATUS_ERROR)
+            raise OSError("grid caído")
+
+        with mock.patch("core.tasks.select_hub", side_effect=reaped_then_fails), \
+                mock.patch.object(provision_browser_session, "retry") as retry:
+            provision_browser_session(session.pk)
+        retry.assert_not_called()
+        session.refresh_from_db()
+        self.assertEqual(session.status, Session.STATUS_ERROR)
+
+    def test_transient_error_retries_keeping_the_slot(self, _dispatch, _broadcast):
+        session = Session.objects.create(url="https://example.com/", status=Session.STATUS_PENDING)
+        with mock.patch("core.tasks.select_hub", side_effect=OSError("grid caído")), \
+                mock.patch.object(provision_browser_session, "retry", side_effect=RuntimeError("retry")) as retry:
+            with self.assertRaises(RuntimeError):
+                provision_browser_session(session.pk)
+        retry.assert_called_once()
+        session.refresh_from_db()
+        self.assertEqual(session.status, Session.STATUS_PENDING)
+
+    def test_soft_time_limit_discards_the_browser_without_retry(self, _dispatch, _broadcast):
+        session = Session.objects.create(url="https://example.com/", status=Session.STATUS_PENDING)
+        driver = mock.Mock(session_id="selenium-1")
+        driver.get.side_effect = SoftTimeLimitExceeded()
+        pool = mock.Mock(**{"acquire.return_value": driver})
+        with mock.patch("core.tasks.select_hub", return_value="http://hub"), \
+                mock.patch("core.tasks.get_browser_pool", return_value=pool), \
+                mock.patch.object(provision_browser_session, "retry") as retry:
+            provision_browser_session(session.pk)
+        driver.set_page_load_timeout.assert_called_once_with(settings.PROVISION_PAGE_LOAD_TIMEOUT_SECONDS)
+        pool.discard.assert_called_once_with(driver)
+        pool.detach.assert_not_called()
+        retry.assert_not_called()
+        session.refresh_from_db()
+        self.assertEqual(session.status, Session.STATUS_ERROR)
+
+    def test_page_load_timeout_fits_inside_the_soft_time_limit(self, _dispatch, _broadcast):
+        limits = settings.CELERY_TASK_ANNOTATIONS["core.tasks.provision_browser_session"]
+        self.assertGreater(limits["soft_time_limit"], settings.PROVISION_PAGE_LOAD_TIMEOUT_SECONDS)
+
+
+def _performance_log_entry(url, post_data=None, timestamp=1000):
+    request = {"url": url, "postData": post_data} if post_data else {"url": url}
+    message = {"message": {"method": "Network.requestWillBeSent", "params": {"request": request}}}
+    return {"message": json.dumps(message), "timestamp": timestamp}
+
+
+class NetworkCaptureTests(SimpleTestCase):
+    def test_only_analytics_collect_endpoints_are_extracted(self):
+        entries = [
+            _performance_log_entry("https://www.google-analytics.com/collect?v=1&t=event&ec=home"),
+            _performance_log_entry("https://www.google-analytics.com/j/collect?v=1&t=pageview"),
+            _performance_log_entry("https://www.google-analytics.com/g/collect?v=2&en=page_view"),
+            _performance_log_entry("https://region1.google-analytics.com/r/collect?v=2&en=scroll"),
+            _performance_log_entry("https://example.com/collector?x=1"),
+            _performance_log_entry("https://example.com/recollect"),
+            {"message": "no es json collect", "timestamp": 1},
+        ]
+        urls = [hit["url"] for hit in extract_analytics_requests(entries)]
+        self.assertEqual(len(urls), 4)
+        self.assertTrue(all("example.com" not in url for url in urls))
+
+    def test_batched_body_yields_one_event_per_line_with_shared_params(self):
+        hits = extract_analytics_requests([
+            _performance_log_entry(
+                "https://region1.google-analytics.com/r/collect?v=2&tid=G-TEST&dl=https%3A%2F%2Fexample.com%2F",
+                post_data="en=view_item&ep.item_id=42\nen=add_to_cart&epn.value=9.5\n",
+                timestamp=2000,
+            ),
+        ])
+        events = decode_analytics_hits(hits)
+        self.assertEqual([event["event"] for event in events], ["view_item", "add_to_cart"])
+        self.assertEqual(events[0]["item_id"], "42")
+        self.assertEqual(events[1]["value"], 9.5)
+        self.assertTrue(all(event["measurement_id"] == "G-TEST" for event in events))
+        self.assertTrue(all(event["_captureTimestamp"] == 2000 for event in events))
+        self.assertEqual(events[0]["_hitEndpoint"], "region1.google-analytics.com/r/collect")
+
+    def test_universal_hit_uses_hit_type_as_event(self):
+        events = decode_analytics_hits(extract_analytics_requests([
+            _performance_log_entry("https://www.google-analytics.com/collect?v=1&t=event&ec=home&ea=click&el=cta"),
+        ]))
+        self.assertEqual(events, [{
+            "hit_type": "event", "event_category": "home", "event_action": "click", "event_label": "cta",
+            "event": "event", "_captureTimestamp": 1000, "_hitEndpoint": "www.google-analytics.com/collect",
+        }])
+
+
+@override_settings(**TEST_SETTINGS, NETWORK_HITS_MAX_BUFFER=3)
+class NetworkHitStoreTests(TestCase):
+    def test_hits_are_appended_up_to_the_cap_and_the_rest_counted(self):
+        session = Session.objects.create(url="https://example.com/", status=Session.STATUS_WAITING_USER)
+        collect = "https://www.google-analytics.com/g/collect?v=2&en=e{}"
+        with mock.patch("core.tasks.read_performance_log", side_effect=[
+            [_performance_log_entry(collect.format(i), timestamp=i) for i in range(2)],
+            [_performance_log_entry(collect.format(i), timestamp=i) for i in range(2, 5)],
+        ]):
+            self.assertEqual(_drain_network_hits(session.pk, mock.Mock()), 2)
+            self.assertEqual(_drain_network_hits(session.pk, mock.Mock()), 1)
+        session.refresh_from_db()
+        self.assertEqual(session.network_hits_dropped, 2)
+        self.assertIsNone(session.captured_network_hits)
+        self.assertEqual([hit["timestamp_ms"] for hit in load_network_hits(session)], [0, 1, 2])
+        self.assertEqual(list(session.network_hits.values_list("sequence", flat=True)), [0, 1, 2])
+
+
+HUB = "http://hub-a:4444/wd/hub"
+
+
+@override_settings(
+    **TEST_SETTINGS, WEBDRIVER_HUB_URLS=[HUB], REAPER_HEARTBEAT_STALE_SECONDS=90,
+    REAPER_ORPHAN_MIN_AGE_SECONDS=300, REAPER_POOL_STALE_SECONDS=600,
+)
+@mock.patch("core.tasks.broadcast_session_status")
+@mock.patch("core.tasks.delete_grid_session", return_value=True)
+class ReaperTests(TestCase):
+    def _session(self, status, idle_seconds, heartbeat_age=None, selenium_session_id=None):
+        session = Session.objects.create(url="https://example.com/", status=status, selenium_session_id=selenium_session_id)
+        now = timezone.now()
+        Session.objects.filter(pk=session.pk).update(
+            updated_at=now - timedelta(seconds=idle_seconds),
+            last_heartbeat_at=None if heartbeat_age is None else now - timedelta(seconds=heartbeat_age),
+        )
+        return session
+
+    def test_stale_sessions_are_marked_error_and_their_browser_closed(self, delete, _broadcast):
+        timeout = settings.REAPER_IDLE_TIMEOUTS["starting"]
+        stale = self._session(Session.STATUS_STARTING, timeout + 10, selenium_session_id="sel-stale")
+        fresh = self._session(Session.STATUS_STARTING, timeout - 10)
+        dead_heartbeat = self._session(Session.STATUS_WAITING_USER, 5, heartbeat_age=120, selenium_session_id="sel-dead")
+        alive = self._session(Session.STATUS_WAITING_USER, 5, heartbeat_age=10)
+
+        self.assertEqual(_reap_stale_sessions(timezone.now()), 2)
+        statuses = dict(Session.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[stale.pk], Session.STATUS_ERROR)
+        self.assertEqual(statuses[dead_heartbeat.pk], Session.STATUS_ERROR)
+        self.assertEqual(statuses[fresh.pk], Session.STATUS_STARTING)
+        self.assertEqual(statuses[alive.pk], Session.STATUS_WAITING_USER)
+        self.assertEqual(sorted(call.args[1] for call in delete.call_args_list), ["sel-dead", "sel-stale"])
+
+    def test_only_unowned_old_grid_sessions_are_closed(self, delete, _broadcast):
+        now = timezone.now()
+        old = now - timedelta(seconds=3600)
+        self._session(Session.STATUS_WAITING_USER, 5, heartbeat_age=10, selenium_session_id="sel-app")
+        grid = {
+            "sel-app": {"start": old, "node": "n1"},
+            "sel-controller": {"start": old, "node": "n1"},
+            "sel-pool": {"start": old, "node": "n1"},
+            "sel-young": {"start": now - timedelta(seconds=30), "node": "n1"},
+            "sel-orphan": {"start": old, "node": "n1"},
+        }
+        redis_client = mock.Mock()
+        redis_client.zrange.return_value = [b"sel-pool"]
+        with mock.patch("core.tasks.fetch_grid_sessions", return_value=grid), \
+                mock.patch("core.tasks.registered_selenium_session_ids", return_value={"sel-controller"}), \
+                mock.patch("core.tasks.get_redis_client", return_value=redis_client):
+            self.assertEqual(_reap_orphaned_grid_sessions(now), 1)
+        delete.assert_called_once_with(HUB, "sel-orphan")
+        self.assertEqual(redis_client.zremrangebyscore.call_args_list, [
+            mock.call("browser-pool:sessions", "-inf", now.timestamp() - 600),
+            mock.call("browser-pool:idle", "-inf", now.timestamp() - 600),
+        ])
+
+    def test_grid_is_left_alone_without_redis(self, delete, _broadcast):
+        grid = {"sel-orphan": {"start": timezone.now() - timedelta(seconds=3600), "node": "n1"}}
+        with mock.patch("core.tasks.fetch_grid_sessions", return_value=grid), \
+                mock.patch("core.tasks.registered_selenium_session_ids", side_effect=ConnectionError("sin redis")):
+            self.assertEqual(_reap_orphaned_grid_sessions(timezone.now()), 0)
+        delete.assert_not_called()
+
+
+@override_settings(**TEST_SETTINGS, ADMISSION_MAX_SLOTS=0)
+class AdmissionSlotTests(TestCase):
+    def setUp(self):
+        for status in (Session.STATUS_PENDING, Session.STATUS_WAITING_USER, Session.STATUS_COMPLETED):
+            Session.objects.create(url="https://example.com/", status=status)
+
+    def _slots(self, total, busy, idle_pool_browsers):
+        with mock.patch("core.utils.admission.idle_pool_session_count", return_value=idle_pool_browsers):
+            return available_slots({"total_slots": total, "busy_slots": busy})
+
+    def test_idle_pool_browsers_count_as_grantable(self):
+        # 10 slots - 2 sesiones con slot; los 3 navegadores ociosos del pool ocupan slot pero se entregan
+        self.assertEqual(self._slots(total=10, busy=5, idle_pool_browsers=3), 8)
+
+    def test_single_slot_grid_with_an_idle_pool_browser_admits_one_session(self):
+        Session.objects.filter(status__in=[Session.STATUS_PENDING, Session.STATUS_WAITING_USER]).delete()
+        self.assertEqual(self._slots(total=1, busy=1, idle_pool_browsers=1), 1)
+
+    def test_never_more_than_the_grid_sees_free(self):
+        # Reemplazos calentándose y controladores ocupan slots que no están en la BD ni en el pool ocioso
+        self.assertEqual(self._slots(total=10, busy=9, idle_pool_browsers=1), 2)
+
+    def test_full_grid_or_admission_limit_gives_no_slots(self):
+        self.assertEqual(self._slots(total=4, busy=4, idle_pool_browsers=0), 0)
+        with override_settings(ADMISSION_MAX_SLOTS=2):
+            self.assertEqual(self._slots(total=10, busy=0, idle_pool_browsers=3), 0)
+
+
+class _FakeCounterRedis:
+    """Contadores en memoria con la semántica de INCR/DECR/MGET de Redis."""
+
+    def __init__(self):
+        self.counters = {}
+
+    def mget(self, keys):
+        return [str(self.counters[key]).encode() if key in self.counters else None for key in keys]
+
+    def incr(self, key):
+        self.counters[key] = self.counters.get(key, 0) + 1
+        return self.counters[key]
+
+    def decr(self, key):
+        self.counters[key] = self.counters.get(key, 0) - 1
+        return self.counters[key]
+
+    def expire(self, key, seconds):
+        pass
+
+
+@override_settings(**TEST_SETTINGS, WEBDRIVER_HUB_URLS=["http://hub-a", "http://hub-b"])
+class SelectHubTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = _FakeCounterRedis()
+        self.statuses = [
+            {"url": "http://hub-a", "healthy": True, "total_slots": 4, "busy_slots": 0},
+            {"url": "http://hub-b", "healthy": True, "total_slots": 4, "busy_slots": 0},
+        ]
+        for target, value in (("get_redis_client", self.redis), ("get_hub_statuses", self.statuses)):
+            patcher = mock.patch(f"core.utils.webdriver_hubs.{target}", return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_reservations_spread_across_hubs(self):
+        chosen = [select_hub() for _ in range(6)]
+        self.assertEqual(chosen.count("http://hub-a"), 3)
+        self.assertEqual(chosen.count("http://hub-b"), 3)
+        self.assertEqual(self.redis.counters, {"webdriver-hub:http://hub-a:reserved": 3, "webdriver-hub:http://hub-b:reserved": 3})
+
+    def test_concurrent_reservation_moves_the_choice_to_another_hub(self):
+        self.redis.counters["webdriver-hub:http://hub-b:reserved"] = 1 # Según nuestra lectura, hub-a es el mejor
+        real_mget = self.redis.mget
+        # Otro proceso reserva dos slots en hub-a entre nuestra lectura y nuestro INCR
+        def stale_mget(keys):
+            values = real_mget(keys)
+            self.redis.incr("webdriver-hub:http://hub-a:reserved")
+            self.redis.incr("webdriver-hub:http://hub-a:reserved")
+            return values
+
+        with mock.patch.object(self.redis, "mget", side_effect=stale_mget):
+            self.assertEqual(select_hub(), "http://hub-b")
+        # La reserva en hub-a se deshizo: solo quedan las del otro proceso
+        self.assertEqual(self.redis.counters["webdriver-hub:http://hub-a:reserved"], 2)
+        self.assertEqual(self.redis.counters["webdriver-hub:http://hub-b:reserved"], 2)
+
+    def test_excluded_and_unhealthy_hubs_are_skipped(self):
+        self.statuses[1]["healthy"] = False
+        self.assertEqual(select_hub(), "http://hub-a")
+        self.assertEqual(select_hub(exclude=["http://hub-a"]), "http://hub-a") # Sin candidatos: el primero
+
+
+class SQLiteBackendTests(TestCase):
+    def test_connection_pragmas_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS["busy_timeout"])
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1) # NORMAL
+
+
+class _FakeRemoteBrowser:
+    """Sesión WebDriver en memoria: ventanas, cookies y almacenamiento de varios orígenes."""
+
+    def __init__(self, session_id="selenium-1", cdp_fails=False):
+        self.session_id = session_id
+        self.cdp_fails = cdp_fails
+        self.window_handles = ["main", "popup"]
+        self.cookies = {"https://a.example": ["_ga"], "https://b.example": ["consent"]}
+        self.storage = {"https://a.example": {"capturedDataLayersLs": "[...]"}, "https://b.example": {"k": "v"}}
+        self.current_window = "popup"
+        self.quit_called = False
+        self.command_executor = mock.Mock()
+        self.switch_to = mock.Mock(window=lambda handle: setattr(self, "current_window", handle))
+
+    @property
+    def current_url(self):
+        return "about:blank"
+
+    def close(self):
+        self.window_handles.remove(self.current_window)
+
+    def get(self, url):
+        pass
+
+    def quit(self):
+        self.quit_called = True
+
+    def execute(self, command, params=None):
+        if command == "executeCdpCommand":
+            if self.cdp_fails:
+                raise WebDriverException("CDP no disponible")
+            if params["cmd"] == "Network.clearBrowserCookies":
+                self.cookies.clear()
+            elif params["cmd"] == "Storage.clearDataForOrigin" and params["params"]["origin"] == "*":
+                self.storage.clear()
+        return {"value": []}
+
+
+class _FakePoolRedis:
+    """Claves y ZSETs en memoria; el pipeline ejecuta cada comando en el momento."""
+
+    def __init__(self):
+        self.data = {}
+        self.zsets = {}
+
+    def pipeline(self):
+        results = []
+        pipe = mock.Mock(execute=lambda: list(results))
+        for name in ("get", "set", "delete", "zadd", "zrem"):
+            command = getattr(self, name)
+            setattr(pipe, name, lambda *args, _command=command, **kwargs: results.append(_command(*args, **kwargs)))
+        return pipe
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zrem(self, key, *members):
+        for member in members:
+            self.zsets.get(key, {}).pop(member, None)
+
+
+@mock.patch("core.controllers.browser_pool.get_redis_client")
+class BrowserPoolTests(SimpleTestCase):
+    def test_release_wipes_every_origin_before_pooling(self, _redis):
+        pool = BrowserPool("http://hub:4444/wd/hub", size=1)
+        browser = _FakeRemoteBrowser()
+        pool.release(browser)
+        self.assertEqual(browser.window_handles, ["main"])
+        self.assertEqual(browser.cookies, {})
+        self.assertEqual(browser.storage, {})
+        self.assertFalse(browser.quit_called)
+        with mock.patch.object(pool, "warm_async"):
+            self.assertIs(pool.acquire(), browser)
+
+    def test_browser_that_cannot_be_wiped_is_quit(self, _redis):
+        pool = BrowserPool("http://hub:4444/wd/hub", size=1)
+        browser = _FakeRemoteBrowser(cdp_fails=True)
+        with mock.patch.object(pool, "warm_async"):
+            pool.release(browser)
+        self.assertTrue(browser.quit_called)
+        self.assertEqual(pool._idle, [])
+
+    def test_browser_is_recycled_after_max_uses(self, _redis):
+        pool = BrowserPool("http://hub:4444/wd/hub", size=1, max_uses=1)
+        browser = _FakeRemoteBrowser()
+        with mock.patch.object(pool, "_create_driver", return_value=browser), mock.patch.object(pool, "warm_async"):
+            self.assertIs(pool.acquire(), browser)
+            pool.release(browser)
+        self.assertTrue(browser.quit_called)
+        self.assertEqual(pool._idle, [])
+
+    def test_detached_browser_keeps_its_uses_and_age_when_released_elsewhere(self, redis):
+        redis.return_value = fake_redis = _FakePoolRedis()
+        provisioner = BrowserPool("http://hub:4444/wd/hub", size=1, max_uses=2)
+        browser = _FakeRemoteBrowser()
+        with mock.patch.object(provisioner, "_create_driver", return_value=browser), \
+                mock.patch.object(provisioner, "warm_async"):
+            provisioner.detach(provisioner.acquire())
+        self.assertNotIn("selenium-1", fake_redis.zsets["browser-pool:sessions"])
+
+        # finalize_browser_session en otro proceso: pool distinto, driver re-adjuntado
+        finalizer = BrowserPool("http://hub:4444/wd/hub", size=1, max_uses=2)
+        finalizer.release(browser)
+        self.assertFalse(browser.quit_called)
+        self.assertEqual(finalizer._idle[0].uses, 1)
+        self.assertIn("selenium-1", fake_redis.zsets["browser-pool:idle"])
+        self.assertNotIn("browser-pool:session:selenium-1", fake_redis.data)
+
+        with mock.patch.object(finalizer, "warm_async"):
+            finalizer.detach(finalizer.acquire())
+            BrowserPool("http://hub:4444/wd/hub", size=1, max_uses=2).release(browser)
+        self.assertTrue(browser.quit_called) # Segundo uso: max_uses alcanzado
+
+    def test_detached_browser_past_max_age_is_retired_on_release(self, redis):
+        redis.return_value = fake_redis = _FakePoolRedis()
+        fake_redis.set("browser-pool:session:selenium-1", json.dumps({"uses": 1, "created_at": time.time() - 700}))
+        pool = BrowserPool("http://hub:4444/wd/hub", size=1, max_uses=20, max_idle_seconds=600)
+        browser = _FakeRemoteBrowser()
+        with mock.patch.object(pool, "warm_async"):
+            pool.release(browser)
+        self.assertTrue(browser.quit_called)
+        self.assertEqual(pool._idle, [])
+
+
+class _FakeRegistryRedis:
+    """Redis asíncrono en memoria; los scripts Lua del registro se emulan en Python."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def _owner_matches(self, key, token):
+        raw = self.data.get(key)
+        return raw is None or json.loads(raw).get("owner") in (None, token)
+
+    async def eval(self, script, numkeys, *args):
+        keys, argv = args[:numkeys], args[numkeys:]
+        if script == controller_registry._CLAIM_LUA:
+            self.data.pop(keys[1], None)
+            raw = self.data.get(keys[0])
+            if raw is None:
+                return None
+            self.data[keys[0]] = json.dumps({**json.loads(raw), "owner": argv[0]})
+            return self.data[keys[0]]
+        if script == controller_registry._START_GRACE_LUA:
+            if keys[0] not in self.data or not self._owner_matches(keys[0], argv[0]):
+                return 0
+            self.data[keys[1]] = argv[0]
+            return 1
+        if script == controller_registry._RELEASE_GRACE_LUA:
+            if self.data.get(keys[1]) != argv[0] or not self._owner_matches(keys[0], argv[0]):
+                return 0
+            del self.data[keys[1]]
+            return 1
+        raise AssertionError("script desconocido")
+
+
+class WebDriverClientTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(setattr, http_client, "_client", None)
+        self.addCleanup(setattr, http_client, "_client_loop", None)
+
+    async def _client(self):
+        return http_client.get_webdriver_client()
+
+    async def _client_after_switch(self):
+        client = http_client.get_webdriver_client()
+        await asyncio.sleep(0) # Deja correr el cierre programado del anterior
+        return client
+
+    def test_client_of_a_finished_loop_is_closed_when_replaced(self):
+        old = asyncio.run(self._client())
+        new = asyncio.run(self._client_after_switch())
+        self.assertIsNot(new, old)
+        self.assertTrue(old.is_closed)
+        self.assertFalse(new.is_closed)
+        asyncio.run(http_client.close_webdriver_client())
+
+    def test_client_of_a_running_loop_is_closed_on_its_own_loop(self):
+        other_loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=other_loop.run_forever, daemon=True)
+        thread.start()
+        self.addCleanup(other_loop.close)
+        self.addCleanup(thread.join)
+        self.addCleanup(other_loop.call_soon_threadsafe, other_loop.stop)
+        old = asyncio.run_coroutine_threadsafe(self._client(), other_loop).result(timeout=5)
+
+        asyncio.run(self._client())
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0.01), other_loop).result(timeout=5)
+        self.assertTrue(old.is_closed)
+        asyncio.run(http_client.close_webdriver_client())
+
+
+@override_settings(WEBDRIVER_HUB_URLS=["http://hub-a/wd/hub", "http://hub-b/wd/hub"])
+class BrowserControllerHubTests(SimpleTestCase):
+    def test_controller_without_recorded_hub_uses_the_first_configured_hub(self):
+        controller = BrowserController(session_id="s-1", session_url="https://example.com/")
+        with mock.patch.dict(os.environ, {"SELENOID_URL": "http://other-grid/wd/hub"}):
+            self.assertEqual(controller._get_webdriver_base_url(), "http://hub-a/wd/hub")
+
+
+def _running_controller():
+    controller = BrowserController(session_id="s-1", session_url="https://example.com/")
+    controller._selenium_session_id = "selenium-1"
+    controller._state = "running"
+    return controller
+
+
+class ControllerRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = _FakeRegistryRedis()
+        patcher = mock.patch.object(controller_registry, "get_async_redis_client", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _run_grace_tasks(self):
+        await asyncio.gather(*list(controller_registry._grace_tasks))
+
+    def test_late_disconnect_after_reattach_does_not_stop_the_browser(self):
+        registry = controller_registry.ControllerRegistry(grace_seconds=0.01, ttl_seconds=60)
+
+        async def scenario():
+            old = _running_controller()
+            await registry.save(old)
+            # El cliente reconecta por otro socket antes de que llegue la desconexión del primero
+            new = await registry.claim("s-1")
+            with mock.patch.object(BrowserController, "stop") as stop:
+                await registry.release_after_grace(old)
+                await self._run_grace_tasks()
+            return old, new, stop
+
+        old, new, stop = async_to_sync(scenario)()
+        stop.assert_not_called()
+        self.assertEqual(old.state, "stopped") # Solo soltado localmente
+        self.assertEqual(new.state, "running")
+        entry = json.loads(self.redis.data[controller_registry._entry_key("s-1")])
+        self.assertEqual(entry["owner"], new.registry_token)
+
+    def test_unclaimed_browser_is_stopped_after_grace(self):
+        registry = controller_registry.ControllerRegistry(grace_seconds=0.01, ttl_seconds=60)
+
+        async def scenario():
+            controller = _running_controller()
+            await registry.save(controller)
+            with mock.patch.object(BrowserController, "stop") as stop:
+                await registry.release_after_grace(controller)
+                await self._run_grace_tasks()
+            return stop
+
+        async_to_sync(scenario)().assert_called_once()
+        self.assertEqual(self.redis.data, {})
+
+    def test_reclaim_during_grace_detaches_the_old_controller(self):
+        registry = controller_registry.ControllerRegistry(grace_seconds=0.01, ttl_seconds=60)
+
+        async def scenario():
+            old = _running_controller()
+            await registry.save(old)
+            with mock.patch.object(BrowserController, "stop") as stop:
+                await registry.release_after_grace(old)
+                new = await registry.claim("s-1")
+                await self._run_grace_tasks()
+            return old, new, stop
+
+        old, new, stop = async_to_sync(scenario)()
+        stop.assert_not_called()
+        self.assertEqual((old.state, new.state), ("stopped", "running"))
@@ -14,4 +14,21 @@ urlpatterns = [
 
     # --- NUEVA RUTA PARA FINALIZAR LA SESIÓN ---
     path("session/<uuid:session_id>/finish/", views.finish_session_view, name="finish_session"),
+
+    # Reporte HTML renderizado bajo demanda (cacheado por hash de resultados + versión de plantilla)
+    path("session/<uuid:session_id>/report/", views.session_report_render_view, name="session_report_render"),
+
+    # Reporte HTML/JSON/CSV (precomprimido; el nombre del archivo hace la URL inmutable)
+    path("session/<uuid:session_id>/report/<str:filename>", views.session_report_view, name="session_report"),
+
+    # Shards de detalles del reporte lazy (capturas grandes), uno por render (resultados + plantilla)
+    path("session/<uuid:session_id>/report/data/<slug:render_key>/", views.session_report_data_view, name="session_report_data"),
+    # Shards sin versionar de reportes generados antes
+    path("session/<uuid:session_id>/report/data/", views.session_report_data_view, name="session_report_data_legacy"),
+
+    # Detalles de validación en NDJSON (streaming, con filtros)
+    path("session/<uuid:session_id>/details.ndjson", views.session_details_export_view, name="session_details_export"),
+
+    # Métricas de latencia hacia el hub WebDriver (proceso ASGI actual)
+    path("metrics/webdriver/", views.webdriver_metrics_view, name="webdriver_metrics"),
 ]
@@ -0,0 +1,131 @@
+# core/utils/admission.py
+import logging
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, F
+from django.utils import timezone
+
+from ..controllers.browser_pool import idle_pool_session_count
+from ..models import Session
+from .redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# Lista FIFO (RPUSH / LPOP) con los PK de las sesiones en espera de un navegador
+ADMISSION_QUEUE_KEY = "session-admission:queue"
+# Cerrojo para que solo un despachador a la vez reparta slots
+ADMISSION_LOCK_KEY = "session-admission:lock"
+AVG_DURATION_CACHE_KEY = "session-admission:avg-duration"
+TOTAL_SLOTS_CACHE_KEY = "session-admission:total-slots"
+
+# Estados que ocupan (o van a ocupar enseguida) un slot del grid
+SLOT_HOLDING_STATUSES = [
+    Session.STATUS_PENDING,
+    Session.STATUS_STARTING,
+    Session.STATUS_WAITING_USER,
+    Session.STATUS_FINISH_REQUESTED,
+]
+
+
+def enqueue_session(session_pk) -> None:
+    """Pone la sesión al final de la cola de admisión."""
+    get_redis_client().rpush(ADMISSION_QUEUE_KEY, str(session_pk))
+
+
+def pop_next_queued() -> Optional[str]:
+    """Saca el primero de la cola (FIFO) o None si está vacía."""
+    raw = get_redis_client().lpop(ADMISSION_QUEUE_KEY)
+    return raw.decode() if raw is not None else None
+
+
+def queue_length() -> int:
+    return get_redis_client().llen(ADMISSION_QUEUE_KEY)
+
+
+def remove_from_queue(session_pk) -> None:
+    """Quita la sesión de la cola (p.ej. si caducó esperando)."""
+    try:
+        get_redis_client().lrem(ADMISSION_QUEUE_KEY, 0, str(session_pk))
+    except Exception as e:
+        logger.warning(f"Admisión: No se pudo quitar la sesión {session_pk} de la cola: {e}")
+
+
+def queued_session_ids(limit: int = -1) -> List[str]:
+    """PK de las sesiones en cola, en orden de llegada."""
+    return [raw.decode() for raw in get_redis_client().lrange(ADMISSION_QUEUE_KEY, 0, limit)]
+
+
+def queue_position(session_pk) -> Optional[int]:
+    """Posición (1 = siguiente en entrar) o None si no está en cola."""
+    position = get_redis_client().lpos(ADMISSION_QUEUE_KEY, str(session_pk))
+    return None if position is None else position + 1
+
+
+def available_slots(capacity: Dict[str, int]) -> int:
+    """
+    Slots que se pueden conceder ahora. De la capacidad se descuentan las
+    sesiones de la app que ya tienen (o están obteniendo) navegador. Los
+    navegadores ociosos de los pools ocupan slot en el grid pero son justo los
+    que tomarán las sesiones admitidas, así que cuentan como libres; los
+    reemplazos que se están calentando y los controladores WebSocket no.
+    ``ADMISSION_MAX_SLOTS`` (>0) limita la capacidad por debajo de la del grid.
+    """
+    total_slots = capacity["total_slots"]
+    if settings.ADMISSION_MAX_SLOTS > 0:
+        total_slots = min(total_slots, settings.ADMISSION_MAX_SLOTS)
+    holding = Session.objects.filter(status__in=SLOT_HOLDING_STATUSES).count()
+    idle_pool_browsers = idle_pool_session_count(settings.REAPER_POOL_STALE_SECONDS)
+    grid_free = capacity["total_slots"] - capacity.get("busy_slots", 0) + idle_pool_browsers
+    return max(min(total_slots - holding, grid_free), 0)
+
+
+def average_session_seconds() -> float:
+    """
+    Duración media (creación -> última actualización) de las últimas sesiones
+    completadas, cacheada un minuto. Valor por defecto si aún no hay datos.
+    """
+    cached = cache.get(AVG_DURATION_CACHE_KEY)
+    if cached is not None:
+        return cached
+    recent_pks = Session.objects.filter(status=Session.STATUS_COMPLETED).values("pk")[:50]
+    average = Session.objects.filter(pk__in=recent_pks).aggregate(
+        duration=Avg(F("updated_at") - F("created_at"))
+    )["duration"]
+    seconds = average.total_seconds() if isinstance(average, timedelta) else settings.ADMISSION_DEFAULT_SESSION_SECONDS
+    cache.set(AVG_DURATION_CACHE_KEY, seconds, 60)
+    return seconds
+
+
+def estimate_wait_seconds(position: int, total_slots: int) -> int:
+    """ETA aproximada: rondas completas de sesiones por delante × duración media."""
+    rounds = (position - 1) // max(total_slots, 1) + 1
+    return int(rounds * average_session_seconds())
+
+
+def queue_info(session_pk) -> Optional[Dict[str, int]]:
+    """Posición y espera estimada de una sesión en cola (para el estado de la página)."""
+    try:
+        position = queue_position(session_pk)
+    except Exception as e:
+        logger.warning(f"Admisión: No se pudo leer la posición de la sesión {session_pk}: {e}")
+        return None
+    if position is None:
+        return None
+    total_slots = cache.get(TOTAL_SLOTS_CACHE_KEY) or 1
+    return {"queue_position": position, "eta_seconds": estimate_wait_seconds(position, total_slots)}
+
+
+def remember_total_slots(total_slots: int) -> None:
+    """Guarda la capacidad vista por el despachador para las ETAs de la página."""
+    cache.set(TOTAL_SLOTS_CACHE_KEY, total_slots, settings.ADMISSION_DISPATCH_INTERVAL_SECONDS * 10)
+
+
+def acquire_dispatch_lock(ttl_seconds: int = 30) -> bool:
+    return bool(get_redis_client().set(ADMISSION_LOCK_KEY, timezone.now().isoformat(), nx=True, ex=ttl_seconds))
+
+
+def release_dispatch_lock() -> None:
+    get_redis_client().delete(ADMISSION_LOCK_KEY)
@@ -0,0 +1,137 @@
+# core/utils/capture_scripts.py
+# Scripts JavaScript compartidos por las tareas Celery (Selenium) y el
+# BrowserController asíncrono (WebDriver W3C vía httpx).
+
+# --- Script de captura de DataLayers (inyectado en la página) ---
+JS_CAPTURE_DATALAYER = """
+(() => {
+    console.log('Attempting to inject DataLayer capture script...');
+    const LS_KEY = 'capturedDataLayersLs';
+    // Asegurar que window.capturedDataLayers siempre sea un array
+    window.capturedDataLayers = window.capturedDataLayers || [];
+    console.log('Initial capturedDataLayers length:', window.capturedDataLayers.length);
+
+    // Cargar desde LocalStorage de forma segura
+    try {
+        const existingData = localStorage.getItem(LS_KEY);
+        if (existingData) {
+            const parsedData = JSON.parse(existingData);
+            // Sobrescribir solo si lo recuperado es un array válido
+            if (Array.isArray(parsedData)) {
+                window.capturedDataLayers = parsedData;
+                console.log('Loaded ' + parsedData.length + ' items from LocalStorage.');
+            } else {
+                 console.warn('Data in LocalStorage was not an array.');
+            }
+        }
+    } catch (e) {
+        console.error('Error reading or parsing LocalStorage:', e);
+        // Asegurar que sigue siendo un array en caso de error
+        if (!Array.isArray(window.capturedDataLayers)) {
+             window.capturedDataLayers = [];
+        }
+    }
+
+    // Inicializar dataLayer si no existe
+    window.dataLayer = window.dataLayer || [];
+    const initialTimestamp = Date.now();
+    let initialItemsProcessed = false;
+
+    // Procesar items iniciales SOLO si dataLayer es un array y tiene elementos
+    if (Array.isArray(window.dataLayer) && window.dataLayer.length > 0) {
+        console.log('Processing initial items in existing dataLayer (length:', window.dataLayer.length + ')');
+        let addedFromInitial = 0;
+        // Usar un bucle for...of o un for clásico para más control si forEach da problemas
+        for (const obj of window.dataLayer) {
+            // Comprobar si el objeto es procesable y no tiene ya nuestro timestamp
+            if (typeof obj !== 'undefined' && obj !== null && typeof obj._captureTimestamp === 'undefined') {
+                try {
+                    // Clonar objeto para evitar modificar el original
+                    const clone = JSON.parse(JSON.stringify(obj));
+                    clone._captureTimestamp = initialTimestamp;
+                    window.capturedDataLayers.push(clone);
+                    addedFromInitial++;
+                } catch (e) {
+                    console.error('Error cloning initial DL object:', e, obj);
+                    // No detener el script por un objeto mal formado
+                }
+            }
+        }
+        if (addedFromInitial > 0) {
+            console.log('Processed ' + addedFromInitial + ' initial items.');
+            initialItemsProcessed = true;
+        }
+    } else {
+         console.log('window.dataLayer is not an array or is empty. Skipping initial processing.');
+    }
+
+    // Guardar en LS si se procesaron items iniciales
+    if (initialItemsProcessed) {
+        try {
+            localStorage.setItem(LS_KEY, JSON.stringify(window.capturedDataLayers));
+        } catch (e) {
+            console.error('Error saving initial DLs to LS:', e);
+        }
+    }
+
+    // Guardar referencia al push original SOLO si es una función
+    const originalPush = typeof window.dataLayer.push === 'function' ? window.dataLayer.push : null;
+
+    // Sobrescribir dataLayer.push
+    window.dataLayer.push = function(...args) {
+        const timestamp = Date.now();
+        let itemsPushedCount = 0;
+        // Asegurar que window.capturedDataLayers siga siendo un array
+        if (!Array.isArray(window.capturedDataLayers)) {
+            console.warn('window.capturedDataLayers was not an array during push. Re-initializing.');
+            window.capturedDataLayers = [];
+        }
+
+        args.forEach(obj => {
+            if (typeof obj !== 'undefined' && obj !== null) {
+                try {
+                    const clone = JSON.parse(JSON.stringify(obj));
+                    clone._captureTimestamp = timestamp;
+                    window.capturedDataLayers.push(clone);
+                    itemsPushedCount++;
+                } catch (e) {
+                    console.error('Error cloning/pushing DL object:', e, obj);
+                }
+            }
+        });
+
+        // Guardar en LS después de cada push exitoso
+        if (itemsPushedCount > 0) {
+            try {
+                localStorage.setItem(LS_KEY, JSON.stringify(window.capturedDataLayers));
+            } catch (e) {
+                console.error('Error saving pushed DLs to LS:', e);
+            }
+        }
+
+        console.log('dataLayer.push intercepted. Items pushed now:', itemsPushedCount, 'Total items:', window.capturedDataLayers.length);
+
+        // Llamar al push original SOLO si existía y era una función
+        if (originalPush) {
+             // Usar try-catch por si el push original falla o tiene efectos secundarios inesperados
+             try {
+                return originalPush.apply(window.dataLayer, args);
+             } catch(pushErr) {
+                 console.error("Error calling original dataLayer.push:", pushErr);
+                 // Decidir si retornar algo o no en caso de error
+             }
+        }
+        // Si no había push original, no retornamos nada explícito (o retornamos undefined)
+    };
+
+    console.log('DataLayer capture script injected successfully. Current total items:', window.capturedDataLayers.length);
+})();
+"""
+
+# Devuelve los items capturados a partir del cursor, o null si el script no está
+# inyectado (p.ej. el usuario navegó a otra página).
+JS_DRAIN_DATALAYERS = """
+const cursor = arguments[0];
+if (!Array.isArray(window.capturedDataLayers)) { return null; }
+return {total: window.capturedDataLayers.length, items: window.capturedDataLayers.slice(cursor)};
+"""
@@ -0,0 +1,139 @@
+# core/utils/detail_export.py
+import json
+import logging
+from typing import Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+
+from ..models import Session, ValidationDetail
+from .result_store import has_validation_details, iter_validation_details
+
+logger = logging.getLogger(__name__)
+
+DETAIL_STATUS_FILTERS = ("valid", "invalid", "unmatched")
+
+
+class DetailExportNotSupported(Exception):
+    """El backend de base de datos no permite recorrer los detalles en SQL."""
+
+
+def _iter_rows_from_table(session_id, status, section_id, since_ms, until_ms, chunk_size) -> Iterator[bytes]:
+    """Detalles guardados en ValidationDetail, filtrados con los índices de la tabla."""
+    queryset = ValidationDetail.objects.filter(session_id=session_id)
+    if status == "valid":
+        queryset = queryset.filter(valid=True)
+    elif status == "invalid":
+        queryset = queryset.filter(valid=False)
+    elif status == "unmatched":
+        queryset = queryset.filter(valid__isnull=True)
+    if section_id is not None:
+        queryset = queryset.filter(matched_section_id=section_id)
+    if since_ms is not None:
+        queryset = queryset.filter(captured_at_ms__gte=since_ms)
+    if until_ms is not None:
+        queryset = queryset.filter(captured_at_ms__lte=until_ms)
+    lines = []
+    for detail in iter_validation_details(session_id, queryset=queryset):
+        lines.append(json.dumps(detail, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+        if len(lines) >= chunk_size:
+            yield b"".join(lines)
+            lines = []
+    if lines:
+        yield b"".join(lines)
+
+
+def _detail_query(vendor: str, session_id, status: Optional[str], section_id: Optional[str],
+                  since_ms: Optional[float], until_ms: Optional[float]) -> Tuple[str, List]:
+    """
+    Sesiones anteriores a ValidationDetail: SQL que devuelve cada detalle de
+    ``validation_results.details`` como una fila con su JSON en texto, ya
+    filtrado y en orden. El array se recorre en la base de datos (``json_each``
+    en SQLite, ``jsonb_array_elements`` en PostgreSQL), así que nunca se carga
+    la lista completa en Python.
+    """
+    table = Session._meta.db_table
+    pk_column = Session._meta.pk.column
+    params = [Session._meta.pk.get_db_prep_value(session_id, connection)]
+    if vendor == "sqlite":
+        sql = (
+            f"SELECT d.value FROM {table} s, json_each(s.validation_results, '$.details') d "
+            f"WHERE s.{pk_column} = %s"
+        )
+        status_filters = {
+            "valid": "json_type(d.value, '$.valid') = 'true'",
+            "invalid": "json_type(d.value, '$.valid') = 'false'",
+            "unmatched": "COALESCE(json_type(d.value, '$.valid'), 'null') = 'null'",
+        }
+        section_expr = "CAST(json_extract(d.value, '$.matched_section_id') AS TEXT)"
+        timestamp_expr = "json_extract(d.value, '$._captureTimestamp')"
+        order_by = "CAST(d.key AS INTEGER)"
+    elif vendor == "postgresql":
+        sql = (
+            f"SELECT d.value::text FROM {table} s CROSS JOIN LATERAL "
+            f"jsonb_array_elements(s.validation_results -> 'details') WITH ORDINALITY AS d(value, idx) "
+            f"WHERE s.{pk_column} = %s"
+        )
+        status_filters = {
+            "valid": "d.value -> 'valid' = 'true'::jsonb",
+            "invalid": "d.value -> 'valid' = 'false'::jsonb",
+            "unmatched": "COALESCE(d.value -> 'valid', 'null'::jsonb) = 'null'::jsonb",
+        }
+        section_expr = "d.value ->> 'matched_section_id'"
+        timestamp_expr = "(d.value ->> '_captureTimestamp')::numeric"
+        order_by = "d.idx"
+    else:
+        raise DetailExportNotSupported(f"Exportación de detalles no soportada en '{vendor}'.")
+
+    if status is not None:
+        sql += f" AND {status_filters[status]}"
+    if section_id is not None:
+        sql += f" AND {section_expr} = %s"
+        params.append(str(section_id))
+    if since_ms is not None:
+        sql += f" AND {timestamp_expr} >= %s"
+        params.append(since_ms)
+    if until_ms is not None:
+        sql += f" AND {timestamp_expr} <= %s"
+        params.append(until_ms)
+    return f"{sql} ORDER BY {order_by}", params
+
+
+def iter_detail_lines(session_id, status: Optional[str] = None, section_id: Optional[str] = None,
+                      since_ms: Optional[float] = None, until_ms: Optional[float] = None,
+                      chunk_size: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Genera los detalles de validación de la sesión en NDJSON (una línea por
+    detalle), leyendo de la base de datos por bloques de ``chunk_size`` filas
+    (cursor de servidor en PostgreSQL): memoria constante sea cual sea el
+    tamaño de la sesión. Usa ValidationDetail y, si la sesión es anterior,
+    el array de ``validation_results``.
+
+    Args:
+        status: ``valid``, ``invalid`` o ``unmatched`` (``valid`` es null: sin referencia).
+        section_id: Solo los detalles con ese ``matched_section_id``.
+        since_ms / until_ms: Rango (inclusivo, ms epoch) de ``_captureTimestamp``.
+
+    Raises:
+        DetailExportNotSupported: Si la sesión solo tiene los detalles en el
+            JSON y el backend no es SQLite ni PostgreSQL (al llamar, no al
+            empezar a iterar).
+    """
+    chunk_size = chunk_size or settings.DETAIL_EXPORT_CHUNK_SIZE
+    if has_validation_details(session_id):
+        return _iter_rows_from_table(session_id, status, section_id, since_ms, until_ms, chunk_size)
+    sql, params = _detail_query(connection.vendor, session_id, status, section_id, since_ms, until_ms)
+    return _iter_rows(sql, params, chunk_size)
+
+
+def _iter_rows(sql: str, params: List, chunk_size: int) -> Iterator[bytes]:
+    cursor = connection.chunked_cursor()
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield b"".join(value.encode("utf-8") + b"\n" for (value,) in rows)
+    finally:
+        cursor.close()
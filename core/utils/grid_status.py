@@ -0,0 +1,97 @@
+# core/utils/grid_status.py
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+GRID_HTTP_TIMEOUT_SECONDS = 10
+
+
+def _parse_start(value: Optional[str]) -> Optional[datetime]:
+    """Convierte el ``start`` ISO-8601 de Selenium Grid (sufijo 'Z') a datetime aware."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _fetch_status_value(hub_url: str) -> Dict:
+    response = httpx.get(f"{hub_url.rstrip('/')}/status", timeout=GRID_HTTP_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    return response.json().get("value") or {}
+
+
+def fetch_grid_capacity(hub_url: str) -> Dict[str, int]:
+    """
+    Capacidad del grid/standalone según ``GET /status``: slots totales y
+    ocupados (con sesión) sumando todos los nodos.
+
+    Returns:
+        ``{"ready": bool, "total_slots": int, "busy_slots": int}``.
+
+    Raises:
+        httpx.HTTPError: Si el grid no responde o devuelve error.
+    """
+    value = _fetch_status_value(hub_url)
+    total_slots = busy_slots = 0
+    for node in value.get("nodes") or []:
+        if node.get("availability", "UP") != "UP":
+            continue
+        for slot in node.get("slots") or []:
+            total_slots += 1
+            if slot.get("session"):
+                busy_slots += 1
+    return {"ready": bool(value.get("ready")), "total_slots": total_slots, "busy_slots": busy_slots}
+
+
+def fetch_grid_sessions(hub_url: str) -> Dict[str, Dict]:
+    """
+    Lista las sesiones activas del grid/standalone a partir de ``GET /status``
+    (Selenium 4: ``value.nodes[].slots[].session``).
+
+    Args:
+        hub_url: URL del WebDriver (p.ej. http://selenium-chrome:4444/wd/hub).
+
+    Returns:
+        Diccionario ``session_id -> {"start": datetime|None, "node": uri}``.
+
+    Raises:
+        httpx.HTTPError: Si el grid no responde o devuelve error.
+    """
+    value = _fetch_status_value(hub_url)
+    sessions = {}
+    for node in value.get("nodes") or []:
+        for slot in node.get("slots") or []:
+            session = slot.get("session")
+            if not session or not session.get("sessionId"):
+                continue
+            sessions[session["sessionId"]] = {
+                "start": _parse_start(session.get("start")),
+                "node": node.get("uri"),
+            }
+    return sessions
+
+
+def delete_grid_session(hub_url: str, session_id: str) -> bool:
+    """
+    Cierra una sesión del grid con ``DELETE /session/{id}``.
+
+    Returns:
+        True si se cerró o ya no existía (404), False si falló.
+    """
+    try:
+        response = httpx.delete(
+            f"{hub_url.rstrip('/')}/session/{session_id}", timeout=GRID_HTTP_TIMEOUT_SECONDS
+        )
+    except httpx.HTTPError as e:
+        logger.warning(f"Grid: Error de red cerrando sesión {session_id}: {e}")
+        return False
+    if response.status_code == 404 or response.is_success:
+        return True
+    logger.warning(f"Grid: HTTP {response.status_code} cerrando sesión {session_id}: {response.text[:200]}")
+    return False
@@ -0,0 +1,116 @@
+# core/utils/network_capture.py
+import json
+import logging
+import re
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Endpoints de medición de Google Analytics (Universal y GA4)
+ANALYTICS_HIT_PATTERN = re.compile(r"/(?:g/|j/|r/)?collect\?")
+
+# Parámetros comunes del Measurement Protocol -> nombres estilo DataLayer
+UA_PARAM_NAMES = {
+    "t": "hit_type",
+    "ec": "event_category",
+    "ea": "event_action",
+    "el": "event_label",
+    "ev": "event_value",
+}
+COMMON_PARAM_NAMES = {
+    "tid": "measurement_id",
+    "dl": "page_location",
+    "dt": "page_title",
+    "dr": "page_referrer",
+}
+
+
+def extract_analytics_requests(log_entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Filtra los logs de rendimiento de Chrome (eventos CDP ``Network``) y
+    devuelve solo las peticiones de medición de Google Analytics, sin decodificar.
+
+    Args:
+        log_entries: Entradas devueltas por el log 'performance' del WebDriver.
+
+    Returns:
+        Lista de peticiones crudas: ``{"url", "post_data", "timestamp_ms"}``.
+    """
+    hits = []
+    for entry in log_entries or []:
+        raw_message = entry.get("message") if isinstance(entry, dict) else None
+        # Pre-filtro barato antes de parsear JSON: la mayoría del tráfico no es de GA
+        if not raw_message or "collect" not in raw_message:
+            continue
+        try:
+            message = json.loads(raw_message).get("message", {})
+        except (TypeError, ValueError):
+            continue
+        if message.get("method") != "Network.requestWillBeSent":
+            continue
+        request = message.get("params", {}).get("request", {})
+        url = request.get("url", "")
+        if not ANALYTICS_HIT_PATTERN.search(url):
+            continue
+        hits.append(
+            {
+                "url": url,
+                "post_data": request.get("postData"),
+                "timestamp_ms": entry.get("timestamp"),
+            }
+        )
+    return hits
+
+
+def _flatten_hit_params(params: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """Convierte los parámetros de un hit en un evento plano estilo DataLayer."""
+    flat: Dict[str, Any] = {}
+    for key, value in params:
+        if key == "en":
+            flat["event"] = value
+        elif key.startswith("ep."):
+            flat[key[3:]] = value
+        elif key.startswith("epn."):
+            try:
+                number = float(value)
+                flat[key[4:]] = int(number) if number.is_integer() else number
+            except ValueError:
+                flat[key[4:]] = value
+        elif key in UA_PARAM_NAMES:
+            flat[UA_PARAM_NAMES[key]] = value
+        elif key in COMMON_PARAM_NAMES:
+            flat[COMMON_PARAM_NAMES[key]] = value
+    if "event" not in flat and "hit_type" in flat:
+        flat["event"] = flat["hit_type"]
+    return flat
+
+
+def decode_analytics_hits(raw_requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Decodifica en lote las peticiones de GA en eventos planos. Las peticiones
+    GA4 por lotes llevan un evento por línea en el cuerpo POST, que hereda los
+    parámetros compartidos de la query string.
+
+    Args:
+        raw_requests: Salida de ``extract_analytics_requests``.
+
+    Returns:
+        Lista de eventos planos con ``_captureTimestamp`` y ``_hitEndpoint``.
+    """
+    events = []
+    for raw in raw_requests or []:
+        try:
+            parts = urlsplit(raw.get("url", ""))
+            shared_params = parse_qsl(parts.query, keep_blank_values=True)
+            body_lines = [line for line in (raw.get("post_data") or "").splitlines() if line.strip()]
+            batches = [parse_qsl(line, keep_blank_values=True) for line in body_lines] or [[]]
+            for line_params in batches:
+                event = _flatten_hit_params(shared_params + line_params)
+                event["_captureTimestamp"] = raw.get("timestamp_ms")
+                event["_hitEndpoint"] = f"{parts.netloc}{parts.path}"
+                events.append(event)
+        except Exception as e:
+            logger.warning(f"No se pudo decodificar hit de GA '{str(raw.get('url'))[:200]}': {e}")
+    logger.info(f"Decodificados {len(events)} eventos de red desde {len(raw_requests or [])} peticiones de GA.")
+    return events
@@ -0,0 +1,91 @@
+# core/utils/precompressed.py
+import gzip
+import logging
+import os
+from typing import BinaryIO, Dict, Optional
+
+try:
+    import brotli  # Opcional: variante .br además de la .gz
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+GZIP_SUFFIX = ".gz"
+BROTLI_SUFFIX = ".br"
+
+
+def brotli_available() -> bool:
+    return brotli is not None
+
+
+def brotli_variant_name(gzip_name: str) -> str:
+    """Nombre de la variante brotli guardada junto a un archivo ``.gz``."""
+    return gzip_name[: -len(GZIP_SUFFIX)] + BROTLI_SUFFIX
+
+
+def public_report_name(stored_name: str) -> str:
+    """Nombre con el que se sirve un reporte (sin el sufijo de compresión)."""
+    name = os.path.basename(stored_name)
+    return name[: -len(GZIP_SUFFIX)] if name.endswith(GZIP_SUFFIX) else name
+
+
+def _accept_encoding_qvalues(accept_encoding: str) -> Dict[str, float]:
+    """``Accept-Encoding`` -> {codificación: q}. Un q mal formado cuenta como 0."""
+    qvalues = {}
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+        qvalues[coding] = q
+    return qvalues
+
+
+def accepts_encoding(accept_encoding: str, coding: str) -> bool:
+    """
+    Indica si el cliente acepta ``coding`` según ``Accept-Encoding`` (RFC 9110):
+    ``br;q=0`` la rechaza y ``*`` cubre las codificaciones no listadas.
+    """
+    qvalues = _accept_encoding_qvalues(accept_encoding)
+    q = qvalues.get(coding, qvalues.get("*", 0.0))
+    return q > 0
+
+
+class PrecompressedWriter:
+    """
+    Archivo de solo escritura que comprime lo que recibe a la vez en gzip y,
+    si ``brotli`` está instalado y se da ``brotli_file``, en brotli. Permite
+    volcar un render por trozos sin tener nunca el contenido en claro completo.
+    """
+
+    def __init__(self, gzip_file: BinaryIO, brotli_file: Optional[BinaryIO] = None,
+                 gzip_level: int = 6, brotli_quality: int = 5):
+        # mtime=0: mismo contenido -> mismos bytes
+        self._gzip = gzip.GzipFile(fileobj=gzip_file, mode="wb", compresslevel=gzip_level, mtime=0)
+        self._brotli_file = brotli_file if brotli_available() else None
+        self._brotli = brotli.Compressor(quality=brotli_quality) if self._brotli_file is not None else None
+
+    @property
+    def has_brotli(self) -> bool:
+        return self._brotli is not None
+
+    def write(self, data: bytes) -> int:
+        self._gzip.write(data)
+        if self._brotli is not None:
+            self._brotli_file.write(self._brotli.process(data))
+        return len(data)
+
+    def close(self) -> None:
+        """Cierra los flujos comprimidos (los archivos de destino siguen abiertos)."""
+        self._gzip.close()
+        if self._brotli is not None:
+            self._brotli_file.write(self._brotli.finish())
@@ -0,0 +1,58 @@
+# core/utils/redis_client.py
+import asyncio
+import logging
+from typing import Optional
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[redis.Redis] = None
+_async_client: Optional[aioredis.Redis] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_redis_client() -> redis.Redis:
+    """
+    Devuelve un cliente Redis síncrono compartido por el proceso.
+    El cliente mantiene su propio pool de conexiones, así que es seguro entre hilos.
+    """
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=5,
+            health_check_interval=30,
+        )
+        logger.debug(f"Cliente Redis creado para {settings.REDIS_URL}")
+    return _client
+
+
+def get_async_redis_client() -> aioredis.Redis:
+    """
+    Devuelve el cliente Redis asíncrono del event loop actual (procesos ASGI).
+    Se crea uno nuevo si el loop cambió, igual que el cliente HTTP de WebDriver.
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        _async_client = aioredis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=5,
+            health_check_interval=30,
+            decode_responses=True,
+        )
+        _async_client_loop = loop
+        logger.debug(f"Cliente Redis asíncrono creado para {settings.REDIS_URL}")
+    return _async_client
+
+
+async def close_async_redis_client() -> None:
+    """Cierra el cliente asíncrono (apagado ASGI)."""
+    global _async_client, _async_client_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+    _async_client = None
+    _async_client_loop = None
@@ -1,15 +1,23 @@
 # src/reporter/report_generator.py
 
+import functools
+import gzip
+import hashlib
 import json
 import os
 import logging
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import BinaryIO, Dict, Any, Iterator, List, Optional, TextIO, Tuple
+import contextlib
 import csv
 import jinja2  # Usar import directo
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 
+from .validation_logic import align_reference
+
 logger = logging.getLogger(__name__)
 
 
@@ -46,9 +54,149 @@ def tojson_filter(value, indent=None, ensure_ascii=False):
         return "{}"  # Devolver objeto vacío o string de error
 
 
+def reference_data_filter(detail, references):
+    """
+    Filtro Jinja2: propiedades de referencia del detalle (``references`` por
+    ``matched_section_id``) alineadas con el DataLayer capturado. Los
+    resultados antiguos traen la copia en ``reference_data``.
+    """
+    if detail.get("reference_data") is not None:
+        return detail["reference_data"]
+    reference = (references or {}).get(detail.get("matched_section_id"))
+    if not reference:
+        return None
+    return align_reference(detail.get("data"), reference.get("properties"))
+
+
 # --- FIN: Definición del filtro ---
 
 
+REPORT_TEMPLATE_DIR = os.path.join(settings.BASE_DIR, "core", "templates", "core", "reports")
+REPORT_TEMPLATE_NAME = "report_template.html"
+# Trozos de salida de Jinja2 agrupados por escritura al volcar el reporte a un archivo
+REPORT_STREAM_BUFFER_ITEMS = 64
+
+# Columnas del CSV de errores
+CSV_REPORT_FIELDS = ["datalayer_index", "matched_section", "error_message"]
+
+# Reporte "lazy" (capturas grandes): el HTML solo lleva el resumen y los detalles
+# se guardan en shards JSON comprimidos que la página pide según pagina/filtra.
+REPORT_DETAIL_SUBSETS = ("all", "invalid", "warnings")
+# Campos de cada detalle que usa el visor del reporte
+REPORT_DETAIL_FIELDS = (
+    "datalayer_index", "valid", "errors", "warnings", "matched_section", "match_score", "data", "reference_data",
+)
+
+
+REPORT_SHARDS_DIR = "validation_reports/shards"
+
+
+def report_shard_name(session_id, subset: str, shard_index: int, render_key: Optional[str] = None) -> str:
+    """
+    Nombre en el storage de un shard de detalles del reporte lazy de una
+    sesión. Van en una carpeta por ``render_key`` (``report_render_key``): un
+    render nuevo no pisa los shards que usa un HTML anterior. Sin
+    ``render_key``, los shards de reportes generados antes de versionarlos.
+    """
+    directory = f"{REPORT_SHARDS_DIR}/{session_id}" + (f"/{render_key}" if render_key else "")
+    return f"{directory}/{subset}-{shard_index:05d}.json.gz"
+
+
+def _detail_subsets(detail: Dict[str, Any]) -> List[str]:
+    """Subconjuntos (filtros del visor) a los que pertenece un detalle."""
+    subsets = ["all"]
+    if detail.get("valid") is False and detail.get("errors"):
+        subsets.append("invalid")
+    if detail.get("warnings"):
+        subsets.append("warnings")
+    return subsets
+
+
+# Subir al cambiar cómo se construye el HTML en código (invalida los renders bajo demanda)
+REPORT_RENDER_VERSION = 1
+
+
+def results_hash(validation_results: Dict[str, Any]) -> str:
+    """SHA-256 de los resultados de validación en JSON canónico (claves ordenadas)."""
+    payload = json.dumps(validation_results, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def report_render_key(results_hash: str, template_version: str) -> str:
+    """Clave de un render del reporte: resultados + versión de plantilla (nombres y ETag)."""
+    return f"{results_hash[:16]}-{template_version}"
+
+
+@functools.lru_cache(maxsize=8)
+def _template_version(template_path: str, mtime: float) -> str:
+    with open(template_path, "rb") as f:
+        digest = hashlib.sha256(f.read())
+    digest.update(str(REPORT_RENDER_VERSION).encode())
+    return digest.hexdigest()[:12]
+
+
+def report_template_version() -> str:
+    """
+    Versión de la plantilla del reporte: hash de su contenido (y de
+    ``REPORT_RENDER_VERSION``). Cambia al desplegar una plantilla nueva.
+    """
+    template_path = os.path.join(REPORT_TEMPLATE_DIR, REPORT_TEMPLATE_NAME)
+    return _template_version(template_path, os.path.getmtime(template_path))
+
+
+# Entorno Jinja2 del proceso: la plantilla se compila una vez y se reutiliza
+_report_env: Optional[jinja2.Environment] = None
+_report_env_lock = threading.Lock()
+
+
+def build_report_environment(bytecode_dir: Optional[str] = None, auto_reload: bool = True) -> jinja2.Environment:
+    """
+    Crea un entorno Jinja2 para los reportes con los filtros personalizados.
+    Con ``bytecode_dir`` las plantillas compiladas se guardan en disco y otros
+    procesos las cargan sin volver a parsear el HTML.
+    """
+    bytecode_cache = None
+    if bytecode_dir:
+        os.makedirs(bytecode_dir, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(bytecode_dir)
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(REPORT_TEMPLATE_DIR),
+        autoescape=jinja2.select_autoescape(["html", "xml"]),
+        bytecode_cache=bytecode_cache,
+        auto_reload=auto_reload,
+    )
+    env.filters["format_datetime"] = format_datetime_filter
+    env.filters["tojson"] = tojson_filter
+    env.filters["reference_data"] = reference_data_filter
+    return env
+
+
+def get_report_environment() -> jinja2.Environment:
+    """
+    Devuelve el entorno Jinja2 compartido del proceso (se crea la primera vez).
+    Sin ``REPORT_TEMPLATE_AUTO_RELOAD`` ``get_template`` no vuelve a mirar el disco.
+    """
+    global _report_env
+    if _report_env is None:
+        with _report_env_lock:
+            if _report_env is None:
+                _report_env = build_report_environment(
+                    bytecode_dir=settings.REPORT_TEMPLATE_BYTECODE_DIR or None,
+                    auto_reload=settings.REPORT_TEMPLATE_AUTO_RELOAD,
+                )
+                logger.info(f"Entorno Jinja2 de reportes creado (plantillas en {REPORT_TEMPLATE_DIR}).")
+    return _report_env
+
+
+def warm_report_templates() -> None:
+    """Compila (o carga del bytecode) la plantilla del reporte antes de la primera tarea."""
+    try:
+        get_report_environment().get_template(REPORT_TEMPLATE_NAME)
+        logger.info(f"Plantilla de reporte '{REPORT_TEMPLATE_NAME}' precargada.")
+    except Exception as e:
+        logger.warning(f"No se pudo precargar la plantilla de reporte: {e}")
+
+
 class ReportGenerator:
     """
     Clase para generar reportes de validación de DataLayers.
@@ -62,28 +210,7 @@ class ReportGenerator:
         self.output_dir = config.get("paths", {}).get("output", "docs/output")
         self.ensure_output_dir()
 
-        template_dir = os.path.join(
-            settings.BASE_DIR, "core", "templates", "core", "reports"
-        )
-        logger.info(f"Directorio de plantillas configurado en: {template_dir}")
-
-        try:
-            # Configurar Jinja2
-            self.jinja_env = jinja2.Environment(
-                loader=jinja2.FileSystemLoader(template_dir),
-                autoescape=jinja2.select_autoescape(["html", "xml"]),
-            )
-            # --- INICIO: Registrar filtros personalizados en __init__ ---
-            self.jinja_env.filters["format_datetime"] = format_datetime_filter
-            self.jinja_env.filters["tojson"] = tojson_filter
-            # --- FIN: Registrar filtros ---
-            logger.info("Entorno Jinja2 configurado correctamente con filtros.")
-        except Exception as e:
-            logger.error(
-                f"Error al configurar Jinja2. Verifica la ruta del directorio de plantillas: {template_dir}",
-                exc_info=True,
-            )
-            raise e
+        self.jinja_env = get_report_environment()
 
     def ensure_output_dir(self) -> None:
         """
@@ -108,6 +235,71 @@ class ReportGenerator:
         timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
         return f"validation_{sanitized_url}_{timestamp}.{extension}"
 
+    def write_data_reports(
+        self,
+        validation_results: Dict[str, Any],
+        json_file: Optional[BinaryIO] = None,
+        csv_file: Optional[TextIO] = None,
+    ) -> int:
+        """
+        Escribe en una sola pasada sobre los detalles el JSON completo de
+        resultados (``json_file``, binario UTF-8) y el CSV de errores
+        (``csv_file``, texto). Ambos se vuelcan detalle a detalle, sin
+        construir el documento ni la lista de errores en memoria.
+
+        Returns:
+            Número de filas de error escritas en el CSV.
+        """
+        csv_writer = None
+        if csv_file is not None:
+            csv_writer = csv.DictWriter(csv_file, fieldnames=CSV_REPORT_FIELDS)
+            csv_writer.writeheader()
+        if json_file is not None:
+            # Las claves pequeñas primero y 'details' al final, un detalle por escritura
+            header = {key: value for key, value in validation_results.items() if key != "details"}
+            json_file.write(json.dumps(header, ensure_ascii=False)[:-1].encode("utf-8"))
+            json_file.write(b'%s"details": [' % (b", " if header else b""))
+
+        errors_count = 0
+        for i, detail in enumerate(validation_results.get("details", [])):
+            if json_file is not None:
+                json_file.write((", " if i else "").encode("utf-8") + json.dumps(detail, ensure_ascii=False).encode("utf-8"))
+            if csv_writer is not None:
+                for error in detail.get("errors") or []:
+                    csv_writer.writerow({
+                        "datalayer_index": i + 1,
+                        "matched_section": detail.get("matched_section", "N/A"),
+                        "error_message": error,
+                    })
+                    errors_count += 1
+
+        if json_file is not None:
+            json_file.write(b"]}")
+        return errors_count
+
+    def generate_data_reports(
+        self, validation_results: Dict[str, Any], url: str, formats: List[str]
+    ) -> Dict[str, str]:
+        """
+        Genera los reportes JSON y/o CSV pedidos en ``formats`` con una sola
+        pasada sobre los detalles (ver ``write_data_reports``).
+        """
+        paths = {}
+        for fmt in ("json", "csv"):
+            if fmt in formats:
+                paths[fmt] = os.path.join(self.output_dir, self.generate_filename(url, fmt))
+        with contextlib.ExitStack() as stack:
+            json_file = stack.enter_context(open(paths["json"], "wb")) if "json" in paths else None
+            csv_file = (
+                stack.enter_context(open(paths["csv"], "w", newline="", encoding="utf-8"))
+                if "csv" in paths else None
+            )
+            errors_count = self.write_data_reports(validation_results, json_file=json_file, csv_file=csv_file)
+        logger.info(f"Reportes de datos generados: {', '.join(paths.values())}")
+        if "csv" in paths and not errors_count:
+            paths["csv"] += " (Vacío, sin errores)"
+        return paths
+
     def generate_json_report(
         self,
         validation_results: Dict[str, Any],
@@ -120,8 +312,8 @@ class ReportGenerator:
         filename = self.generate_filename(url, "json")
         filepath = os.path.join(self.output_dir, filename)
         try:
-            with open(filepath, "w", encoding="utf-8") as f:
-                json.dump(validation_results, f, indent=2, ensure_ascii=False)
+            with open(filepath, "wb") as f:
+                self.write_data_reports(validation_results, json_file=f)
             logger.info(f"Reporte JSON generado: {filepath}")
         except IOError as e:
             logger.error(f"Error al guardar el reporte JSON en {filepath}: {e}")
@@ -138,37 +330,17 @@ class ReportGenerator:
         filename = self.generate_filename(url, "csv")
         filepath = os.path.join(self.output_dir, filename)
 
-        errors_found = []
         try:
-            for i, detail in enumerate(validation_results.get("details", [])):
-                if detail.get("errors"):
-                    for error in detail.get("errors", []):
-                        errors_found.append(
-                            {
-                                "datalayer_index": i + 1,
-                                "error_message": error,
-                                "matched_section": detail.get("matched_section", "N/A"),
-                                # Añadir más campos del 'detail' si es necesario
-                            }
-                        )
-
-            if not errors_found:
+            with open(filepath, "w", newline="", encoding="utf-8") as f:
+                errors_count = self.write_data_reports(validation_results, csv_file=f)
+
+            if not errors_count:
                 logger.info(
                     "No se encontraron errores específicos para generar reporte CSV."
                 )
-                # Crear archivo vacío con cabeceras para consistencia
-                with open(filepath, "w", newline="", encoding="utf-8") as f:
-                    fieldnames = ["datalayer_index", "matched_section", "error_message"]
-                    writer = csv.DictWriter(f, fieldnames=fieldnames)
-                    writer.writeheader()
+                # Archivo vacío con cabeceras para consistencia
                 return filepath + " (Vacío, sin errores)"
 
-            with open(filepath, "w", newline="", encoding="utf-8") as f:
-                fieldnames = ["datalayer_index", "matched_section", "error_message"]
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(errors_found)
-
             logger.info(f"Reporte CSV generado: {filepath}")
 
         except IOError as e:
@@ -179,6 +351,145 @@ class ReportGenerator:
             filepath += " (ERROR)"
         return filepath
 
+    def build_detail_manifest(
+        self, validation_results: Dict[str, Any], shard_size: int, data_url: str
+    ) -> Dict[str, Any]:
+        """
+        Manifiesto del reporte lazy: cuántos detalles tiene cada subconjunto,
+        tamaño de shard y URL de la que el visor pide los shards.
+        """
+        counts = {subset: 0 for subset in REPORT_DETAIL_SUBSETS}
+        for detail in validation_results.get("details", []):
+            for subset in _detail_subsets(detail):
+                counts[subset] += 1
+        return {"data_url": data_url, "shard_size": shard_size, "counts": counts}
+
+    def iter_detail_shards(
+        self, validation_results: Dict[str, Any], shard_size: int
+    ) -> Iterator[Tuple[str, int, bytes]]:
+        """
+        Parte los detalles de validación en shards JSON comprimidos con gzip, uno
+        por página del visor y subconjunto (todos, inválidos, con warnings).
+
+        Yields:
+            ``(subset, shard_index, gzip_bytes)``.
+        """
+        members = {subset: [] for subset in REPORT_DETAIL_SUBSETS}
+        references = validation_results.get("references")
+        for detail in validation_results.get("details", []):
+            compact = {field: detail.get(field) for field in REPORT_DETAIL_FIELDS}
+            compact["reference_data"] = reference_data_filter(detail, references)
+            for subset in _detail_subsets(detail):
+                members[subset].append(compact)
+        for subset, details in members.items():
+            for shard_index, start in enumerate(range(0, len(details), shard_size)):
+                payload = json.dumps(details[start:start + shard_size], ensure_ascii=False, separators=(",", ":"))
+                yield subset, shard_index, gzip.compress(payload.encode("utf-8"), compresslevel=6)
+
+    def build_html_context(
+        self, validation_results: Dict[str, Any], url: str, lazy_manifest: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Construye el contexto de la plantilla HTML usando los recuentos únicos del resumen.
+        Con ``lazy_manifest`` la plantilla solo pinta el resumen y un visor que
+        carga los detalles por shards.
+        """
+        all_details = validation_results.get("details", [])
+        summary_data = validation_results.get("summary", {})
+
+        # --- Usar los contadores únicos del summary ---
+        unique_valid_count = summary_data.get("unique_valid_matches", 0)
+        unique_invalid_count = summary_data.get("unique_invalid_matches", 0)
+        unique_warning_count = summary_data.get(
+            "unique_datalayers_with_warnings", 0
+        )
+        # No necesitamos contar los 'unmatched' para el % de éxito de esta forma
+        total_unique_matches = unique_valid_count + unique_invalid_count
+
+        # Calcular % de éxito basado en matches únicos válidos vs total de matches únicos
+        success_percent = (
+            (unique_valid_count / total_unique_matches * 100)
+            if total_unique_matches > 0
+            else 0
+        )
+        logger.info(
+            f"Calculando success_percent: {unique_valid_count} / {total_unique_matches} = {success_percent}"
+        )
+
+        # Filtrar detalles con warnings (para la lista detallada de warnings)
+        details_with_warnings = [
+            detail
+            for detail in all_details
+            if detail.get("warnings") and len(detail["warnings"]) > 0
+        ] if lazy_manifest is None else []
+        # El conteo total de items únicos con warnings ya está en unique_warning_count
+
+        # Copia: no tocar los resultados, que se serializan a JSON a la vez en otro hilo
+        comparison_data = dict(validation_results.get("comparison") or {})
+        # Asegurar valores por defecto para comparison
+        comparison_data.setdefault("reference_count", 0)
+        comparison_data.setdefault(
+            "captured_count", 0
+        )  # Total capturados relevantes
+        comparison_data.setdefault(
+            "matched_count", 0
+        )  # Referencias únicas encontradas
+        comparison_data.setdefault(
+            "missing_count", 0
+        )  # Referencias únicas no encontradas
+
+        comparison_data.setdefault("coverage_percent", 0.0)
+        comparison_data.setdefault("missing_details", [])
+
+        report_timestamp = validation_results.get(
+            "timestamp", datetime.now().isoformat()
+        )
+        report_url = validation_results.get("url", url)
+
+        # --- Construir el contexto con los valores únicos para el resumen ---
+        context = {
+            "timestamp": report_timestamp,
+            "url": report_url,
+            "is_valid": validation_results.get("valid", False),
+            "details": all_details,  # Pasar todos los detalles para la sección detallada
+            "comparison": comparison_data,
+            "references": validation_results.get("references") or {},  # Por ID de sección
+            "summary": summary_data,  # Pasar el summary completo
+            # --- Usar los contadores únicos para la sección de resumen general ---
+            "valid_count": unique_valid_count,
+            "invalid_count": unique_invalid_count,
+            "warning_count": unique_warning_count,
+            "unmatched_count": summary_data.get(
+                "unique_unmatched_datalayers", 0
+            ),  # Para posible uso en plantilla
+            "total_unique_relevant": summary_data.get(
+                "total_unique_captured_relevant", 0
+            ),  # Para posible uso en plantilla
+            # --- Fin contadores únicos ---
+            "success_percent": round(success_percent, 1),
+            "details_with_warnings": details_with_warnings,  # Para la lista desplegable de warnings
+            "general_warnings": validation_results.get("warnings", []),
+            "network": validation_results.get("network"),  # Hits de GA capturados en red (opcional)
+            "lazy": lazy_manifest,  # Visor paginado en lugar de todos los detalles en línea
+        }
+        return context
+
+    def write_html_report(
+        self,
+        fileobj: BinaryIO,
+        validation_results: Dict[str, Any],
+        url: str,
+        lazy_manifest: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Renderiza el reporte HTML por trozos (``template.stream``) directamente en
+        ``fileobj`` (binario, UTF-8), sin construir el documento completo en memoria.
+        """
+        template = self.jinja_env.get_template(REPORT_TEMPLATE_NAME)
+        stream = template.stream(**self.build_html_context(validation_results, url, lazy_manifest))
+        stream.enable_buffering(REPORT_STREAM_BUFFER_ITEMS)
+        stream.dump(fileobj, encoding="utf-8")
+
     def generate_html_report(
         self,
         validation_results: Dict[str, Any],
@@ -192,87 +503,8 @@ class ReportGenerator:
         filepath = os.path.join(self.output_dir, filename)
 
         try:
-            template = self.jinja_env.get_template("report_template.html")
-
-            all_details = validation_results.get("details", [])
-            summary_data = validation_results.get("summary", {})
-
-            # --- Usar los contadores únicos del summary ---
-            unique_valid_count = summary_data.get("unique_valid_matches", 0)
-            unique_invalid_count = summary_data.get("unique_invalid_matches", 0)
-            unique_warning_count = summary_data.get(
-                "unique_datalayers_with_warnings", 0
-            )
-            # No necesitamos contar los 'unmatched' para el % de éxito de esta forma
-            total_unique_matches = unique_valid_count + unique_invalid_count
-
-            # Calcular % de éxito basado en matches únicos válidos vs total de matches únicos
-            success_percent = (
-                (unique_valid_count / total_unique_matches * 100)
-                if total_unique_matches > 0
-                else 0
-            )
-            logger.info(
-                f"Calculando success_percent: {unique_valid_count} / {total_unique_matches} = {success_percent}"
-            )
-
-            # Filtrar detalles con warnings (para la lista detallada de warnings)
-            details_with_warnings = [
-                detail
-                for detail in all_details
-                if detail.get("warnings") and len(detail["warnings"]) > 0
-            ]
-            # El conteo total de items únicos con warnings ya está en unique_warning_count
-
-            comparison_data = validation_results.get("comparison", {})
-            # Asegurar valores por defecto para comparison
-            comparison_data.setdefault("reference_count", 0)
-            comparison_data.setdefault(
-                "captured_count", 0
-            )  # Total capturados relevantes
-            comparison_data.setdefault(
-                "matched_count", 0
-            )  # Referencias únicas encontradas
-            comparison_data.setdefault(
-                "missing_count", 0
-            )  # Referencias únicas no encontradas
-
-            comparison_data.setdefault("coverage_percent", 0.0)
-            comparison_data.setdefault("missing_details", [])
-
-            report_timestamp = validation_results.get(
-                "timestamp", datetime.now().isoformat()
-            )
-            report_url = validation_results.get("url", url)
-
-            # --- Construir el contexto con los valores únicos para el resumen ---
-            context = {
-                "timestamp": report_timestamp,
-                "url": report_url,
-                "is_valid": validation_results.get("valid", False),
-                "details": all_details,  # Pasar todos los detalles para la sección detallada
-                "comparison": comparison_data,
-                "summary": summary_data,  # Pasar el summary completo
-                # --- Usar los contadores únicos para la sección de resumen general ---
-                "valid_count": unique_valid_count,
-                "invalid_count": unique_invalid_count,
-                "warning_count": unique_warning_count,
-                "unmatched_count": summary_data.get(
-                    "unique_unmatched_datalayers", 0
-                ),  # Para posible uso en plantilla
-                "total_unique_relevant": summary_data.get(
-                    "total_unique_captured_relevant", 0
-                ),  # Para posible uso en plantilla
-                # --- Fin contadores únicos ---
-                "success_percent": round(success_percent, 1),
-                "details_with_warnings": details_with_warnings,  # Para la lista desplegable de warnings
-                "general_warnings": validation_results.get("warnings", []),
-            }
-
-            html_content = template.render(**context)
-
-            with open(filepath, "w", encoding="utf-8") as f:
-                f.write(html_content)
+            with open(filepath, "wb") as f:
+                self.write_html_report(f, validation_results, url)
             logger.info(f"Reporte HTML generado: {filepath}")
 
         except jinja2.exceptions.TemplateNotFound:
@@ -339,39 +571,34 @@ class ReportGenerator:
         reports = {}
         generated_files_list = []
 
-        if "json" in formats:
-            try:
-                report_path = self.generate_json_report(validation_results, url, schema)
-                if "(ERROR)" not in report_path:  # Solo añadir si no hubo error
-                    reports["json"] = report_path
-                    generated_files_list.append(report_path)
-            except Exception as e:
-                logger.error(f"Fallo al generar reporte JSON: {e}", exc_info=True)
-                reports["json"] = "ERROR"
-
-        if "csv" in formats:
-            try:
-                report_path = self.generate_csv_report(validation_results, url)
-                if (
-                    "(ERROR)" not in report_path and "(Vacío" not in report_path
-                ):  # No añadir si vacío o error
-                    reports["csv"] = report_path
-                    generated_files_list.append(report_path)
-                elif "(Vacío" in report_path:
-                    reports["csv"] = report_path  # Mantener info de vacío
-            except Exception as e:
-                logger.error(f"Fallo al generar reporte CSV: {e}", exc_info=True)
-                reports["csv"] = "ERROR"
-
-        if "html" in formats:
-            try:
-                report_path = self.generate_html_report(validation_results, url, schema)
-                if "(ERROR)" not in report_path:  # Solo añadir si no hubo error
-                    reports["html"] = report_path
-                    generated_files_list.append(report_path)
-            except Exception as e:
-                logger.error(f"Fallo al generar reporte HTML: {e}", exc_info=True)
-                reports["html"] = "ERROR"
+        # El HTML se renderiza en un hilo mientras JSON y CSV se escriben en una
+        # sola pasada sobre los detalles en este
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            html_future = (
+                executor.submit(self.generate_html_report, validation_results, url, schema)
+                if "html" in formats else None
+            )
+
+            if "json" in formats or "csv" in formats:
+                try:
+                    data_reports = self.generate_data_reports(validation_results, url, formats)
+                except Exception as e:
+                    logger.error(f"Fallo al generar reportes JSON/CSV: {e}", exc_info=True)
+                    data_reports = {fmt: "ERROR" for fmt in ("json", "csv") if fmt in formats}
+                for fmt, report_path in data_reports.items():
+                    reports[fmt] = report_path
+                    if "ERROR" not in report_path and "(Vacío" not in report_path:
+                        generated_files_list.append(report_path)
+
+            if html_future is not None:
+                try:
+                    report_path = html_future.result()
+                    if "(ERROR)" not in report_path:  # Solo añadir si no hubo error
+                        reports["html"] = report_path
+                        generated_files_list.append(report_path)
+                except Exception as e:
+                    logger.error(f"Fallo al generar reporte HTML: {e}", exc_info=True)
+                    reports["html"] = "ERROR"
 
         # Generar resumen con la lista de archivos generados exitosamente
         try:
@@ -0,0 +1,233 @@
+# core/utils/report_storage.py
+import codecs
+import contextlib
+import logging
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.urls import reverse
+
+from ..models import Session
+from .precompressed import GZIP_SUFFIX, BROTLI_SUFFIX, PrecompressedWriter, brotli_variant_name
+from .report_generator import (
+    REPORT_SHARDS_DIR,
+    ReportGenerator,
+    report_render_key,
+    report_shard_name,
+    report_template_version,
+)
+from .result_store import load_validation_results
+
+logger = logging.getLogger(__name__)
+
+# Renders bajo demanda: uno por (hash de resultados, versión de plantilla)
+RENDERED_REPORTS_DIR = "validation_reports/rendered"
+
+
+def get_report_storage():
+    """Storage de los archivos de reporte (el del campo ``Session.report_file``)."""
+    return Session._meta.get_field("report_file").storage
+
+
+class ReportArtifact:
+    """
+    Archivo de reporte en construcción: se escribe por trozos en archivos en
+    memoria que pasan a disco si superan ``REPORT_SPOOL_MAX_BYTES`` y se guarda
+    en el storage sin copias intermedias. Con ``REPORT_PRECOMPRESS`` se guarda ya
+    comprimido (``.gz`` y, si ``brotli`` está instalado, ``.br`` al lado) sin
+    escribir nunca el contenido en claro.
+    """
+
+    def __init__(self, stack: contextlib.ExitStack, name: str):
+        self.name = name
+        self.spool = stack.enter_context(tempfile.SpooledTemporaryFile(max_size=settings.REPORT_SPOOL_MAX_BYTES))
+        self.brotli_spool = None
+        self.writer = self.spool
+        if settings.REPORT_PRECOMPRESS:
+            self.name += GZIP_SUFFIX
+            self.brotli_spool = stack.enter_context(tempfile.SpooledTemporaryFile(max_size=settings.REPORT_SPOOL_MAX_BYTES))
+            self.writer = PrecompressedWriter(self.spool, self.brotli_spool, brotli_quality=settings.REPORT_BROTLI_QUALITY)
+
+    def save(self, storage, saved_names: List[str]) -> str:
+        """Cierra la compresión y guarda el archivo (y su variante brotli). Devuelve el nombre guardado."""
+        if self.writer is not self.spool:
+            self.writer.close()
+        self.spool.seek(0)
+        stored_name = storage.save(self.name, File(self.spool, name=self.name))
+        saved_names.append(stored_name)
+        if self.writer is not self.spool and self.writer.has_brotli:
+            brotli_name = brotli_variant_name(stored_name)
+            if storage.exists(brotli_name):
+                storage.delete(brotli_name)
+            self.brotli_spool.seek(0)
+            saved_names.append(storage.save(brotli_name, File(self.brotli_spool, name=brotli_name)))
+        return stored_name
+
+
+def store_report_shards(session_id, render_key: str, report_generator: ReportGenerator,
+                        validation_results: Dict[str, Any], storage, saved_names: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Si la sesión tiene ``REPORT_LAZY_MIN_DETAILS`` detalles o más, guarda en el
+    storage los shards gzip de detalles del reporte lazy del render
+    ``render_key`` y devuelve el manifiesto que se incrusta en el HTML. Si no,
+    devuelve None (reporte completo). Un shard ya guardado con la misma clave
+    tiene el mismo contenido (p.ej. lo escribió otra petición): no se reescribe.
+    """
+    details_count = len(validation_results.get("details") or [])
+    if not settings.REPORT_LAZY_MIN_DETAILS or details_count < settings.REPORT_LAZY_MIN_DETAILS:
+        return None
+    shards_count = 0
+    for subset, shard_index, payload in report_generator.iter_detail_shards(validation_results, settings.REPORT_SHARD_SIZE):
+        name = report_shard_name(session_id, subset, shard_index, render_key)
+        shards_count += 1
+        if storage.exists(name):
+            continue
+        saved_names.append(storage.save(name, ContentFile(payload)))
+    logger.info(f"Session {session_id}: {details_count} detalles. Reporte lazy con {shards_count} shards.")
+    return report_generator.build_detail_manifest(
+        validation_results,
+        settings.REPORT_SHARD_SIZE,
+        data_url=reverse("session_report_data", args=[session_id, render_key]),
+    )
+
+
+def store_report_html(report_generator: ReportGenerator, validation_results: Dict[str, Any], url: str,
+                      lazy_manifest: Optional[Dict[str, Any]], storage, report_name: str,
+                      saved_names: List[str]) -> str:
+    """Renderiza el HTML del reporte y lo guarda en el storage. Devuelve el nombre guardado."""
+    with contextlib.ExitStack() as stack:
+        artifact = ReportArtifact(stack, report_name)
+        report_generator.write_html_report(artifact.writer, validation_results, url, lazy_manifest)
+        return artifact.save(storage, saved_names)
+
+
+def store_report_data(report_generator: ReportGenerator, validation_results: Dict[str, Any], storage,
+                      json_name: str, csv_name: str, saved_names: List[str]) -> Tuple[str, str]:
+    """
+    Escribe el JSON de resultados y el CSV de errores en una sola pasada sobre
+    los detalles y los guarda en el storage. Devuelve ``(json_name, csv_name)``.
+    """
+    with contextlib.ExitStack() as stack:
+        json_artifact = ReportArtifact(stack, json_name)
+        csv_artifact = ReportArtifact(stack, csv_name)
+        csv_text = codecs.getwriter("utf-8")(csv_artifact.writer) # csv escribe texto
+        report_generator.write_data_reports(validation_results, json_file=json_artifact.writer, csv_file=csv_text)
+        return json_artifact.save(storage, saved_names), csv_artifact.save(storage, saved_names)
+
+
+def delete_stored_files(storage, names: List[str], session_id) -> None:
+    """Borra archivos ya guardados (limpieza tras un fallo), sin propagar errores."""
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception as e:
+            logger.warning(f"Session {session_id}: No se pudo borrar el archivo de reporte {name}: {e}")
+
+
+def rendered_report_name(session_id, results_hash: str, template_version: str) -> str:
+    """Nombre (sin sufijo de compresión) del render bajo demanda de unos resultados."""
+    return f"{RENDERED_REPORTS_DIR}/{session_id}/{report_render_key(results_hash, template_version)}.html"
+
+
+def _find_stored_variant(storage, name: str) -> Optional[str]:
+    """El render guardado con o sin compresión (según ``REPORT_PRECOMPRESS`` al guardarlo)."""
+    for candidate in (name + GZIP_SUFFIX, name):
+        if storage.exists(candidate):
+            return candidate
+    return None
+
+
+def _prune_rendered_reports(storage, session_id, keep: str, keep_render_key: str) -> None:
+    """
+    Borra los renders de la sesión hechos con otros resultados o versiones de
+    plantilla, y sus carpetas de shards. Los shards sin clave (de
+    ``report_file``) se conservan.
+    """
+    directory = f"{RENDERED_REPORTS_DIR}/{session_id}"
+    keep_names = {keep, brotli_variant_name(keep)} if keep.endswith(GZIP_SUFFIX) else {keep}
+    try:
+        _, files = storage.listdir(directory)
+    except (FileNotFoundError, NotImplementedError):
+        return
+    for filename in files:
+        name = f"{directory}/{filename}"
+        if name not in keep_names and filename.endswith((".html", GZIP_SUFFIX, BROTLI_SUFFIX)):
+            delete_stored_files(storage, [name], session_id)
+
+    shards_directory = f"{REPORT_SHARDS_DIR}/{session_id}"
+    try:
+        render_keys, _ = storage.listdir(shards_directory)
+    except (FileNotFoundError, NotImplementedError):
+        return
+    for render_key in render_keys:
+        if render_key == keep_render_key:
+            continue
+        render_directory = f"{shards_directory}/{render_key}"
+        _, shard_files = storage.listdir(render_directory)
+        delete_stored_files(storage, [f"{render_directory}/{filename}" for filename in shard_files], session_id)
+        delete_stored_files(storage, [render_directory], session_id)
+
+
+def find_rendered_report(session_id, results_hash: str) -> Optional[str]:
+    """Nombre del render ya guardado para los resultados y la plantilla actuales, o None."""
+    name = rendered_report_name(session_id, results_hash, report_template_version())
+    return _find_stored_variant(get_report_storage(), name)
+
+
+def _render_lock_key(session_id, results_hash: str) -> str:
+    return f"report-render:{session_id}:{report_render_key(results_hash, report_template_version())}"
+
+
+def acquire_render_lock(session_id, results_hash: str) -> bool:
+    """
+    Reserva el render bajo demanda de unos resultados (``cache.add`` atómico,
+    compartido entre procesos): solo la primera petición lo encola, el resto
+    espera a que aparezca en el storage. Caduca sola si el worker muere.
+    """
+    return cache.add(_render_lock_key(session_id, results_hash), 1, settings.REPORT_RENDER_LOCK_SECONDS)
+
+
+def release_render_lock(session_id, results_hash: str) -> None:
+    cache.delete(_render_lock_key(session_id, results_hash))
+
+
+def get_or_render_report(session_id, results_hash: str) -> str:
+    """
+    Devuelve el nombre en el storage del reporte HTML de la sesión para sus
+    resultados actuales y la versión actual de la plantilla. Si no existe, lo
+    renderiza desde los resultados guardados y borra los renders anteriores.
+    """
+    storage = get_report_storage()
+    template_version = report_template_version()
+    render_key = report_render_key(results_hash, template_version)
+    name = rendered_report_name(session_id, results_hash, template_version)
+    stored_name = _find_stored_variant(storage, name)
+    if stored_name:
+        return stored_name
+
+    session = Session.objects.only("url").get(pk=session_id)
+    validation_results = load_validation_results(session_id)
+    report_generator = ReportGenerator(config={"paths": {"output": tempfile.gettempdir()}})
+    saved_names, html_names = [], []
+    try:
+        lazy_manifest = store_report_shards(session_id, render_key, report_generator, validation_results, storage, saved_names)
+        stored_name = _find_stored_variant(storage, name) # ¿Lo renderizó otra petición mientras tanto?
+        if stored_name is None:
+            stored_name = store_report_html(
+                report_generator, validation_results, session.url, lazy_manifest, storage, name, html_names
+            )
+    except Exception:
+        delete_stored_files(storage, saved_names + html_names, session_id)
+        raise
+    expected_name = name + GZIP_SUFFIX if settings.REPORT_PRECOMPRESS else name
+    if stored_name != expected_name and storage.exists(expected_name):
+        # Otra petición guardó el mismo render a la vez (el nuestro recibió otro nombre): usar el suyo
+        delete_stored_files(storage, html_names, session_id)
+        stored_name = expected_name
+    logger.info(f"Session {session_id}: Reporte renderizado bajo demanda en {stored_name}.")
+    _prune_rendered_reports(storage, session_id, keep=stored_name, keep_render_key=render_key)
+    return stored_name
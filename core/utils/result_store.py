@@ -0,0 +1,186 @@
+# core/utils/result_store.py
+import logging
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+from django.db.models import F, Max
+
+from ..models import CapturedEvent, NetworkHit, Session, ValidationDetail
+
+logger = logging.getLogger(__name__)
+
+# Columnas de ValidationDetail que forman el dict de detalle de validation_logic
+VALIDATION_DETAIL_COLUMNS = (
+    "datalayer_index", "data", "valid", "errors", "warnings", "source",
+    "matched_section_id", "matched_section", "match_score", "captured_at_ms",
+)
+
+
+def _capture_timestamp(item: Any) -> Optional[int]:
+    timestamp = item.get("_captureTimestamp") if isinstance(item, dict) else None
+    return int(timestamp) if isinstance(timestamp, (int, float)) else None
+
+
+def _batches(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def append_captured_events(session_pk, items: List[Any]) -> int:
+    """
+    Añade DataLayers capturados a continuación de los ya guardados de la
+    sesión. Llamar con la fila de la sesión bloqueada (``select_for_update``)
+    para que dos drenados no repitan ``sequence``.
+
+    Returns:
+        Número de eventos guardados.
+    """
+    last = CapturedEvent.objects.filter(session_id=session_pk).aggregate(last=Max("sequence"))["last"]
+    start = 0 if last is None else last + 1
+    CapturedEvent.objects.bulk_create(
+        (
+            CapturedEvent(session_id=session_pk, sequence=start + i, captured_at_ms=_capture_timestamp(item), data=item)
+            for i, item in enumerate(items)
+        ),
+        batch_size=settings.RESULT_STORE_BATCH_SIZE,
+    )
+    return len(items)
+
+
+def load_captured_data(session: Session) -> List[Any]:
+    """
+    DataLayers capturados de la sesión en orden de captura. Las sesiones
+    anteriores a CapturedEvent los tienen en ``Session.captured_data``.
+    """
+    events = list(
+        CapturedEvent.objects.filter(session_id=session.pk)
+        .order_by("sequence")
+        .values_list("data", flat=True)
+        .iterator(chunk_size=settings.RESULT_STORE_BATCH_SIZE)
+    )
+    if events:
+        return events
+    legacy = Session.objects.filter(pk=session.pk).values_list("captured_data", flat=True).first()
+    return legacy or []
+
+
+def append_network_hits(session_pk, hits: List[Dict[str, Any]], max_buffer: int) -> int:
+    """
+    Añade peticiones de GA (salida de ``extract_analytics_requests``) como
+    filas ``NetworkHit``, sin reescribir las ya guardadas. Como mucho se
+    guardan ``max_buffer`` por sesión; el resto suma a
+    ``Session.network_hits_dropped``. Llamar con la fila de la sesión
+    bloqueada (``select_for_update``) para que dos drenados no repitan
+    ``sequence``.
+
+    Returns:
+        Número de peticiones guardadas.
+    """
+    last = NetworkHit.objects.filter(session_id=session_pk).aggregate(last=Max("sequence"))["last"]
+    start = 0 if last is None else last + 1
+    accepted = hits[:max(max_buffer - start, 0)]
+    NetworkHit.objects.bulk_create(
+        (
+            NetworkHit(
+                session_id=session_pk,
+                sequence=start + i,
+                captured_at_ms=int(hit["timestamp_ms"]) if isinstance(hit.get("timestamp_ms"), (int, float)) else None,
+                url=hit.get("url") or "",
+                post_data=hit.get("post_data"),
+            )
+            for i, hit in enumerate(accepted)
+        ),
+        batch_size=settings.RESULT_STORE_BATCH_SIZE,
+    )
+    dropped = len(hits) - len(accepted)
+    if dropped:
+        Session.objects.filter(pk=session_pk).update(network_hits_dropped=F("network_hits_dropped") + dropped)
+    return len(accepted)
+
+
+def load_network_hits(session: Session) -> List[Dict[str, Any]]:
+    """
+    Peticiones de GA de la sesión en orden, con el formato de
+    ``extract_analytics_requests``. Las sesiones anteriores a NetworkHit las
+    tienen en ``Session.captured_network_hits``.
+    """
+    hits = [
+        {"url": url, "post_data": post_data, "timestamp_ms": captured_at_ms}
+        for url, post_data, captured_at_ms in NetworkHit.objects.filter(session_id=session.pk)
+        .order_by("sequence")
+        .values_list("url", "post_data", "captured_at_ms")
+        .iterator(chunk_size=settings.RESULT_STORE_BATCH_SIZE)
+    ]
+    if hits:
+        return hits
+    legacy = Session.objects.filter(pk=session.pk).values_list("captured_network_hits", flat=True).first()
+    return legacy or []
+
+
+def save_validation_details(session_pk, details: Iterable[Dict[str, Any]]) -> int:
+    """
+    Sustituye los detalles de validación de la sesión, insertándolos por lotes
+    de ``RESULT_STORE_BATCH_SIZE`` filas. Llamar dentro de una transacción
+    junto con el resumen en ``validation_results``.
+
+    Returns:
+        Número de detalles guardados.
+    """
+    ValidationDetail.objects.filter(session_id=session_pk).delete()
+    saved = 0
+    for batch in _batches(details, settings.RESULT_STORE_BATCH_SIZE):
+        ValidationDetail.objects.bulk_create([
+            ValidationDetail(
+                session_id=session_pk,
+                datalayer_index=detail["datalayer_index"],
+                data=detail.get("data"),
+                valid=detail.get("valid"),
+                errors=detail.get("errors") or [],
+                warnings=detail.get("warnings") or [],
+                source=detail.get("source") or "capture",
+                matched_section_id=detail.get("matched_section_id"),
+                matched_section=detail.get("matched_section"),
+                match_score=detail.get("match_score"),
+                captured_at_ms=_capture_timestamp(detail),
+            )
+            for detail in batch
+        ])
+        saved += len(batch)
+    return saved
+
+
+def detail_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Fila de ``ValidationDetail.values(*VALIDATION_DETAIL_COLUMNS)`` -> dict de detalle."""
+    detail = {column: row[column] for column in VALIDATION_DETAIL_COLUMNS if column != "captured_at_ms"}
+    detail["_captureTimestamp"] = row["captured_at_ms"]
+    return detail
+
+
+def iter_validation_details(session_pk, queryset=None) -> Iterator[Dict[str, Any]]:
+    """Detalles de la sesión en orden, leídos por bloques (memoria acotada)."""
+    if queryset is None:
+        queryset = ValidationDetail.objects.filter(session_id=session_pk)
+    rows = queryset.order_by("datalayer_index").values(*VALIDATION_DETAIL_COLUMNS)
+    for row in rows.iterator(chunk_size=settings.RESULT_STORE_BATCH_SIZE):
+        yield detail_from_row(row)
+
+
+def has_validation_details(session_pk) -> bool:
+    return ValidationDetail.objects.filter(session_id=session_pk).exists()
+
+
+def load_validation_results(session_pk) -> Dict[str, Any]:
+    """
+    Resultados completos de la sesión (resumen de ``validation_results`` más
+    la lista ``details``) para los reportes. Las sesiones anteriores a
+    ValidationDetail ya llevan los detalles dentro del JSON.
+    """
+    validation_results = Session.objects.filter(pk=session_pk).values_list("validation_results", flat=True).first() or {}
+    if "details" in validation_results:
+        return validation_results
+    return {**validation_results, "details": list(iter_validation_details(session_pk))}
@@ -0,0 +1,165 @@
+# core/utils/session_events.py
+import logging
+from typing import Any, Dict, List, Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+from ..models import Session
+from .admission import queue_info
+from .precompressed import public_report_name
+from .validation_logic import match_datalayer_live
+
+logger = logging.getLogger(__name__)
+
+
+def session_group_name(session_id) -> str:
+    """Grupo de Channels al que se une cada pestaña abierta de la sesión."""
+    return f"session_{session_id}"
+
+
+def send_session_event(session_id, event_type: str, payload: Dict[str, Any]) -> bool:
+    """
+    Envía un evento al grupo de la sesión desde código síncrono (tareas Celery).
+    ``event_type`` usa puntos ('datalayer.batch') y se despacha al método del
+    consumer con guiones bajos ('datalayer_batch').
+
+    Returns:
+        True si se envió, False si el channel layer no estaba disponible.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return False
+    try:
+        async_to_sync(channel_layer.group_send)(
+            session_group_name(session_id), {"type": event_type, **payload}
+        )
+        return True
+    except Exception as e:
+        logger.warning(f"Sesión {session_id}: No se pudo enviar '{event_type}' al grupo: {e}")
+        return False
+
+
+# Clave del payload de estado -> campo de Session con el artefacto del reporte
+REPORT_URL_FIELDS = {
+    "report_url": "report_file",
+    "report_json_url": "report_json_file",
+    "report_csv_url": "report_csv_file",
+}
+
+
+def _status_cache_key(session_id) -> str:
+    return f"session-status:{session_id}"
+
+
+def _load_session_status(session_id) -> Optional[Dict[str, Any]]:
+    """Lee de la BD solo las columnas de estado. Incluye ``updated_at`` para validadores HTTP."""
+    row = Session.objects.filter(pk=session_id).values(
+        "status", "vnc_url", "report_file", "report_json_file", "report_csv_file", "results_hash", "updated_at"
+    ).first()
+    if row is None:
+        return None
+    report_urls = {}
+    for key, field_name in REPORT_URL_FIELDS.items():
+        report_urls[key] = None
+        if row["status"] == Session.STATUS_COMPLETED and row[field_name]:
+            try:
+                report_urls[key] = reverse("session_report", args=[session_id, public_report_name(row[field_name])])
+            except Exception as e:
+                logger.error(f"Error generando URL para {field_name} de sesión {session_id}: {e}")
+    if row["status"] == Session.STATUS_COMPLETED and not report_urls["report_url"] and row["results_hash"]:
+        # Sin HTML pre-renderizado: se renderiza al abrirlo (REPORT_RENDER_ON_DEMAND)
+        report_urls["report_url"] = reverse("session_report_render", args=[session_id])
+    payload = {
+        "status": dict(Session.STATUS_CHOICES).get(row["status"], row["status"]), # Texto legible del estado
+        "status_code": row["status"],
+        "vnc_url": row["vnc_url"],
+        **report_urls,
+    }
+    return {"payload": payload, "updated_at": row["updated_at"]}
+
+
+def _with_queue_info(session_id, status: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Añade la posición en la cola de admisión y la espera estimada a una sesión
+    en cola. Se leen en cada petición (fuera de la caché de estado): la posición
+    avanza sin que cambie la fila de la sesión.
+    """
+    if status is None or status["payload"]["status_code"] != Session.STATUS_QUEUED:
+        return status
+    return {**status, "payload": {**status["payload"], **(queue_info(session_id) or {})}}
+
+
+def get_cached_session_status(session_id) -> Optional[Dict[str, Any]]:
+    """
+    Estado de la sesión desde la caché (TTL corto) o, si no está, desde la BD.
+    Si Redis falla se lee directamente de la BD. La posición en cola de las
+    sesiones QUEUED no se cachea: se lee de la cola de admisión cada vez.
+
+    Returns:
+        ``{"payload": {...}, "updated_at": datetime}`` o None si la sesión no existe.
+    """
+    key = _status_cache_key(session_id)
+    try:
+        cached = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Caché de estado no disponible (sesión {session_id}): {e}")
+        return _with_queue_info(session_id, _load_session_status(session_id))
+    if cached is not None:
+        return _with_queue_info(session_id, cached)
+    status = _load_session_status(session_id)
+    if status is not None:
+        try:
+            cache.set(key, status, settings.SESSION_STATUS_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"No se pudo cachear el estado de la sesión {session_id}: {e}")
+    return _with_queue_info(session_id, status)
+
+
+def get_session_status_payload(session_id) -> Optional[Dict[str, Any]]:
+    """
+    Estado, URL VNC y URL del reporte de una sesión, leyendo solo esas columnas.
+    Mismo formato que devuelve la vista ``get_session_status``.
+
+    Returns:
+        Diccionario serializable o None si la sesión no existe.
+    """
+    status = get_cached_session_status(session_id)
+    return status["payload"] if status else None
+
+
+def invalidate_session_status(session_id) -> None:
+    """Borra el estado cacheado de la sesión (llamar en cada transición de estado)."""
+    try:
+        cache.delete(_status_cache_key(session_id))
+    except Exception as e:
+        logger.warning(f"No se pudo invalidar el estado cacheado de la sesión {session_id}: {e}")
+
+
+def broadcast_session_status(session_id) -> bool:
+    """
+    Invalida el estado cacheado y publica el estado actual a las páginas
+    abiertas (tras cada transición).
+    """
+    invalidate_session_status(session_id)
+    payload = get_session_status_payload(session_id)
+    if payload is None:
+        return False
+    return send_session_event(session_id, "session.status", {"payload": payload})
+
+
+def build_live_datalayer_events(items: List[Dict[str, Any]], schema: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Anota cada DataLayer drenado con su indicador de coincidencia en vivo."""
+    events = []
+    for item in items:
+        events.append(
+            {
+                "data": {k: v for k, v in item.items() if k != "_captureTimestamp"} if isinstance(item, dict) else item,
+                "timestamp": item.get("_captureTimestamp") if isinstance(item, dict) else None,
+                "match": match_datalayer_live(item, schema) if schema else {"status": "unmatched"},
+            }
+        )
+    return events
@@ -0,0 +1,50 @@
+# core/utils/session_signals.py
+import logging
+from typing import Optional
+
+import redis
+
+from .redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+# La marca de finalización sobrevive a la sesión en espera más larga del reaper
+FINISH_FLAG_TTL_SECONDS = 2 * 3600
+
+
+def finish_flag_key(session_id) -> str:
+    """Marca de la finalización que consultan los heartbeats de drenado."""
+    return f"session_finish_flag_{session_id}"
+
+
+def publish_finish_signal(session_id) -> bool:
+    """
+    Deja en Redis la marca de finalización de la sesión, que el siguiente
+    heartbeat de drenado lee con ``finish_signal_pending``.
+
+    Returns:
+        True si se guardó, False si Redis no estaba disponible (la tarea
+        detectará el cambio igualmente al releer la BD).
+    """
+    try:
+        get_redis_client().set(finish_flag_key(session_id), 1, ex=FINISH_FLAG_TTL_SECONDS)
+        logger.info(f"Señal de finalización publicada para sesión {session_id}.")
+        return True
+    except redis.RedisError as e:
+        logger.warning(f"No se pudo publicar señal de finalización para sesión {session_id}: {e}")
+        return False
+
+
+def finish_signal_pending(session_id) -> Optional[bool]:
+    """
+    Indica si ya se publicó la finalización de la sesión.
+
+    Returns:
+        True/False, o None si Redis no está disponible (el llamador debe
+        releer el estado en la BD).
+    """
+    try:
+        return bool(get_redis_client().exists(finish_flag_key(session_id)))
+    except redis.RedisError as e:
+        logger.warning(f"Sesión {session_id}: No se pudo consultar la marca de finalización ({e}).")
+        return None
@@ -315,6 +315,41 @@ def filter_datalayers(
     return filtered_list
 
 
+def section_reference_id(section: Dict[str, Any], index: int) -> str:
+    """ID con el que los detalles y ``missing_details`` se refieren a una sección."""
+    return section.get("id") or f"no_id_{index}"
+
+
+def build_reference_index(schema: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Propiedades de referencia de cada sección del esquema, por ID. Se guardan
+    una sola vez en los resultados (``references``) y los detalles las
+    referencian con ``matched_section_id``.
+    """
+    references = {}
+    for idx, section in enumerate((schema or {}).get("sections", [])):
+        properties = section.get("datalayer", {}).get("properties")
+        if properties:
+            references[section_reference_id(section, idx)] = {
+                "title": section.get("title", f"Sección sin título {idx}"),
+                "properties": properties,
+            }
+    return references
+
+
+def align_reference(datalayer_content: Any, properties: Any) -> Any:
+    """
+    Propiedades de referencia con las claves en el orden del DataLayer
+    capturado y después las restantes, para compararlos lado a lado.
+    """
+    if not isinstance(datalayer_content, dict) or not isinstance(properties, dict):
+        return properties
+    aligned = {key: properties[key] for key in datalayer_content if key in properties}
+    for key, value in properties.items():
+        aligned.setdefault(key, value)
+    return aligned
+
+
 def compare_captured_with_reference(
     captured_datalayers: List[Dict[str, Any]],
     schema: Dict[str, Any],
@@ -351,7 +386,7 @@ def compare_captured_with_reference(
                     {
                         "properties": properties,
                         "title": section.get("title", f"Sección sin título {idx}"),
-                        "id": section.get("id", f"no_id_{idx}"),
+                        "id": section_reference_id(section, idx),
                         "required_fields": datalayer_section.get("required_fields", []),
                         "match_found": False,  # Flag para rastrear si esta referencia fue encontrada
                     }
@@ -389,11 +424,11 @@ def compare_captured_with_reference(
 
     comparison_results["matched_count"] = final_matched_count
     comparison_results["missing_count"] = final_missing_count
+    # Las propiedades están en ``references`` (build_reference_index), no se copian aquí
     comparison_results["missing_details"] = [
         {
             "reference_title": ref["title"],
             "reference_id": ref["id"],
-            "properties": ref["properties"],
         }
         for ref in reference_sections
         if not ref["match_found"]
@@ -423,6 +458,8 @@ def generate_validation_details(
     """
     Genera la lista detallada de validación para cada DataLayer capturado.
     Encuentra el mejor match con una referencia, calcula errores/warnings.
+    Cada detalle apunta a su referencia con ``matched_section_id`` (ver
+    ``build_reference_index``) en lugar de llevar una copia.
 
     Args:
         captured_datalayers: Lista completa de datalayers capturados (pueden incluir timestamp).
@@ -497,7 +534,7 @@ def generate_validation_details(
         matched_errors = []
         match_warnings = []
 
-        for section in reference_sections:
+        for section_idx, section in enumerate(reference_sections):
             expected_properties = section.get("datalayer", {}).get("properties", {})
             required_fields = section.get("datalayer", {}).get("required_fields", [])
             if not expected_properties:
@@ -510,8 +547,7 @@ def generate_validation_details(
                 best_match_score = score
                 best_match_section_info = {
                     "title": section.get("title", "Unknown Section"),
-                    "properties": expected_properties,
-                    "id": section.get("id"),
+                    "id": section_reference_id(section, section_idx),
                 }
                 matched_errors = errors_match
                 match_warnings = warnings_match
@@ -529,26 +565,6 @@ def generate_validation_details(
             combined_warnings.append(warning_msg)
             detail_is_valid = None  # Indicar que no hubo match
 
-        # Ordenar referencia para comparación visual
-        reference_data_sorted = None
-        if best_match_section_info and best_match_score >= match_threshold:
-            if isinstance(datalayer_content, dict) and isinstance(
-                best_match_section_info["properties"], dict
-            ):
-                # Crear un nuevo diccionario para las propiedades ordenadas
-                sorted_props = {}
-                # Incluir primero las claves del capturado en orden
-                for key in datalayer_content.keys():
-                    if key in best_match_section_info["properties"]:
-                        sorted_props[key] = best_match_section_info["properties"][key]
-                # Incluir las claves restantes de la referencia
-                for key, value in best_match_section_info["properties"].items():
-                    if key not in sorted_props:
-                        sorted_props[key] = value
-                reference_data_sorted = sorted_props
-            else:
-                reference_data_sorted = best_match_section_info["properties"]
-
         detail = {
             "datalayer_index": i,  # Índice basado en la lista relevante
             "data": datalayer_content,
@@ -567,7 +583,7 @@ def generate_validation_details(
                 else None
             ),
             "match_score": best_match_score if best_match_section_info else None,
-            "reference_data": reference_data_sorted,
+            # La referencia va una sola vez en results["references"] y se alinea al renderizar
             "_captureTimestamp": current_timestamp,  # Mantener timestamp original si existe
         }
         validation_details.append(detail)
@@ -576,6 +592,53 @@ def generate_validation_details(
     return validation_details
 
 
+def match_datalayer_live(
+    datalayer: Dict[str, Any],
+    schema: Dict[str, Any],
+    match_threshold: float = 0.7,
+    event_filter: str = "GAEvent",
+) -> Dict[str, Any]:
+    """
+    Indicador de coincidencia rápido para un único DataLayer (vista en vivo).
+    Usa el mismo score que la validación final, sin deduplicar ni avisos de tiempo.
+
+    Args:
+        datalayer: DataLayer capturado (puede incluir _captureTimestamp).
+        schema: El esquema de validación estructurado.
+        match_threshold: Umbral de score para considerar una coincidencia.
+        event_filter: Valor de 'event' que hace relevante al DataLayer.
+
+    Returns:
+        Diccionario con status ('valid', 'invalid', 'unmatched' o 'filtered'),
+        sección coincidente, score y número de errores.
+    """
+    if not isinstance(datalayer, dict) or datalayer.get("event") != event_filter:
+        return {"status": "filtered", "section_id": None, "section": None, "score": None, "errors": 0}
+
+    content = {k: v for k, v in datalayer.items() if k != "_captureTimestamp"}
+    best_section, best_score, best_errors = None, -1.0, []
+    for section in schema.get("sections", []):
+        expected_properties = section.get("datalayer", {}).get("properties", {})
+        if not expected_properties:
+            continue
+        score, errors, _ = calculate_match_score(
+            content, expected_properties, section.get("datalayer", {}).get("required_fields", [])
+        )
+        if score > best_score:
+            best_section, best_score, best_errors = section, score, errors
+
+    if best_section is None or best_score < match_threshold:
+        return {"status": "unmatched", "section_id": None, "section": None,
+                "score": round(max(best_score, 0.0), 3), "errors": 0}
+    return {
+        "status": "invalid" if best_errors else "valid",
+        "section_id": best_section.get("id"),
+        "section": best_section.get("title"),
+        "score": round(best_score, 3),
+        "errors": len(best_errors),
+    }
+
+
 def calculate_summary(
     validation_details: List[Dict[str, Any]], comparison_results: Dict[str, Any]
 ) -> Dict[str, Any]:
@@ -0,0 +1,122 @@
+# core/utils/webdriver_hubs.py
+import logging
+from typing import Dict, List, Optional
+
+import httpx
+import redis
+from django.conf import settings
+from django.core.cache import cache
+
+from .grid_status import fetch_grid_capacity
+from .redis_client import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+def _hub_cache_key(hub_url: str) -> str:
+    return f"webdriver-hub:{hub_url}"
+
+
+def _hub_reserved_key(hub_url: str) -> str:
+    """Contador (Redis) de slots elegidos desde el último ``/status`` del hub."""
+    return f"webdriver-hub:{hub_url}:reserved"
+
+
+def _reserved_slots(hub_urls: List[str]) -> Dict[str, int]:
+    try:
+        values = get_redis_client().mget([_hub_reserved_key(url) for url in hub_urls])
+    except redis.RedisError as e:
+        logger.warning(f"Hubs: No se pudieron leer las reservas de slots: {e}")
+        values = [None] * len(hub_urls)
+    return {url: int(value or 0) for url, value in zip(hub_urls, values)}
+
+
+def _check_hub(hub_url: str) -> Dict:
+    """Health check + capacidad de un hub (``GET /status``)."""
+    try:
+        capacity = fetch_grid_capacity(hub_url)
+    except (httpx.HTTPError, ValueError) as e:
+        logger.warning(f"Hubs: {hub_url} no responde: {e}")
+        return {"url": hub_url, "healthy": False, "total_slots": 0, "busy_slots": 0}
+    return {"url": hub_url, "healthy": capacity["total_slots"] > 0, **capacity}
+
+
+def get_hub_status(hub_url: str, refresh: bool = False) -> Dict:
+    """
+    Estado de un hub cacheado ``WEBDRIVER_HUB_STATUS_TTL`` segundos (compartido
+    entre procesos), para no consultar ``/status`` en cada sesión.
+    """
+    key = _hub_cache_key(hub_url)
+    status = None if refresh else cache.get(key)
+    if status is None:
+        status = _check_hub(hub_url)
+        cache.set(key, status, settings.WEBDRIVER_HUB_STATUS_TTL)
+        # ``busy_slots`` ya incluye las sesiones creadas: las reservas empiezan de cero
+        try:
+            get_redis_client().delete(_hub_reserved_key(hub_url))
+        except redis.RedisError as e:
+            logger.warning(f"Hubs: No se pudieron reiniciar las reservas de {hub_url}: {e}")
+    return status
+
+
+def get_hub_statuses(refresh: bool = False) -> List[Dict]:
+    """Estado de todos los hubs configurados en ``WEBDRIVER_HUB_URLS``."""
+    return [get_hub_status(hub_url, refresh=refresh) for hub_url in settings.WEBDRIVER_HUB_URLS]
+
+
+def total_capacity(refresh: bool = False) -> Dict[str, int]:
+    """Suma de slots de los hubs sanos (para el control de admisión)."""
+    healthy = [status for status in get_hub_statuses(refresh=refresh) if status["healthy"]]
+    return {
+        "total_slots": sum(status["total_slots"] for status in healthy),
+        "busy_slots": sum(status["busy_slots"] for status in healthy),
+    }
+
+
+def select_hub(exclude: Optional[List[str]] = None) -> str:
+    """
+    Elige el hub sano menos cargado (mayor fracción de slots libres; a igualdad,
+    más slots libres). Cada elección reserva un slot con un ``INCR`` atómico en
+    Redis, compartido por todos los procesos, para repartir las peticiones que
+    llegan antes del siguiente health check. Si otro proceso reservó a la vez y
+    el hub deja de ser el mejor, se deshace la reserva y se vuelve a elegir.
+    Si ningún hub está sano se devuelve el primero configurado.
+    """
+    candidates = [
+        status for status in get_hub_statuses()
+        if status["healthy"] and status["url"] not in (exclude or [])
+    ]
+    if not candidates:
+        fallback = settings.WEBDRIVER_HUB_URLS[0]
+        logger.warning(f"Hubs: Ningún hub sano disponible. Usando {fallback}.")
+        return fallback
+
+    reserved = _reserved_slots([status["url"] for status in candidates])
+
+    def _load_key(status):
+        free_slots = status["total_slots"] - status["busy_slots"] - reserved[status["url"]]
+        return (free_slots / status["total_slots"], free_slots)
+
+    client = get_redis_client()
+    for _ in range(len(candidates) * 2):
+        chosen = max(candidates, key=_load_key)
+        key = _hub_reserved_key(chosen["url"])
+        try:
+            now_reserved = client.incr(key)
+            if now_reserved == 1:
+                client.expire(key, settings.WEBDRIVER_HUB_STATUS_TTL * 2)
+        except redis.RedisError as e:
+            logger.warning(f"Hubs: No se pudo reservar slot en {chosen['url']}: {e}")
+            break
+        # Reservas de los demás procesos incluidas: ¿sigue siendo el mejor?
+        reserved[chosen["url"]] = now_reserved - 1
+        if _load_key(chosen) >= max(_load_key(status) for status in candidates):
+            reserved[chosen["url"]] = now_reserved
+            break
+        try:
+            client.decr(key)
+        except redis.RedisError:
+            break
+    free_slots = chosen["total_slots"] - chosen["busy_slots"] - reserved[chosen["url"]]
+    logger.info(f"Hubs: Elegido {chosen['url']} ({free_slots}/{chosen['total_slots']} slots libres).")
+    return chosen["url"]
@@ -1,16 +1,36 @@
 # core/views.py
+import gzip
 import logging
+import os
 import json # Añadido por si se necesita en el futuro, aunque no para finish_session_view
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotAllowed
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    FileResponse, Http404, HttpResponse, JsonResponse, HttpResponseBadRequest, HttpResponseNotAllowed,
+    StreamingHttpResponse,
+)
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.http import require_POST
 # from django.views.decorators.csrf import csrf_protect # Middleware CSRF suele ser suficiente
+from django.conf import settings
 from django.db import transaction
 from django.utils import timezone # Para actualizar 'updated_at' explícitamente si es necesario
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 
 from .forms import StartSessionForm
 from .models import Session
-from .tasks import run_selenium_validation # Importa la tarea Celery
+from .controllers.http_client import webdriver_latency
+from .tasks import ( # Importa las tareas Celery
+    provision_browser_session, finalize_browser_session, dispatch_queued_sessions, render_report_on_demand,
+)
+from .utils.admission import enqueue_session
+from .utils.detail_export import DETAIL_STATUS_FILTERS, DetailExportNotSupported, iter_detail_lines
+from .utils.precompressed import GZIP_SUFFIX, accepts_encoding, brotli_variant_name, public_report_name
+from .utils.report_generator import REPORT_DETAIL_SUBSETS, report_render_key, report_shard_name, report_template_version
+from .utils.report_storage import acquire_render_lock, find_rendered_report, get_report_storage
+from .utils.session_events import broadcast_session_status, get_cached_session_status
+from .utils.session_signals import publish_finish_signal
 
 # Configura el logger para este módulo
 logger = logging.getLogger(__name__)
@@ -33,18 +53,25 @@ def start_session_view(request):
                 return render(request, "core/start_session_form.html", {"form": form})
 
             try:
+                admission_enabled = settings.ADMISSION_CONTROL_ENABLED
                 new_session = Session.objects.create(
                     url=form.cleaned_data["url"],
                     reference_schema=schema_data, # Guardar JSON parseado
                     # description=form.cleaned_data.get('description'), # Añadir si tienes campo description
-                    status=Session.STATUS_PENDING, # Estado inicial
+                    # Estado inicial: en cola hasta que el grid tenga un slot libre
+                    status=Session.STATUS_QUEUED if admission_enabled else Session.STATUS_PENDING,
                 )
 
-                # Lanzar la tarea Celery en segundo plano
-                run_selenium_validation.delay(new_session.pk)
-                logger.info(
-                    f"Tarea Celery 'run_selenium_validation' lanzada para Session PK: {new_session.pk}"
-                )
+                if admission_enabled:
+                    enqueue_session(new_session.pk)
+                    dispatch_queued_sessions.delay()
+                    logger.info(f"Session PK {new_session.pk} en cola de admisión.")
+                else:
+                    # Lanzar la tarea Celery en segundo plano
+                    provision_browser_session.delay(new_session.pk)
+                    logger.info(
+                        f"Tarea Celery 'provision_browser_session' lanzada para Session PK: {new_session.pk}"
+                    )
                 # Redirigir a la página de la sesión recién creada
                 return redirect('session_page', session_id=new_session.id)
 
@@ -67,7 +94,7 @@ def session_page_view(request, session_id):
     """
     Muestra la página de estado y control para una sesión específica.
     """
-    session_obj = get_object_or_404(Session, pk=session_id)
+    session_obj = get_object_or_404(Session.objects.metadata(), pk=session_id)
     # Pasa el estado inicial también para evitar un pequeño delay hasta el primer polling
     initial_status = session_obj.get_status_display()
     context = {
@@ -82,33 +109,33 @@ def session_page_view(request, session_id):
 def get_session_status(request, session_id):
     """
     Devuelve el estado actual, URL VNC y URL del reporte (si existe) en JSON.
-    Usado por el polling AJAX del frontend.
-    """
-    session_obj = get_object_or_404(Session, pk=session_id)
-    report_url = None
-    # Obtener URL del reporte solo si existe el archivo y el estado es completado
-    # Se implementará la lógica de report_file en Paso 8 y 9
-    if session_obj.status == Session.STATUS_COMPLETED and session_obj.report_file:
-        try:
-            # build_absolute_uri es útil si necesitas la URL completa incluyendo dominio
-            # report_url = request.build_absolute_uri(session_obj.report_file.url)
-            # O simplemente la URL relativa si el frontend está en el mismo dominio
-             report_url = session_obj.report_file.url
-        except ValueError:
-             # report_file podría no estar asociado a storage si no se guardó correctamente
-             logger.error(f"No se pudo obtener URL para report_file de sesión {session_id}. ¿Archivo guardado correctamente?")
-             report_url = None
-        except Exception as e:
-             logger.error(f"Error generando URL para report_file de sesión {session_id}: {e}")
-             report_url = None
-
-    data = {
-        "status": session_obj.get_status_display(), # Texto legible del estado
-        "status_code": session_obj.status,       # Código interno del estado
-        "vnc_url": session_obj.vnc_url,           # URL VNC si existe
-        "report_url": report_url                  # URL del reporte si existe y está completado
-    }
-    return JsonResponse(data)
+    El frontend recibe los cambios por WebSocket; este endpoint queda como
+    carga inicial y polling lento de respaldo. Sale de la caché de estado y
+    responde 304 si el cliente ya tiene la versión actual (ETag/Last-Modified).
+    """
+    status = get_cached_session_status(session_id)
+    if status is None:
+        raise Http404("Sesión no encontrada.")
+    updated_at = status["updated_at"]
+    payload = status["payload"]
+    etag_value = f"{payload['status_code']}-{updated_at.timestamp():.6f}"
+    last_modified = int(updated_at.timestamp())
+    if payload.get("queue_position") is not None:
+        # En cola la fila no cambia mientras avanza la posición: va en el ETag,
+        # y sin Last-Modified (If-Modified-Since daría 304 con la posición vieja)
+        etag_value += f"-q{payload['queue_position']}-{payload.get('eta_seconds')}"
+        last_modified = None
+    etag = quote_etag(etag_value)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = JsonResponse(payload)
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    # Revalidar siempre: la respuesta cambia con cada transición de estado
+    response["Cache-Control"] = "no-cache"
+    return response
 
 
 # --- NUEVA VISTA PARA FINALIZAR LA SESIÓN ---
@@ -124,7 +151,7 @@ def finish_session_view(request, session_id):
         # Usar transacción para asegurar consistencia al leer y actualizar
         with transaction.atomic():
             # Obtener la sesión y bloquearla para evitar condiciones de carrera
-            session_obj = get_object_or_404(Session.objects.select_for_update(), pk=session_id)
+            session_obj = get_object_or_404(Session.objects.select_for_update().metadata(), pk=session_id)
 
             # Verificar que la sesión esté en el estado correcto para ser finalizada
             if session_obj.status != Session.STATUS_WAITING_USER:
@@ -140,6 +167,11 @@ def finish_session_view(request, session_id):
             # session_obj.updated_at = timezone.now()
             session_obj.save(update_fields=['status', 'updated_at'])
             logger.info(f"Sesión {session_id} actualizada a estado: {Session.STATUS_FINISH_REQUESTED}")
+            # Encolar la finalización en cuanto el cambio sea visible en la BD
+            transaction.on_commit(lambda: broadcast_session_status(session_id))
+            transaction.on_commit(lambda: finalize_browser_session.delay(session_id))
+            # Detener el heartbeat de drenado sin que tenga que releer el estado
+            transaction.on_commit(lambda: publish_finish_signal(session_id))
 
         # Devolver respuesta de éxito
         return JsonResponse({'status': 'ok', 'message': 'Solicitud de finalización recibida. Procesando...'})
@@ -151,3 +183,199 @@ def finish_session_view(request, session_id):
         # Capturar cualquier otro error inesperado durante el proceso
         logger.exception(f"Error inesperado en finish_session_view para sesión {session_id}: {e}")
         return JsonResponse({'status': 'error', 'error': 'Error interno del servidor al procesar la solicitud de finalización.'}, status=500) # 500 Internal Server Error
+
+
+REPORT_CHUNK_SIZE = 64 * 1024
+
+
+def _iter_gunzip(fileobj):
+    """Descomprime por trozos un archivo gzip del storage (clientes sin gzip)."""
+    with fileobj, gzip.GzipFile(fileobj=fileobj, mode="rb") as gz:
+        for chunk in iter(lambda: gz.read(REPORT_CHUNK_SIZE), b""):
+            yield chunk
+
+
+# Extensión pública -> (campo de Session, Content-Type) de cada artefacto del reporte
+REPORT_ARTIFACTS = {
+    ".html": ("report_file", "text/html; charset=utf-8"),
+    ".json": ("report_json_file", "application/json"),
+    ".csv": ("report_csv_file", "text/csv; charset=utf-8"),
+}
+
+
+def _precompressed_file_response(request, report_storage, stored_name, content_type):
+    """
+    Respuesta con un archivo de reporte guardado precomprimido: la variante
+    ``.br`` o ``.gz`` que acepte el cliente con ``Content-Encoding``, o el
+    contenido descomprimido al vuelo si no acepta ninguna. El nombre del
+    archivo (``Content-Disposition``) es el público, sin el sufijo de compresión.
+    """
+    accept_encoding = request.headers.get("Accept-Encoding", "")
+    filename = public_report_name(stored_name)
+    try:
+        if not stored_name.endswith(GZIP_SUFFIX): # Reporte antiguo, sin comprimir
+            response = FileResponse(report_storage.open(stored_name, "rb"), content_type=content_type, filename=filename)
+        elif accepts_encoding(accept_encoding, "br") and report_storage.exists(brotli_variant_name(stored_name)):
+            response = FileResponse(
+                report_storage.open(brotli_variant_name(stored_name), "rb"), content_type=content_type, filename=filename
+            )
+            response["Content-Encoding"] = "br"
+        elif accepts_encoding(accept_encoding, "gzip"):
+            response = FileResponse(report_storage.open(stored_name, "rb"), content_type=content_type, filename=filename)
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = StreamingHttpResponse(_iter_gunzip(report_storage.open(stored_name, "rb")), content_type=content_type)
+    except FileNotFoundError:
+        raise Http404("Archivo de reporte no encontrado.")
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
+
+
+def session_report_view(request, session_id, filename):
+    """
+    Sirve un artefacto del reporte de una sesión (HTML, JSON o CSV según la
+    extensión). Se guardan precomprimidos (``.gz`` y opcionalmente ``.br``): se
+    envía la variante que acepte el cliente con ``Content-Encoding``. El nombre
+    del archivo va en la URL y no cambia nunca, así que la respuesta se puede
+    cachear indefinidamente.
+    """
+    artifact = REPORT_ARTIFACTS.get(os.path.splitext(filename)[1])
+    if artifact is None:
+        raise Http404("Reporte no encontrado.")
+    field_name, content_type = artifact
+    stored_name = Session.objects.filter(pk=session_id).values_list(field_name, flat=True).first()
+    if not stored_name or public_report_name(stored_name) != filename:
+        raise Http404("Reporte no encontrado.")
+    response = _precompressed_file_response(request, Session._meta.get_field(field_name).storage, stored_name, content_type)
+    if field_name != "report_file":
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
+
+def session_report_render_view(request, session_id):
+    """
+    Sirve el reporte HTML de una sesión renderizado desde ``validation_results``.
+    El render se guarda en el storage con el hash de los resultados y la
+    versión de la plantilla, que forman también el ETag: un cambio en la
+    plantilla genera un render nuevo sin volver a validar. Si aún no existe se
+    encola en la cola CPU (una sola vez por render, con cerrojo) y se responde
+    202 con ``Retry-After`` hasta que esté listo.
+    """
+    results_hash = Session.objects.filter(pk=session_id).values_list("results_hash", flat=True).first()
+    if not results_hash:
+        raise Http404("Reporte no encontrado.")
+    # Débil: el mismo reporte se sirve con distintas codificaciones
+    etag = "W/" + quote_etag(report_render_key(results_hash, report_template_version()))
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        stored_name = find_rendered_report(session_id, results_hash)
+        if stored_name is None:
+            if acquire_render_lock(session_id, results_hash):
+                render_report_on_demand.delay(str(session_id), results_hash)
+            retry_after = settings.REPORT_RENDER_RETRY_AFTER_SECONDS
+            response = render(
+                request, "core/report_pending.html", {"session_id": session_id, "retry_after": retry_after}, status=202
+            )
+            response["Retry-After"] = str(retry_after)
+            response["Cache-Control"] = "no-store"
+            return response
+        response = _precompressed_file_response(request, get_report_storage(), stored_name, REPORT_ARTIFACTS[".html"][1])
+    response["ETag"] = etag
+    patch_vary_headers(response, ("Accept-Encoding",))
+    response["Cache-Control"] = "private, no-cache" # Revalidar siempre: la plantilla puede cambiar
+    return response
+
+
+def session_report_data_view(request, session_id, render_key=None):
+    """
+    Sirve un shard de detalles del reporte lazy (``?subset=all|invalid|warnings&shard=N``)
+    del render ``render_key`` tal como está guardado, comprimido con gzip. Los
+    shards de un render no cambian una vez escritos, así que el navegador
+    puede cachearlos. Sin ``render_key``: reportes anteriores a versionarlos.
+    """
+    subset = request.GET.get("subset", "all")
+    try:
+        shard_index = int(request.GET.get("shard", "0"))
+    except ValueError:
+        return HttpResponseBadRequest("Parámetro 'shard' inválido.")
+    if subset not in REPORT_DETAIL_SUBSETS or shard_index < 0:
+        return HttpResponseBadRequest("Parámetros 'subset'/'shard' inválidos.")
+
+    report_storage = Session._meta.get_field("report_file").storage
+    try:
+        with report_storage.open(report_shard_name(session_id, subset, shard_index, render_key), "rb") as shard_file:
+            payload = shard_file.read()
+    except FileNotFoundError:
+        raise Http404("Shard de reporte no encontrado.")
+
+    if accepts_encoding(request.headers.get("Accept-Encoding", ""), "gzip"):
+        response = HttpResponse(payload, content_type="application/json")
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(gzip.decompress(payload), content_type="application/json")
+    patch_vary_headers(response, ("Accept-Encoding",))
+    response["Cache-Control"] = "private, max-age=86400"
+    return response
+
+
+async def _aiter_sync(iterator):
+    """
+    Recorre un iterador síncrono (que lee de la BD) bloque a bloque desde ASGI.
+    Django consumiría entero un iterador síncrono antes de enviarlo.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await next_chunk(iterator, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        await sync_to_async(iterator.close, thread_sensitive=True)() # Cierra el cursor si el cliente se desconecta
+
+
+def _optional_float(params, name):
+    value = params.get(name)
+    return float(value) if value not in (None, "") else None
+
+
+def session_details_export_view(request, session_id):
+    """
+    Exporta los detalles de validación de una sesión en NDJSON (una línea JSON
+    por detalle), en streaming y filtrados en la base de datos:
+    ``?status=valid|invalid|unmatched&section=<matched_section_id>&since=<ms>&until=<ms>``
+    (``since``/``until`` sobre ``_captureTimestamp``).
+    """
+    status = request.GET.get("status") or None
+    if status is not None and status not in DETAIL_STATUS_FILTERS:
+        return HttpResponseBadRequest(f"Parámetro 'status' inválido (usa {', '.join(DETAIL_STATUS_FILTERS)}).")
+    try:
+        since_ms = _optional_float(request.GET, "since")
+        until_ms = _optional_float(request.GET, "until")
+    except ValueError:
+        return HttpResponseBadRequest("Parámetros 'since'/'until' inválidos (ms epoch).")
+    if not Session.objects.filter(pk=session_id, validation_results__isnull=False).exists():
+        raise Http404("Resultados de validación no encontrados.")
+
+    try:
+        lines = iter_detail_lines(
+            session_id, status=status, section_id=request.GET.get("section") or None,
+            since_ms=since_ms, until_ms=until_ms,
+        )
+    except DetailExportNotSupported as e:
+        return HttpResponse(str(e), status=501)
+    if isinstance(request, ASGIRequest):
+        lines = _aiter_sync(lines)
+    response = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def webdriver_metrics_view(request):
+    """
+    Histograma de latencia de las llamadas al hub WebDriver hechas por este
+    proceso ASGI (BrowserController), agrupado por endpoint.
+    """
+    return JsonResponse({"webdriver_latency": webdriver_latency.snapshot()})
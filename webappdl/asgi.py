@@ -1,19 +1,66 @@
 # webappdl/asgi.py
+import asyncio
 import os
+import sys
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
 from django.core.asgi import get_asgi_application
-import core.routing # Importaremos esto luego
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'webappdl.settings')
 
-# Obtener la aplicación HTTP de Django estándar
+# Obtener la aplicación HTTP de Django estándar (antes de importar módulos que usan modelos)
 django_asgi_app = get_asgi_application()
 
+import core.routing # Importaremos esto luego
+from core.controllers.http_client import close_webdriver_client
+from core.utils.redis_client import close_async_redis_client
+
+
+
+async def close_shared_clients():
+    """Cierra los clientes compartidos del proceso (HTTP de WebDriver y Redis asíncrono)."""
+    await close_webdriver_client()
+    await close_async_redis_client()
+
+
+async def lifespan_app(scope, receive, send):
+    """Protocolo ASGI lifespan: cierra los clientes compartidos al apagar (uvicorn y similares)."""
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_shared_clients()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def register_daphne_shutdown():
+    """
+    Daphne no implementa lifespan: el cierre se engancha al apagado del reactor
+    de Twisted (asyncio), que Daphne ya tiene instalado al importar la
+    aplicación. Fuera de Daphne no hace nada.
+    """
+    if "twisted.internet.reactor" not in sys.modules:
+        return False
+    from twisted.internet import defer, reactor
+    from twisted.internet.asyncioreactor import AsyncioSelectorReactor
+
+    if not isinstance(reactor, AsyncioSelectorReactor):
+        return False
+    reactor.addSystemEventTrigger(
+        "before", "shutdown", lambda: defer.Deferred.fromFuture(asyncio.ensure_future(close_shared_clients()))
+    )
+    return True
+
+
 application = ProtocolTypeRouter({
     # Manejo HTTP estándar de Django
     "http": django_asgi_app,
 
+    # Arranque/apagado del servidor (servidores ASGI con soporte lifespan, p.ej. uvicorn)
+    "lifespan": lifespan_app,
+
     # Manejo WebSocket
     "websocket": AllowedHostsOriginValidator(
         URLRouter(
@@ -21,3 +68,5 @@ application = ProtocolTypeRouter({
         )
     ),
 })
+
+register_daphne_shutdown()
@@ -1,6 +1,8 @@
 # webappdl/celery.py
 import os
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
+from django.conf import settings
 
 # Establece la variable de entorno por defecto para que Celery sepa dónde encontrar la configuración de Django.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "webappdl.settings")
@@ -19,3 +21,30 @@ app.autodiscover_tasks()
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f"Request: {self.request!r}")
+
+
+@worker_process_init.connect
+def warm_browser_pool(**kwargs):
+    """Precalienta los pools de navegadores (uno por hub) en cada proceso hijo del worker."""
+    from core.controllers.browser_pool import get_browser_pools
+
+    for pool in get_browser_pools():
+        pool.warm_async()
+        pool.start_maintenance(settings.BROWSER_POOL_HEALTH_CHECK_SECONDS)
+
+
+@worker_process_init.connect
+def warm_report_templates(**kwargs):
+    """Compila la plantilla del reporte HTML una vez por proceso hijo del worker."""
+    from core.utils.report_generator import warm_report_templates as warm_templates
+
+    warm_templates()
+
+
+@worker_process_shutdown.connect
+def close_browser_pool(**kwargs):
+    """Cierra las sesiones ociosas de los pools al terminar el proceso hijo."""
+    from core.controllers.browser_pool import get_browser_pools
+
+    for pool in get_browser_pools():
+        pool.shutdown()
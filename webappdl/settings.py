@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -82,6 +83,59 @@ WSGI_APPLICATION = 'webappdl.wsgi.application'
 # ¡IMPORTANTE! Define la aplicación ASGI para Daphne/Channels
 ASGI_APPLICATION = 'webappdl.asgi.application' #
 
+# URL de Redis para señales entre procesos y estado compartido
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis:6379/0")
+
+# Caché compartida entre procesos (Daphne/Celery): respuestas de estado de sesión
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("CACHE_REDIS_URL", REDIS_URL),
+        "KEY_PREFIX": "webappdl",
+    }
+}
+# TTL (segundos) del estado cacheado; cada transición de estado lo invalida
+SESSION_STATUS_CACHE_TTL = int(os.environ.get("SESSION_STATUS_CACHE_TTL", "10"))
+
+# Registro de navegadores del BrowserController: segundos que sobrevive un navegador
+# tras desconectarse el WebSocket (0 = cerrarlo al instante) y TTL de las entradas
+BROWSER_CONTROLLER_GRACE_SECONDS = int(os.environ.get("BROWSER_CONTROLLER_GRACE_SECONDS", "60"))
+BROWSER_CONTROLLER_REGISTRY_TTL = int(os.environ.get("BROWSER_CONTROLLER_REGISTRY_TTL", "21600"))
+
+# Control de admisión: las sesiones nuevas esperan en una cola FIFO hasta que
+# el grid tiene un slot libre (capacidad leída de GET /status del WebDriver)
+ADMISSION_CONTROL_ENABLED = os.environ.get("ADMISSION_CONTROL_ENABLED", "True") == "True"
+ADMISSION_DISPATCH_INTERVAL_SECONDS = int(os.environ.get("ADMISSION_DISPATCH_INTERVAL_SECONDS", "5"))
+# Límite opcional de sesiones simultáneas por debajo de la capacidad del grid (0 = sin límite)
+ADMISSION_MAX_SLOTS = int(os.environ.get("ADMISSION_MAX_SLOTS", "0"))
+# Duración supuesta de una sesión para la ETA mientras no hay sesiones completadas
+ADMISSION_DEFAULT_SESSION_SECONDS = int(os.environ.get("ADMISSION_DEFAULT_SESSION_SECONDS", "300"))
+
+# Reaper de sesiones huérfanas (Celery beat): segundos sin cambios tras los que
+# una sesión en cada estado se marca como ERROR y se cierra su navegador
+REAPER_INTERVAL_SECONDS = int(os.environ.get("REAPER_INTERVAL_SECONDS", "60"))
+REAPER_IDLE_TIMEOUTS = {
+    "queued": int(os.environ.get("REAPER_TIMEOUT_QUEUED", "7200")),
+    "pending": int(os.environ.get("REAPER_TIMEOUT_PENDING", "900")),
+    "starting": int(os.environ.get("REAPER_TIMEOUT_STARTING", "300")),
+    "waiting_user": int(os.environ.get("REAPER_TIMEOUT_WAITING_USER", "3600")),
+    "finish_requested": int(os.environ.get("REAPER_TIMEOUT_FINISH_REQUESTED", "300")),
+    "processing": int(os.environ.get("REAPER_TIMEOUT_PROCESSING", "1200")),
+}
+# WAITING_USER sin heartbeat del worker durante este tiempo: la cadena de drenado murió
+REAPER_HEARTBEAT_STALE_SECONDS = int(os.environ.get("REAPER_HEARTBEAT_STALE_SECONDS", "90"))
+# Heartbeat de drenado mientras el usuario interactúa: periodo de cada ciclo y
+# cada cuánto se escribe last_heartbeat_at si el ciclo no capturó nada (margen
+# holgado frente a REAPER_HEARTBEAT_STALE_SECONDS)
+DRAIN_HEARTBEAT_INTERVAL_SECONDS = int(os.environ.get("DRAIN_HEARTBEAT_INTERVAL_SECONDS", "3"))
+DRAIN_HEARTBEAT_WRITE_SECONDS = int(
+    os.environ.get("DRAIN_HEARTBEAT_WRITE_SECONDS", str(REAPER_HEARTBEAT_STALE_SECONDS // 3))
+)
+# Edad mínima de una sesión del grid sin dueño antes de borrarla (margen de aprovisionamiento)
+REAPER_ORPHAN_MIN_AGE_SECONDS = int(os.environ.get("REAPER_ORPHAN_MIN_AGE_SECONDS", "300"))
+# Latido máximo de una sesión registrada por un pool antes de considerarla abandonada
+REAPER_POOL_STALE_SECONDS = int(os.environ.get("REAPER_POOL_STALE_SECONDS", "600"))
+
 # Configuración del Channel Layer (usando Redis)
 CHANNEL_LAYERS = {
     "default": {
@@ -97,12 +151,51 @@ CHANNEL_LAYERS = {
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=sqlite (por defecto) o postgresql. Con varios procesos escribiendo
+# (Daphne + workers de Celery) SQLite va en modo WAL con busy timeout; en
+# producción, PostgreSQL (requiere 'psycopg').
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get("DB_NAME", "webappdl"),
+            'USER': os.environ.get("DB_USER", "webappdl"),
+            'PASSWORD': os.environ.get("DB_PASSWORD", ""),
+            'HOST': os.environ.get("DB_HOST", "localhost"),
+            'PORT': os.environ.get("DB_PORT", "5432"),
+            # Conexiones persistentes (segundos; 0 = una por petición/tarea)
+            'CONN_MAX_AGE': int(os.environ.get("DB_CONN_MAX_AGE", "60")),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            # Backend sqlite3 de Django con PRAGMAs y BEGIN IMMEDIATE (core/backends/sqlite3)
+            'ENGINE': 'core.backends.sqlite3',
+            'NAME': os.environ.get("SQLITE_PATH", str(BASE_DIR / 'db.sqlite3')),
+            'OPTIONS': {
+                # Segundos esperando el cerrojo de escritura antes de "database is locked"
+                'timeout': float(os.environ.get("SQLITE_BUSY_TIMEOUT", "20")),
+            },
+        }
     }
+
+# PRAGMAs aplicados a cada conexión SQLite nueva
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),  # Lectores no bloquean al escritor
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),  # Seguro con WAL, sin fsync por commit
+    "busy_timeout": int(float(os.environ.get("SQLITE_BUSY_TIMEOUT", "20")) * 1000),
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", "-20000")),  # Negativo = KiB
+    "temp_store": "MEMORY",
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024))),
+    "wal_autocheckpoint": int(os.environ.get("SQLITE_WAL_AUTOCHECKPOINT", "1000")),
 }
+# Modo de BEGIN de transaction.atomic: IMMEDIATE toma el cerrojo de escritura al
+# empezar (espera busy_timeout en lugar de fallar al pasar de lectura a escritura)
+SQLITE_TRANSACTION_MODE = os.environ.get("SQLITE_TRANSACTION_MODE", "IMMEDIATE")
 
 
 # Password validation
@@ -136,6 +229,78 @@ USE_I18N = True
 USE_TZ = True
 
 SELENOID_URL = os.environ.get("SELENOID_URL", "http://selenoid:4444/wd/hub")
+# Hubs WebDriver entre los que se reparten las sesiones (separados por comas).
+# Por defecto solo SELENOID_URL; cada sesión guarda el suyo en Session.webdriver_url.
+WEBDRIVER_HUB_URLS = [
+    url.strip().rstrip("/") for url in os.environ.get("WEBDRIVER_HUB_URLS", SELENOID_URL).split(",") if url.strip()
+]
+# Segundos que se cachea el health check/capacidad (GET /status) de cada hub
+WEBDRIVER_HUB_STATUS_TTL = int(os.environ.get("WEBDRIVER_HUB_STATUS_TTL", "5"))
+
+# --- Pool de sesiones WebDriver precalentadas (por proceso worker) ---
+# Cada proceso del worker mantiene BROWSER_POOL_SIZE sesiones listas: cuenta con
+# que ocupan slots del grid (concurrencia del worker x tamaño del pool). 0 lo desactiva.
+BROWSER_POOL_SIZE = int(os.environ.get("BROWSER_POOL_SIZE", "1"))
+# Número de entregas tras las cuales una sesión se cierra y se reemplaza
+BROWSER_POOL_MAX_USES = int(os.environ.get("BROWSER_POOL_MAX_USES", "20"))
+# Edad máxima (segundos) de una sesión ociosa antes de reciclarla
+BROWSER_POOL_MAX_IDLE_SECONDS = int(os.environ.get("BROWSER_POOL_MAX_IDLE_SECONDS", "1800"))
+# Intervalo del health check de sesiones ociosas (también evita el timeout de inactividad del grid)
+BROWSER_POOL_HEALTH_CHECK_SECONDS = int(os.environ.get("BROWSER_POOL_HEALTH_CHECK_SECONDS", "60"))
+# Timeout de la carga inicial de la URL al aprovisionar; el soft_time_limit de la tarea deja margen por encima
+PROVISION_PAGE_LOAD_TIMEOUT_SECONDS = int(os.environ.get("PROVISION_PAGE_LOAD_TIMEOUT_SECONDS", "90"))
+
+# --- Cliente HTTP compartido hacia el hub WebDriver (BrowserController) ---
+WEBDRIVER_HTTP2 = os.environ.get("WEBDRIVER_HTTP2", "true").lower() == "true" # Solo si 'h2' está instalado
+WEBDRIVER_HTTP_MAX_CONNECTIONS = int(os.environ.get("WEBDRIVER_HTTP_MAX_CONNECTIONS", "100"))
+WEBDRIVER_HTTP_MAX_KEEPALIVE = int(os.environ.get("WEBDRIVER_HTTP_MAX_KEEPALIVE", "20"))
+WEBDRIVER_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("WEBDRIVER_HTTP_KEEPALIVE_EXPIRY", "30"))
+WEBDRIVER_HTTP_TIMEOUT = float(os.environ.get("WEBDRIVER_HTTP_TIMEOUT", "30"))
+WEBDRIVER_HTTP_CONNECT_TIMEOUT = float(os.environ.get("WEBDRIVER_HTTP_CONNECT_TIMEOUT", "5"))
+# Timeouts por comando W3C del BrowserController asíncrono
+WEBDRIVER_COMMAND_TIMEOUT = float(os.environ.get("WEBDRIVER_COMMAND_TIMEOUT", "30"))
+WEBDRIVER_PAGE_LOAD_TIMEOUT = float(os.environ.get("WEBDRIVER_PAGE_LOAD_TIMEOUT", "300"))
+
+# Máximo de peticiones de Google Analytics guardadas por sesión (las siguientes se cuentan como descartadas)
+NETWORK_HITS_MAX_BUFFER = int(os.environ.get("NETWORK_HITS_MAX_BUFFER", "5000"))
+
+# Streaming en vivo de DataLayers por WebSocket: ventana de agrupación y contrapresión
+LIVE_STREAM_FLUSH_MS = int(os.environ.get("LIVE_STREAM_FLUSH_MS", "200"))
+LIVE_STREAM_MAX_EVENTS_PER_FRAME = int(os.environ.get("LIVE_STREAM_MAX_EVENTS_PER_FRAME", "100"))
+LIVE_STREAM_MAX_BUFFER = int(os.environ.get("LIVE_STREAM_MAX_BUFFER", "500"))
+LIVE_STREAM_SLOW_SEND_MS = int(os.environ.get("LIVE_STREAM_SLOW_SEND_MS", "250"))
+
+# Reportes HTML: entorno Jinja2 compartido por proceso + caché de bytecode en disco.
+# El directorio se comparte entre procesos del worker (vacío = sin caché de bytecode).
+REPORT_TEMPLATE_BYTECODE_DIR = os.environ.get(
+    "REPORT_TEMPLATE_BYTECODE_DIR", os.path.join(tempfile.gettempdir(), "webappdl-jinja-cache")
+)
+# Volver a comprobar la plantilla en disco en cada render (útil solo en desarrollo)
+REPORT_TEMPLATE_AUTO_RELOAD = os.environ.get("REPORT_TEMPLATE_AUTO_RELOAD", str(DEBUG)).lower() == "true"
+# Tamaño (bytes) hasta el que el reporte renderizado se mantiene en memoria antes de pasar a un temporal en disco
+REPORT_SPOOL_MAX_BYTES = int(os.environ.get("REPORT_SPOOL_MAX_BYTES", str(5 * 1024 * 1024)))
+# Guardar el reporte HTML ya comprimido (.html.gz, y .html.br si 'brotli' está
+# instalado) y servirlo con Content-Encoding desde session_report_view
+REPORT_PRECOMPRESS = os.environ.get("REPORT_PRECOMPRESS", "True") == "True"
+REPORT_BROTLI_QUALITY = int(os.environ.get("REPORT_BROTLI_QUALITY", "5"))
+# A partir de cuántos detalles el reporte es un HTML ligero con los detalles en
+# shards JSON gzip cargados bajo demanda (0 = siempre el reporte completo)
+REPORT_LAZY_MIN_DETAILS = int(os.environ.get("REPORT_LAZY_MIN_DETAILS", "1000"))
+# Detalles por shard (= por página del visor del reporte lazy)
+REPORT_SHARD_SIZE = int(os.environ.get("REPORT_SHARD_SIZE", "250"))
+# Renderizar el reporte HTML en la primera petición (session_report_render_view),
+# cacheado en el storage por hash de resultados + versión de plantilla, en vez de
+# en la tarea de Celery antes de completar la sesión
+REPORT_RENDER_ON_DEMAND = os.environ.get("REPORT_RENDER_ON_DEMAND", "True") == "True"
+# El render bajo demanda corre en la cola CPU: la petición recibe 202 con este
+# Retry-After hasta que está listo, y el cerrojo (uno por render) caduca tras
+# el time_limit de la tarea por si el worker muere
+REPORT_RENDER_RETRY_AFTER_SECONDS = int(os.environ.get("REPORT_RENDER_RETRY_AFTER_SECONDS", "2"))
+REPORT_RENDER_LOCK_SECONDS = int(os.environ.get("REPORT_RENDER_LOCK_SECONDS", "400"))
+# Filas por lote al insertar (bulk_create) y leer CapturedEvent / ValidationDetail
+RESULT_STORE_BATCH_SIZE = int(os.environ.get("RESULT_STORE_BATCH_SIZE", "500"))
+# Filas leídas por bloque al exportar los detalles en NDJSON (session_details_export_view)
+DETAIL_EXPORT_CHUNK_SIZE = int(os.environ.get("DETAIL_EXPORT_CHUNK_SIZE", "500"))
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
@@ -173,4 +338,58 @@ CELERY_RESULT_SERIALIZER = "json"
 # Zona horaria para Celery (opcional pero recomendado)
 CELERY_TIMEZONE = TIME_ZONE  # Usa la misma TIME_ZONE de Django
 
+# --- Colas y enrutado ---
+# 'browser': tareas cortas de E/S contra el grid (workers de baja concurrencia).
+# 'cpu': validación y render de reportes (pool CPU, prefetch 1 para no acaparar).
+CELERY_TASK_DEFAULT_QUEUE = "default"
+CELERY_TASK_QUEUE_BROWSER = "browser"
+CELERY_TASK_QUEUE_CPU = "cpu"
+CELERY_TASK_ROUTES = {
+    # Prioridad en Redis: 0 es la más alta. El aprovisionamiento de usuarios nuevos
+    # y la finalización adelantan a los heartbeats periódicos.
+    "core.tasks.provision_browser_session": {"queue": CELERY_TASK_QUEUE_BROWSER, "priority": 0},
+    "core.tasks.finalize_browser_session": {"queue": CELERY_TASK_QUEUE_BROWSER, "priority": 0},
+    "core.tasks.drain_browser_session": {"queue": CELERY_TASK_QUEUE_BROWSER, "priority": 5},
+    "core.tasks.validate_session_results": {"queue": CELERY_TASK_QUEUE_CPU},
+    "core.tasks.render_session_report": {"queue": CELERY_TASK_QUEUE_CPU},
+    "core.tasks.render_report_on_demand": {"queue": CELERY_TASK_QUEUE_CPU},
+    "core.tasks.reap_orphaned_browser_sessions": {"queue": CELERY_TASK_DEFAULT_QUEUE},
+    "core.tasks.dispatch_queued_sessions": {"queue": CELERY_TASK_DEFAULT_QUEUE},
+}
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "priority_steps": list(range(10)),
+    "sep": ":",
+    "queue_order_strategy": "priority",
+}
+# Límites de tiempo por tarea (segundos): el soft lanza SoftTimeLimitExceeded, el hard mata el proceso
+CELERY_TASK_ANNOTATIONS = {
+    "core.tasks.provision_browser_session": {
+        "soft_time_limit": PROVISION_PAGE_LOAD_TIMEOUT_SECONDS + 60,
+        "time_limit": PROVISION_PAGE_LOAD_TIMEOUT_SECONDS + 90,
+    },
+    "core.tasks.drain_browser_session": {"soft_time_limit": 30, "time_limit": 45},
+    "core.tasks.finalize_browser_session": {"soft_time_limit": 60, "time_limit": 90},
+    "core.tasks.validate_session_results": {"soft_time_limit": 600, "time_limit": 660, "acks_late": True},
+    "core.tasks.render_session_report": {"soft_time_limit": 300, "time_limit": 360, "acks_late": True},
+    "core.tasks.render_report_on_demand": {"soft_time_limit": 300, "time_limit": 360},
+    "core.tasks.reap_orphaned_browser_sessions": {"soft_time_limit": 50, "time_limit": 60},
+    "core.tasks.dispatch_queued_sessions": {"soft_time_limit": 20, "time_limit": 30},
+}
+# Cada proceso reserva una sola tarea: evita que un render largo retenga otras en cola
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Tareas periódicas (servicio 'celery-beat' en docker-compose)
+CELERY_BEAT_SCHEDULE = {
+    "reap-orphaned-browser-sessions": {
+        "task": "core.tasks.reap_orphaned_browser_sessions",
+        "schedule": REAPER_INTERVAL_SECONDS,
+        "options": {"expires": REAPER_INTERVAL_SECONDS},
+    },
+    "dispatch-queued-sessions": {
+        "task": "core.tasks.dispatch_queued_sessions",
+        "schedule": ADMISSION_DISPATCH_INTERVAL_SECONDS,
+        "options": {"expires": ADMISSION_DISPATCH_INTERVAL_SECONDS},
+    },
+}
+
 # -------------------------------------------------------------------------- #